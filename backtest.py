@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import newfile as bot
+
+BACKTEST_REPORT_FILE = os.path.join(bot.GITHUB_WORKSPACE, "backtest_report.json")
+BACKTEST_FEE_PERCENT = 0.055  # Taker fee per side applied to backtested trades
+
+def strategy_params(**overrides):
+    """The live strategy constants as a dict, with optional overrides"""
+    params = {
+        'ema_fast_length': bot.ema_fast_length,
+        'ema_slow_length': bot.ema_slow_length,
+        'ema_trend_length': bot.ema_trend_length,
+        'h_bandwidth': bot.H_BANDWIDTH,
+        'multiplier': bot.MULTIPLIER,
+        'stop_loss_percent': bot.STOP_LOSS_PERCENT,
+        'take_profit_percent': bot.TAKE_PROFIT_PERCENT,
+    }
+    params.update(overrides)
+    return params
+
+def load_candle_file(path):
+    """Read stored OHLCV candles from a CSV or Parquet file, oldest first"""
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].copy()
+    if pd.api.types.is_numeric_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    else:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.sort_values('timestamp').reset_index(drop=True)
+
+def ema(values, span):
+    """EMA matching pandas ewm(span=span, adjust=False)"""
+    return bot.ema_into(values, span)
+
+def as_of_trend_ema(timestamps_ms, close, span, period_ms=3_600_000):
+    """Higher-timeframe EMA of each base bar as the live scan sees it after the bar closes
+
+    The running higher-timeframe candle is closed at the base bar's close,
+    the same value the live scan reads from the forming 1h candle, so no
+    later bars leak into the result. Bars the live scan leaves without a
+    value (see live_htf_index) are NaN.
+    """
+    rows = np.zeros((len(close), 6))
+    rows[:, 0] = timestamps_ms
+    rows[:, 4] = close
+    htf, bucket_index = bot.aggregate_candles(rows, period_ms, with_index=True)
+    last_in_bucket = np.concatenate((np.flatnonzero(bucket_index[1:] != bucket_index[:-1]), [len(close) - 1]))
+
+    htf_ema = ema(close[last_in_bucket], span)
+    prev_ema = np.concatenate(([np.nan], htf_ema[:-1]))[bucket_index]
+    alpha = 2 / (span + 1)
+    running = np.where(np.isnan(prev_ema), close, (1 - alpha) * prev_ema + alpha * close)
+    return bot.align_by_index(running, np.where(bot.live_htf_index(bucket_index) < 0, -1, np.arange(len(close))))
+
+def _backtest_bands(o, c, bar, params, nwe_cache=None):
+    """NWE bands on the last two closed bars as the monitor sees them after bar closes
+
+    Returns (upper_prev, upper_last, lower_prev, lower_last). With a cache,
+    the repaint envelope is stored per (bandwidth, bar) without the
+    multiplier so parameter sweeps only compute each window once.
+    """
+    src = c[bar + 2 - bot.limit:bar + 2].copy()
+    src[-1] = o[bar + 1]
+    if nwe_cache is None or not bot.REPAINT:
+        _, upper, lower = bot.calculate_nwe(src, params['h_bandwidth'], params['multiplier'], bot.REPAINT)
+        return upper[-3], upper[-2], lower[-3], lower[-2]
+
+    key = (params['h_bandwidth'], bar)
+    cached = nwe_cache.get(key)
+    if cached is None:
+        out, upper, _ = bot.calculate_nwe(src, params['h_bandwidth'], 1.0, True)
+        cached = (out[-3], out[-2], upper[-2] - out[-2])
+        nwe_cache[key] = cached
+    out_prev, out_last, mae = cached
+    mae = mae * params['multiplier']
+    return out_prev + mae, out_last + mae, out_prev - mae, out_last - mae
+
+def _simulate_trade(o, h, l, c, entry_bar, side, params, nwe_cache=None):
+    """Replay monitor_trade's exit rules from entry_bar, returning the trade"""
+    entry_price = o[entry_bar]
+    direction = 1 if side == "Buy" else -1
+    sl_price = entry_price * (1 - direction * params['stop_loss_percent'] / 100)
+    tp_price = entry_price * (1 + direction * params['take_profit_percent'] / 100)
+
+    def close_trade(bar, price, reason):
+        pnl_percent = direction * (price - entry_price) / entry_price * 100 - 2 * BACKTEST_FEE_PERCENT
+        return {'side': side, 'entry_bar': entry_bar, 'exit_bar': bar, 'entry_price': entry_price,
+                'exit_price': price, 'pnl_percent': pnl_percent, 'reason': reason}
+
+    for j in range(entry_bar, len(c) - 1):
+        # Exchange-side SL/TP orders fill inside the bar, stop first when both are hit
+        if (side == "Buy" and l[j] <= sl_price) or (side == "Sell" and h[j] >= sl_price):
+            return close_trade(j, sl_price, "Stop-loss triggered")
+        if (side == "Buy" and h[j] >= tp_price) or (side == "Sell" and l[j] <= tp_price):
+            return close_trade(j, tp_price, "Take-profit triggered")
+
+        # The monitor sees bar j closed and the next bar just opened
+        current_price = o[j + 1]
+        upper_prev, upper_last, lower_prev, lower_last = _backtest_bands(o, c, j, params, nwe_cache)
+        pnl_percent = direction * (current_price - entry_price) / entry_price * 100
+
+        if side == "Buy":
+            touched_band = ((c[j] >= upper_last) or (h[j] >= upper_last)) and \
+                           not ((c[j] > upper_last) and (o[j] > upper_last))
+            force_close = (c[j - 1] < upper_prev) and (c[j] > upper_last)
+        else:
+            touched_band = ((c[j] <= lower_last) or (l[j] <= lower_last)) and \
+                           not ((c[j] < lower_last) and (o[j] < lower_last))
+            force_close = (c[j - 1] > lower_prev) and (c[j] < lower_last)
+
+        if force_close:
+            return close_trade(j + 1, current_price, "Force close")
+        if pnl_percent >= 5 and touched_band:
+            return close_trade(j + 1, current_price, "Take profit (≥5% + band touch)")
+        if touched_band:
+            if pnl_percent > 0:
+                sl_price = entry_price * (1 + direction * 0.001)
+                continue
+            return close_trade(j + 1, current_price, "Closed at loss (band touch)")
+        if direction * (current_price - sl_price) <= 0:
+            return close_trade(j + 1, current_price, "Stop-loss triggered")
+        if direction * (current_price - tp_price) >= 0:
+            return close_trade(j + 1, current_price, "Take-profit triggered")
+
+    return close_trade(len(c) - 1, c[-1], "End of data")
+
+def _candle_arrays(df):
+    """Millisecond timestamps and open/high/low/close arrays of a candle DataFrame"""
+    timestamps = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    o, h, l, c = (df[col].to_numpy(dtype=float) for col in ('open', 'high', 'low', 'close'))
+    return timestamps, o, h, l, c
+
+def candle_rows(df):
+    """[timestamp ms, open, high, low, close, volume] rows of a candle DataFrame"""
+    timestamps = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return np.column_stack((timestamps, df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float)))
+
+def backtest_candles(df, params=None):
+    """Run the entry signals and exit rules over a 15m candle DataFrame"""
+    params = params or strategy_params()
+    timestamps, o, h, l, c = _candle_arrays(df)
+
+    # Signals for every bar in one vectorized pass
+    first_up, first_down = bot.entry_arrows(
+        c,
+        ema(c, params['ema_fast_length']),
+        ema(c, params['ema_slow_length']),
+        ema(c, params['ema_trend_length']),
+        as_of_trend_ema(timestamps, c, params['ema_trend_length'])
+    )
+    return simulate_trades(o, h, l, c, first_up, first_down, params)
+
+def simulate_trades(o, h, l, c, first_up, first_down, params, nwe_cache=None):
+    """Trade each entry arrow through the exit rules, one position at a time"""
+    # Entries need a full NWE window behind them
+    trades = []
+    next_free_bar = bot.limit
+    for bar in np.flatnonzero(first_up | first_down):
+        if bar < next_free_bar or bar + 1 >= len(c):
+            continue
+        trade = _simulate_trade(o, h, l, c, bar + 1, "Buy" if first_up[bar] else "Sell", params, nwe_cache)
+        trades.append(trade)
+        next_free_bar = trade['exit_bar'] + 1
+    return trades
+
+def summarize_trades(trades):
+    """PnL, hit rate and max drawdown of a list of trades"""
+    pnl_usdt = np.array([t['pnl_percent'] for t in trades]) / 100 * bot.TRADE_AMOUNT_USDT
+    equity = np.cumsum(pnl_usdt)
+    drawdown = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity
+    return {
+        'trades': len(trades),
+        'hit_rate': float(np.mean(pnl_usdt > 0)) if len(trades) else 0.0,
+        'pnl_usdt': float(equity[-1]) if len(trades) else 0.0,
+        'max_drawdown_usdt': float(drawdown.max()) if len(trades) else 0.0,
+    }
+
+def backtest_file(path, params=None):
+    """Backtest one stored candle file; runs in a worker process"""
+    symbol = os.path.splitext(os.path.basename(path))[0]
+    try:
+        result = summarize_trades(backtest_candles(load_candle_file(path), params))
+        result['symbol'] = symbol
+        return result
+    except Exception as e:
+        return {'symbol': symbol, 'error': str(e)}
+
+def run_backtest(data_dir, params=None, workers=None, report_path=BACKTEST_REPORT_FILE):
+    """Backtest every CSV/Parquet file in data_dir across a process pool"""
+    paths = sorted(
+        os.path.join(data_dir, name) for name in os.listdir(data_dir)
+        if name.endswith(('.csv', '.parquet'))
+    )
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(backtest_file, paths, [params] * len(paths)))
+
+    print(f"{'Symbol':<24}{'Trades':>8}{'Hit rate':>10}{'PnL USDT':>12}{'Max DD':>10}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['symbol']:<24}  error: {result['error']}")
+            continue
+        print(f"{result['symbol']:<24}{result['trades']:>8}{result['hit_rate']:>10.1%}"
+              f"{result['pnl_usdt']:>12.2f}{result['max_drawdown_usdt']:>10.2f}")
+
+    ok = [r for r in results if 'error' not in r]
+    total_trades = sum(r['trades'] for r in ok)
+    total_pnl = sum(r['pnl_usdt'] for r in ok)
+    print(f"\n{len(ok)}/{len(results)} symbols, {total_trades} trades, "
+          f"PnL {total_pnl:.2f} USDT in {time.time() - start:.1f}s")
+
+    with open(report_path, 'w') as f:
+        json.dump({'params': params or strategy_params(), 'results': results}, f, indent=2)
+    print(f"Report written to {report_path}")
+    return results
+
+# ======================== Main Execution ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the strategy over stored 15m candles")
+    parser.add_argument('data_dir', metavar='DIR', help="CSV/Parquet 15m candle files")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+    run_backtest(args.data_dir, workers=args.workers)
@@ -0,0 +1,333 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import ccxt
+import numpy as np
+import pandas as pd
+
+import backtest
+import newfile as bot
+
+BENCHMARK_REPORT_FILE = os.path.join(bot.GITHUB_WORKSPACE, "benchmark_report.json")
+
+# Benchmark suite scaling and the slowdown reported as a regression
+BENCHMARK_BARS = (500, 5000, 50000)
+BENCHMARK_SYMBOLS = (1, 10, 100, 500)
+BENCHMARK_REGRESSION_TOLERANCE = 0.25
+
+def _time_call(func, rounds):
+    """Best wall time in seconds of func() over the given rounds"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _synthetic_candles(n, timeframe, end=None, seed=0):
+    """Random-walk OHLCV rows whose last candle opens at or before end (epoch ms)"""
+    rng = np.random.default_rng(seed)
+    period = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    end = int(time.time() * 1000) if end is None else end
+    timestamps = (end // period - np.arange(n)[::-1]) * period
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.003, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.003, n))
+    volume = rng.uniform(10, 100, n)
+    return np.column_stack((timestamps, open_, high, low, close, volume)).tolist()
+
+def benchmark_nwe(n=bot.limit, rounds=100, reference=True):
+    """Compare the reference NWE loop with the kernel engine"""
+    rng = np.random.default_rng(0)
+    src = 100 + np.cumsum(rng.normal(0, 0.5, n + rounds))
+    window = src[:n]
+
+    loop_time = max_diff = None
+    if reference:
+        ref_out, ref_upper, ref_lower = bot._calculate_nwe_loop(window, bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+        out, upper, lower = bot.calculate_nwe(window, bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+        max_diff = float(max(np.max(np.abs(ref_out - out)),
+                             np.max(np.abs(ref_upper - upper)),
+                             np.max(np.abs(ref_lower - lower))))
+        loop_time = _time_call(lambda: bot._calculate_nwe_loop(window, bot.H_BANDWIDTH, bot.MULTIPLIER, True), 1)
+    kernel_time = _time_call(lambda: bot.calculate_nwe(window, bot.H_BANDWIDTH, bot.MULTIPLIER, True), rounds)
+
+    # Replay the stream: each new candle first ticks as forming, then closes
+    windows = []
+    for k in range(1, rounds):
+        ticked = src[k:k + n].copy()
+        ticked[-1] += 0.25
+        windows.extend([ticked, src[k:k + n]])
+    bot.calculate_nwe_incremental('bench', window, bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+    start = time.perf_counter()
+    for w in windows:
+        inc_out = bot.calculate_nwe_incremental('bench', w, bot.H_BANDWIDTH, bot.MULTIPLIER, True)[0]
+    incremental_time = (time.perf_counter() - start) / len(windows)
+    inc_diff = np.max(np.abs(inc_out - bot.calculate_nwe(windows[-1], bot.H_BANDWIDTH, bot.MULTIPLIER, True)[0]))
+    bot._nwe_state.pop('bench', None)
+
+    print(f"NWE repaint, {n} bars (incremental vs full diff: {inc_diff:.2e})")
+    if reference:
+        print(f"  loop:        {loop_time * 1000:10.3f} ms  (max abs diff vs kernel: {max_diff:.2e})")
+    print(f"  kernel:      {kernel_time * 1000:10.3f} ms  ({kernel_time / incremental_time:.1f}x incremental)")
+    print(f"  incremental: {incremental_time * 1000:10.3f} ms")
+    return {'bars': n, 'loop': loop_time, 'kernel': kernel_time, 'incremental': incremental_time,
+            'max_diff': max_diff, 'incremental_diff': float(inc_diff)}
+
+
+def benchmark_entry_arrows(n=bot.limit, rounds=100, trials=200):
+    """Check first_entry_arrows against the loop and compare their speed"""
+    rng = np.random.default_rng(1)
+    for _ in range(trials):
+        signal = rng.choice([-1, 0, 0, 0, 0, 1], size=n)
+        entry_up = rng.random(n) < 0.1
+        entry_down = rng.random(n) < 0.1
+        expected = bot._first_entry_arrows_loop(signal, entry_up, entry_down)
+        actual = bot.first_entry_arrows(signal, entry_up, entry_down)
+        if not (np.array_equal(expected[0], actual[0]) and np.array_equal(expected[1], actual[1])):
+            raise AssertionError("first_entry_arrows does not match the reference loop")
+
+    loop_time = _time_call(lambda: bot._first_entry_arrows_loop(signal, entry_up, entry_down), rounds)
+    vector_time = _time_call(lambda: bot.first_entry_arrows(signal, entry_up, entry_down), rounds)
+    print(f"Entry arrows, {n} bars (matches loop on {trials} random series)")
+    print(f"  loop:        {loop_time * 1000:10.3f} ms")
+    print(f"  vectorized:  {vector_time * 1000:10.3f} ms  ({loop_time / vector_time:,.0f}x)")
+    return {'bars': n, 'loop': loop_time, 'vectorized': vector_time}
+
+def benchmark_signal_row(n=bot.limit, rounds=50):
+    """Compare the DataFrame signal path with the array pipeline, time and peak memory"""
+    base = _synthetic_candles(n, '15m')
+    htf = _synthetic_candles(n, '1h', end=base[-1][0])
+
+    def peak_memory(func):
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    frames_time = _time_call(lambda: bot._entry_signal_frames(base, htf), rounds)
+    pipeline_time = _time_call(lambda: bot.entry_signal_row(base, htf), rounds)
+    frames_peak = peak_memory(lambda: bot._entry_signal_frames(base, htf))
+    pipeline_peak = peak_memory(lambda: bot.entry_signal_row(base, htf))
+    print(f"Signal row, {n} bars")
+    print(f"  frames:      {frames_time * 1000:10.3f} ms  {frames_peak / 1024:8.0f} KiB peak")
+    print(f"  pipeline:    {pipeline_time * 1000:10.3f} ms  {pipeline_peak / 1024:8.0f} KiB peak"
+          f"  ({frames_time / pipeline_time:.1f}x)")
+    return {'bars': n, 'frames': frames_time, 'pipeline': pipeline_time,
+            'frames_peak': frames_peak, 'pipeline_peak': pipeline_peak}
+
+_STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import newfile
+result = {'import': time.perf_counter() - start}
+if os.path.exists(newfile.MARKET_CACHE_FILE) and os.path.exists(newfile.INSTRUMENT_CACHE_FILE):
+    newfile.load_symbol_mapping()
+    result.update(ready=time.perf_counter() - start, symbols=len(newfile.symbols))
+print(json.dumps(result))
+"""
+
+def benchmark_startup(rounds=5):
+    """Import time of the bot in fresh interpreters, plus time to a mapped universe from warm caches"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(rounds):
+        output = subprocess.run([sys.executable, '-c', _STARTUP_PROBE], cwd=here, capture_output=True,
+                                text=True, timeout=120, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    timings = {}
+    for stage in ('import', 'ready'):
+        times = [run[stage] for run in runs if stage in run]
+        if times:
+            timings[stage] = {'best': min(times), 'median': float(np.median(times)), 'rounds': len(times)}
+    print(f"Startup over {rounds} fresh interpreters")
+    for stage, timing in timings.items():
+        print(f"  {stage + ':':12s} {timing['best'] * 1000:10.3f} ms best  {timing['median'] * 1000:10.3f} ms median")
+    if 'ready' not in timings:
+        print("  (no market/instrument caches in the workspace, ready time skipped)")
+    return {'symbols': runs[-1].get('symbols', 0), **timings}
+
+def benchmark_batch_signals(n_symbols=500, n=bot.limit, rounds=3):
+    """Compare per-symbol entry_signal_row calls with one entry_signal_rows batch"""
+    end = int(time.time() * 1000)
+    # Float arrays, as get_signal_candles hands them to the scan
+    bases = [np.asarray(_synthetic_candles(n, '15m', end=end, seed=k), dtype=float) for k in range(n_symbols)]
+    htfs = [np.asarray(_synthetic_candles(n, '1h', end=end, seed=n_symbols + k), dtype=float)
+            for k in range(n_symbols)]
+
+    single_time = _time_call(lambda: [bot.entry_signal_row(b, h) for b, h in zip(bases, htfs)], rounds)
+    batch_time = _time_call(lambda: bot.entry_signal_rows(bases, htfs), rounds)
+    print(f"Signals for {n_symbols} symbols, {n} bars")
+    print(f"  per symbol:  {single_time * 1000:10.3f} ms")
+    print(f"  batched:     {batch_time * 1000:10.3f} ms  ({single_time / batch_time:.1f}x)")
+    return {'symbols': n_symbols, 'bars': n, 'single': single_time, 'batch': batch_time}
+
+def _measure(func, rounds=20, budget=1.0):
+    """Best and median wall time of func(), stopping after rounds calls or budget seconds"""
+    times = []
+    deadline = time.perf_counter() + budget
+    while len(times) < rounds and (not times or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'median': float(np.median(times)), 'rounds': len(times)}
+
+def _benchmark_fixtures(data_dir=None, bars=max(BENCHMARK_BARS)):
+    """Named 15m candle arrays: a synthetic walk and every recorded file in data_dir"""
+    fixtures = [('synthetic', np.asarray(_synthetic_candles(bars, '15m'), dtype=float))]
+    if data_dir:
+        for name in sorted(os.listdir(data_dir)):
+            if name.endswith(('.csv', '.parquet')):
+                rows = backtest.candle_rows(backtest.load_candle_file(os.path.join(data_dir, name)))
+                fixtures.append((f"recorded:{os.path.splitext(name)[0]}", rows[-bars:]))
+    return fixtures
+
+def _bar_cases(base):
+    """Hot-path callables over one 15m series (and its 1h candles)"""
+    htf = bot.aggregate_candles(base, 3_600_000)
+    close = np.ascontiguousarray(base[:, 4])
+    df = pd.DataFrame(base, columns=bot.OHLCV_COLUMNS)
+    entry, side = close[-1], "Buy"
+
+    # Forming-candle ticks for the incremental engine and the monitor
+    ticks = [base.copy(), base.copy()]
+    ticks[0][-1, 4] *= 1.0005
+    ticks[1][-1, 4] *= 0.9995
+    ticked = ticks[0]
+    turn = itertools.cycle((0, 1))
+    bot.calculate_nwe_incremental('bench', close, bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+
+    def nwe_incremental():
+        bot.calculate_nwe_incremental('bench', ticked[:, 4], bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+        bot.calculate_nwe_incremental('bench', close, bot.H_BANDWIDTH, bot.MULTIPLIER, True)
+
+    def monitor():
+        # Alternate the ticks, an unchanged candle would skip the NWE update
+        candles = ticks[next(turn)]
+        bot.evaluate_exit('bench-monitor', candles, candles[-1, 4], entry, entry * 0.9, entry * 1.1, side)
+
+    return {
+        'nwe.repaint': lambda: bot.calculate_nwe(close, bot.H_BANDWIDTH, bot.MULTIPLIER, True),
+        'nwe.non_repaint': lambda: bot.calculate_nwe(close, bot.H_BANDWIDTH, bot.MULTIPLIER, False),
+        'nwe.repaint_incremental': nwe_incremental,
+        'atr': lambda: bot.calculate_atr(df),
+        'signal': lambda: bot.entry_signal_row(base, htf),
+        'monitor': monitor
+    }
+
+def run_benchmarks(data_dir=None, bars=BENCHMARK_BARS, symbol_counts=BENCHMARK_SYMBOLS,
+                   report_path=BENCHMARK_REPORT_FILE, baseline=None):
+    """Time the signal and monitoring hot paths and write the results as JSON
+
+    Every case runs on a synthetic walk and, with data_dir, on each recorded
+    15m file there (newest bars). Cases scale over bar counts; signal
+    generation also over symbol counts, per symbol and batched. `monitor` is
+    the compute part of one monitor_trade pass (NWE update and exit checks)
+    on a forming-candle tick; its requests are timed live by the monitor.*
+    stages. With baseline, cases slower than the baseline report by more
+    than BENCHMARK_REGRESSION_TOLERANCE are listed and returned.
+    """
+    fixtures = _benchmark_fixtures(data_dir, max(bars))
+    results = []
+
+    def record(case, fixture, n_bars, n_symbols, timing):
+        results.append({'case': case, 'fixture': fixture, 'bars': n_bars, 'symbols': n_symbols, **timing})
+        print(f"  {case:26s} {fixture:24s} {n_bars:>6} bars {n_symbols:>4} sym  "
+              f"{timing['best'] * 1000:10.3f} ms best  {timing['median'] * 1000:10.3f} ms median")
+
+    print("Bar scaling")
+    for name, rows in fixtures:
+        for n in bars:
+            if len(rows) < n:
+                continue
+            for case, func in _bar_cases(rows[-n:]).items():
+                record(case, name, n, 1, _measure(func))
+    bot._nwe_state.pop('bench', None)
+    bot._nwe_state.pop('bench-monitor', None)
+
+    print("Symbol scaling")
+    for name, rows in fixtures[:1] + ([('recorded', None)] if len(fixtures) > 1 else []):
+        for count in symbol_counts:
+            if rows is None:
+                # Recorded symbols cycle through the files, each pass further back in time
+                recorded = [r for _, r in fixtures[1:]]
+                series = [recorded[k % len(recorded)] for k in range(count)]
+                series = [r[:len(r) - (k // len(recorded)) * 97][-bot.limit:] for k, r in enumerate(series)]
+            else:
+                series = [np.asarray(_synthetic_candles(bot.limit, '15m', seed=k), dtype=float) for k in range(count)]
+            bases = series
+            htfs = [bot.aggregate_candles(r, 3_600_000) for r in series]
+            record('signal.per_symbol', name, bot.limit, count,
+                   _measure(lambda: [bot.entry_signal_row(b, h) for b, h in zip(bases, htfs)], rounds=5))
+            record('signal.batch', name, bot.limit, count, _measure(lambda: bot.entry_signal_rows(bases, htfs), rounds=5))
+
+    print("Startup")
+    startup = benchmark_startup()
+    for stage in ('import', 'ready'):
+        if stage in startup:
+            record(f"startup.{stage}", 'workspace', 0, startup['symbols'] if stage == 'ready' else 0, startup[stage])
+
+    report = {
+        'created': pd.Timestamp.now(tz='UTC').isoformat(),
+        'commit': _git_commit(),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'results': results
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+    return compare_benchmarks(baseline, report) if baseline else report
+
+def _git_commit():
+    """Current commit hash of the bot's checkout, if it is one"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare_benchmarks(baseline, report, tolerance=BENCHMARK_REGRESSION_TOLERANCE):
+    """Cases whose best time grew by more than tolerance against a baseline report (path or dict)"""
+    if isinstance(baseline, str):
+        with open(baseline) as f:
+            baseline = json.load(f)
+    key = lambda r: (r['case'], r['fixture'], r['bars'], r['symbols'])
+    before = {key(r): r['best'] for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = before.get(key(result))
+        if old and result['best'] > old * (1 + tolerance):
+            regressions.append({**result, 'baseline': old, 'ratio': result['best'] / old})
+    print(f"{len(regressions)} regressions against {baseline.get('commit') or 'baseline'}")
+    for r in regressions:
+        print(f"  {r['case']} {r['fixture']} {r['bars']} bars {r['symbols']} sym: "
+              f"{r['baseline'] * 1000:.3f} -> {r['best'] * 1000:.3f} ms ({r['ratio']:.2f}x)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the bot's signal and monitoring hot paths")
+    parser.add_argument('--suite', action='store_true', help="run the benchmark suite and write a JSON report")
+    parser.add_argument('--data', metavar='DIR', help="recorded 15m candle files for --suite")
+    parser.add_argument('--baseline', metavar='FILE', help="earlier benchmark report to check for regressions")
+    args = parser.parse_args()
+
+    if args.suite:
+        regressions = run_benchmarks(args.data, baseline=args.baseline)
+        sys.exit(1 if args.baseline and regressions else 0)
+
+    benchmark_nwe()
+    benchmark_nwe(n=5000, reference=False)
+    benchmark_entry_arrows()
+    benchmark_signal_row()
+    benchmark_batch_signals()
+    benchmark_startup()
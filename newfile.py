@@ -1,19 +1,71 @@
-import ccxt
-import pandas as pd
 import numpy as np
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from pybit.unified_trading import HTTP
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+import importlib
 import time
 import os
+import sys
 import subprocess
 from dotenv import load_dotenv
 import json
+import sqlite3
+from collections import deque
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_FLOOR
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import itertools
+import random
+import heapq
+import copy
+import contextlib
+import http.server
 
 # Load environment variables
 load_dotenv()
 
+class LazyModule:
+    """Module stand-in that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# Heavy modules are only imported by the runs that use them
+ccxt = LazyModule('ccxt')
+pd = LazyModule('pandas')
+requests = LazyModule('requests')
+pybit_http = LazyModule('pybit.unified_trading')
+
+class LazyClient:
+    """Client stand-in that builds the real client on first use"""
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_client', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    object.__setattr__(self, '_client', self._factory())
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
 # ======================== Configuration ========================
 # Constants
 # Constants (GitHub Actions compatible)
@@ -21,543 +73,114 @@ load_dotenv()
 GITHUB_WORKSPACE = os.getenv('GITHUB_WORKSPACE', os.path.dirname(os.path.abspath(__file__)))
 TRADE_FILE = os.path.join(GITHUB_WORKSPACE, "active_trade.json")
 TRADE_STATE_FILE = os.path.join(GITHUB_WORKSPACE, "trade_state.txt")
+STATE_DB_FILE = os.path.join(GITHUB_WORKSPACE, "bot_state.db")  # Replaces TRADE_FILE and TRADE_STATE_FILE
+INSTRUMENT_CACHE_FILE = os.path.join(GITHUB_WORKSPACE, "instruments.json")
+MARKET_CACHE_FILE = os.path.join(GITHUB_WORKSPACE, "markets.json")
+SYMBOL_MAPPING_FILE = os.path.join(GITHUB_WORKSPACE, "symbol_mapping.json")  # Last good mapping, used if resolving fails
+INDICATOR_STATE_FILE = os.path.join(GITHUB_WORKSPACE, "indicator_state.json")
+WARM_STATE_FILE = os.path.join(GITHUB_WORKSPACE, "warm_state.npz")  # Caches carried between --once runs
 ALERT_PATH = os.path.join(GITHUB_WORKSPACE, "alert.mp3") if os.path.exists(os.path.join(GITHUB_WORKSPACE, "alert.mp3")) else None
-SCAN_INTERVAL = 600  # 15 minutes in seconds
+CANDLE_SETTLE_DELAY = float(os.getenv('CANDLE_SETTLE_DELAY', '2'))  # Seconds after a candle close before scanning
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', '16'))  # Concurrent symbol checks per scan
+SCAN_BURST = int(os.getenv('SCAN_BURST', '5'))  # Requests allowed above the exchange rate limit
+BITGET_RATE_LIMIT = 20  # Requests/s, ccxt's bitget rateLimit of 50 ms
+BYBIT_RATE_LIMIT = 120  # Requests/s per IP (600 per 5 s)
+BYBIT_ENDPOINT_RATES = {'place_order': 10, 'set_trading_stop': 10, 'get_positions': 50}  # Per-UID limits, requests/s
+REQUEST_RETRIES = 4  # Retries of transient errors on idempotent endpoints
+RETRYABLE_HTTP_STATUSES = (403, 408, 409, 429)  # Besides 5xx; 403 is Bybit's IP rate limit, 409 an undecodable reply
+REQUEST_BACKOFF_BASE = 0.5  # Seconds, doubled per retry with full jitter
+REQUEST_BACKOFF_MAX = 30
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive transient failures before an exchange is cut off
+CIRCUIT_COOLDOWN = 30  # Seconds before a tripped exchange is probed again
+MONITOR_ERROR_DELAY_MAX = 300  # Longest wait between monitor passes that keep failing
+CANDLE_CACHE_SIZE = int(os.getenv('CANDLE_CACHE_SIZE', '1000'))  # Candles kept per (symbol, timeframe)
+CANDLE_CACHE_FILE = os.getenv('CANDLE_CACHE_FILE', os.path.join(GITHUB_WORKSPACE, "candle_cache.npz"))
+PERSIST_CANDLES = os.getenv('PERSIST_CANDLES', '1') == '1'
+INCREMENTAL_INDICATORS = os.getenv('INCREMENTAL_INDICATORS', '0') == '1'  # Scan from per-symbol running EMA state
+# Update the monitor's NWE from its previous pass; only pays off on windows well above the live 500 bars
+INCREMENTAL_NWE = os.getenv('INCREMENTAL_NWE', '0') == '1'
+CANDLE_SYNC_LIMIT = 200  # Max candles fetched when catching a cached series up
+OHLCV_PAGE_LIMIT = int(os.getenv('OHLCV_PAGE_LIMIT', '1000'))  # Most candles the scan exchange returns per request
+USE_STREAMING = os.getenv('USE_STREAMING', '0') == '1'  # Monitor trades from Bybit WebSocket data
+STREAM_STALE_SECONDS = 10  # Fall back to REST when ticker data is older than this
+KLINE_STALE_SECONDS = 60  # Same for klines, which Bybit pushes every 1-60s
+STREAM_WAIT_SECONDS = 1  # Longest a monitor waits for a stream update before re-checking
+MONITOR_POLL_SECONDS = float(os.getenv('MONITOR_POLL_SECONDS', '10'))  # Seconds between REST monitor passes
+REENTRY_CHECK_SECONDS = 30  # Seconds between status checks of a pending re-entry order
+INSTRUMENT_CACHE_TTL = 24 * 3600  # Seconds before cached instrument info must be re-fetched
+INSTRUMENT_REFRESH_SECONDS = 3600  # Background refresh interval for instrument info
+MARKET_CACHE_TTL = 24 * 3600  # Seconds before the cached scan exchange markets are re-downloaded
+# Seconds a bulk Bybit snapshot is served from memory before it is re-fetched
+SNAPSHOT_TTL = {'tickers': 1.0, 'positions': 1.0, 'instruments': INSTRUMENT_CACHE_TTL}
+UNIVERSE_SIZE = int(os.getenv('UNIVERSE_SIZE', '50'))  # Symbols passed on to each scan, 0 scans every mapped symbol
+UNIVERSE_REFRESH_SECONDS = int(os.getenv('UNIVERSE_REFRESH_SECONDS', '3600'))  # Seconds between universe re-rankings
+UNIVERSE_MIN_TURNOVER = float(os.getenv('UNIVERSE_MIN_TURNOVER', '1000000'))  # Minimum 24h turnover in USDT
+UNIVERSE_MAX_SPREAD = 0.002  # Widest bid/ask spread as a fraction of the mid price
+UNIVERSE_MIN_VOLATILITY = 0.01  # 24h high-low range as a fraction of price
+UNIVERSE_MAX_VOLATILITY = 0.5
+UNIVERSE_WEIGHTS = {'turnover': 0.5, 'spread': 0.25, 'volatility': 0.25}
+PRUNE_SCANS = os.getenv('PRUNE_SCANS', '0') == '1'  # Skip symbols far from EMA_Fast; heuristic, can miss entries
+PRUNE_VERIFY = os.getenv('PRUNE_VERIFY', '0') == '1'  # Evaluate skipped symbols too and report missed signals
+PRUNE_ATR_MULTIPLE = float(os.getenv('PRUNE_ATR_MULTIPLE', '3'))  # Close-to-close move in ATRs assumed not to happen
+PRUNE_MAX_BARS = 8  # Bars a skipped symbol may go without a full evaluation
+METRICS_WINDOW = 2048  # Latest samples kept per stage/endpoint for percentiles
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Serve Prometheus text on /metrics when set
+METRICS_REPORT_SECONDS = int(os.getenv('METRICS_REPORT_SECONDS', '3600'))  # Interval between timing summaries
 
 
 # Email Configuration
 sender = os.getenv('EMAIL_SENDER')
 recipients = os.getenv('EMAIL_RECIPIENTS', '').split(',')
 password = os.getenv('EMAIL_PASSWORD')
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USE_TLS = os.getenv('EMAIL_USE_TLS', '1') == '1'
+EMAIL_QUEUE_SIZE = 200  # Pending emails before new ones are dropped
+EMAIL_BATCH_WINDOW = 5  # Seconds between deliveries; emails queued meanwhile are batched
+EMAIL_DIGEST_THRESHOLD = 3  # Batches larger than this go out as one digest email
+SMTP_IDLE_TIMEOUT = int(os.getenv('SMTP_IDLE_TIMEOUT', '240'))  # Seconds an unused SMTP connection is kept open
 
 # Bybit API Configuration
-session = HTTP(
-    api_key=os.getenv('BYBIT_API_KEY'),
-    api_secret=os.getenv('BYBIT_API_SECRET'),
-    demo=True
-)
+def _create_session():
+    client = pybit_http.HTTP(
+        api_key=os.getenv('BYBIT_API_KEY'),
+        api_secret=os.getenv('BYBIT_API_SECRET'),
+        demo=True,
+        max_retries=1  # A single attempt per call, bybit_scheduler does the retrying
+    )
+    # Let rate limit and recv_window errors reach bybit_scheduler instead of pybit sleeping on them
+    client.retry_codes = set()
+    instrument_client(client, "bybit", BYBIT_ENDPOINTS)
+    schedule_client(client, bybit_scheduler, BYBIT_ENDPOINTS)
+    return client
+
+session = LazyClient(_create_session)
 
 
 
 # Initialize the exchange
-exchange = ccxt.bitget()
+def _create_exchange():
+    client = ccxt.bitget()
+    # Throttling is done by the shared RateLimiter so concurrent scans stay within limits
+    client.enableRateLimit = False
+    if _market_cache['markets']:
+        client.set_markets(_market_cache['markets'])
+    instrument_client(client, client.id, SCAN_ENDPOINTS)
+    schedule_client(client, bitget_scheduler, ['fetch_ohlcv'])
+    return client
+
+exchange = LazyClient(_create_exchange)
 
 # Symbol mapping
-symbol_mapping = {
-    '1000000MOG/USDT:USDT': '1000000MOGUSDT',
-    '10000ELON/USDT:USDT': '10000ELONUSDT',
-    '10000WHY/USDT:USDT': '10000WHYUSDT',
-    '1000BONK/USDC:USDC': '1000BONKUSDC:USDC',
-    '1000BONK/USDT:USDT': '1000BONKUSDT',
-    '1000CAT/USDT:USDT': '1000CATUSDT',
-    '1000RATS/USDT:USDT': '1000RATSUSDT',
-    '1000SATS/USDT:USDT': '1000SATSUSDT',
-    '1000XEC/USDT:USDT': '1000XECUSDT',
-    '1INCH/USDT:USDT': '1INCHUSDT',
-    '1MBABYDOGE/USDT:USDT': '1MBABYDOGEUSDT',
-    '1MCHEEMS/USDT:USDT': '1MCHEEMSUSDT',
-    'AAVE/USDC:USDC': 'AAVEUSDC:USDC',
-    'AAVE/USDT:USDT': 'AAVEUSDT',
-    'ACE/USDT:USDT': 'ACEUSDT',
-    'ACH/USDT:USDT': 'ACHUSDT',
-    'ACT/USDC:USDC': 'ACTUSDC:USDC',
-    'ACT/USDT:USDT': 'ACTUSDT',
-    'ACX/USDT:USDT': 'ACXUSDT',
-    'ADA/USD:ADA': 'ADAUSD:ADA',
-    'ADA/USDC:USDC': 'ADAUSDC:USDC',
-    'ADA/USDT:USDT': 'ADAUSDT',
-    'AERO/USDT:USDT': 'AEROUSDT',
-    'AEVO/USDC:USDC': 'AEVOUSDC:USDC',
-    'AEVO/USDT:USDT': 'AEVOUSDT',
-    'AGI/USDT:USDT': 'AGIUSDT',
-    'AGLD/USDT:USDT': 'AGLDUSDT',
-    'AI/USDT:USDT': 'AIUSDT',
-    'AI16Z/USDT:USDT': 'AI16ZUSDT',
-    'AIOZ/USDT:USDT': 'AIOZUSDT',
-    'AIXBT/USDT:USDT': 'AIXBTUSDT',
-    'AKT/USDT:USDT': 'AKTUSDT',
-    'ALCH/USDT:USDT': 'ALCHUSDT',
-    'ALGO/USDC:USDC': 'ALGOUSDC:USDC',
-    'ALGO/USDT:USDT': 'ALGOUSDT',
-    'ALICE/USDT:USDT': 'ALICEUSDT',
-    'ALPACA/USDT:USDT': 'ALPACAUSDT',
-    'ALPHA/USDT:USDT': 'ALPHAUSDT',
-    'ALT/USDT:USDT': 'ALTUSDT',
-    'AMP/USDT:USDT': 'AMPUSDT',
-    'ANIME/USDT:USDT': 'ANIMEUSDT',
-    'ANKR/USDT:USDT': 'ANKRUSDT',
-    'APE/USDT:USDT': 'APEUSDT',
-    'API3/USDT:USDT': 'API3USDT',
-    'APT/USDC:USDC': 'APTUSDC:USDC',
-    'APT/USDT:USDT': 'APTUSDT',
-    'AR/USDT:USDT': 'ARUSDT',
-    'ARB/USDC:USDC': 'ARBUSDC:USDC',
-    'ARB/USDT:USDT': 'ARBUSDT',
-    'ARC/USDT:USDT': 'ARCUSDT',
-    'ARK/USDT:USDT': 'ARKUSDT',
-    'ARKM/USDT:USDT': 'ARKMUSDT',
-    'ARPA/USDT:USDT': 'ARPAUSDT',
-    'ASTR/USDT:USDT': 'ASTRUSDT',
-    'ATA/USDT:USDT': 'ATAUSDT',
-    'ATH/USDT:USDT': 'ATHUSDT',
-    'ATOM/USDT:USDT': 'ATOMUSDT',
-    'AUCTION/USDT:USDT': 'AUCTIONUSDT',
-    'AUDIO/USDT:USDT': 'AUDIOUSDT',
-    'AVA/USDT:USDT': 'AVAUSDT',
-    'AVAAI/USDT:USDT': 'AVAAIUSDT',
-    'AVAIL/USDT:USDT': 'AVAILUSDT',
-    'AVAX/USDC:USDC': 'AVAXUSDC:USDC',
-    'AVAX/USDT:USDT': 'AVAXUSDT',
-    'AVL/USDT:USDT': 'AVLUSDT',
-    'AXL/USDT:USDT': 'AXLUSDT',
-    'AXS/USDT:USDT': 'AXSUSDT',
-    'B3/USDT:USDT': 'B3USDT',
-    'BAKE/USDT:USDT': 'BAKEUSDT',
-    'BAN/USDT:USDT': 'BANUSDT',
-    'BANANA/USDT:USDT': 'BANANAUSDT',
-    'BANANAS31/USDT:USDT': 'BANANAS31USDT',
-    'BAND/USDT:USDT': 'BANDUSDT',
-    'BAT/USDT:USDT': 'BATUSDT',
-    'BB/USDT:USDT': 'BBUSDT',
-    'BCH/USDC:USDC': 'BCHUSDC:USDC',
-    'BCH/USDT:USDT': 'BCHUSDT',
-    'BEAM/USDT:USDT': 'BEAMUSDT',
-    'BEL/USDT:USDT': 'BELUSDT',
-    'BERA/USDC:USDC': 'BERAUSDC:USDC',
-    'BERA/USDT:USDT': 'BERAUSDT',
-    'BGB/USDT:USDT': 'BGBUSDT',
-    'BGSC/USDT:USDT': 'BGSCUSDT',
-    'BICO/USDT:USDT': 'BICOUSDT',
-    'BID/USDT:USDT': 'BIDUSDT',
-    'BIGTIME/USDT:USDT': 'BIGTIMEUSDT',
-    'BIO/USDT:USDT': 'BIOUSDT',
-    'BLAST/USDT:USDT': 'BLASTUSDT',
-    'BLUR/USDT:USDT': 'BLURUSDT',
-    'BMT/USDT:USDT': 'BMTUSDT',
-    'BNB/USDC:USDC': 'BNBUSDC:USDC',
-    'BNB/USDT:USDT': 'BNBUSDT',
-    'BNT/USDT:USDT': 'BNTUSDT',
-    'BOME/USDC:USDC': 'BOMEUSDC:USDC',
-    'BOME/USDT:USDT': 'BOMEUSDT',
-    'BR/USDT:USDT': 'BRUSDT',
-    'BRETT/USDT:USDT': 'BRETTUSDT',
-    'BROCCOLI/USDT:USDT': 'BROCCOLIUSDT',
-    'BROCCOLIF3B/USDT:USDT': 'BROCCOLIF3BUSDT',
-    'BSV/USDT:USDT': 'BSVUSDT',
-    'BSW/USDT:USDT': 'BSWUSDT',
-    'BTC/USD:BTC': 'BTCUSD:BTC',
-    'BTC/USDC:USDC': 'BTCUSDC:USDC',
-    'BTC/USDT:USDT': 'BTCUSDT',
-    'C98/USDT:USDT': 'C98USDT',
-    'CAKE/USDT:USDT': 'CAKEUSDT',
-    'CARV/USDT:USDT': 'CARVUSDT',
-    'CATI/USDC:USDC': 'CATIUSDC:USDC',
-    'CATI/USDT:USDT': 'CATIUSDT',
-    'CELO/USDT:USDT': 'CELOUSDT',
-    'CELR/USDT:USDT': 'CELRUSDT',
-    'CETUS/USDT:USDT': 'CETUSUSDT',
-    'CFX/USDT:USDT': 'CFXUSDT',
-    'CGPT/USDT:USDT': 'CGPTUSDT',
-    'CHESS/USDT:USDT': 'CHESSUSDT',
-    'CHILLGUY/USDT:USDT': 'CHILLGUYUSDT',
-    'CHR/USDT:USDT': 'CHRUSDT',
-    'CHZ/USDT:USDT': 'CHZUSDT',
-    'CKB/USDT:USDT': 'CKBUSDT',
-    'CLOUD/USDT:USDT': 'CLOUDUSDT',
-    'COMP/USDT:USDT': 'COMPUSDT',
-    'COOKIE/USDT:USDT': 'COOKIEUSDT',
-    'CORE/USDT:USDT': 'COREUSDT',
-    'COS/USDT:USDT': 'COSUSDT',
-    'COTI/USDT:USDT': 'COTIUSDT',
-    'COW/USDT:USDT': 'COWUSDT',
-    'CRO/USDT:USDT': 'CROUSDT',
-    'CRV/USDC:USDC': 'CRVUSDC:USDC',
-    'CRV/USDT:USDT': 'CRVUSDT',
-    'CTC/USDT:USDT': 'CTCUSDT',
-    'CTSI/USDT:USDT': 'CTSIUSDT',
-    'CVC/USDT:USDT': 'CVCUSDT',
-    'CVX/USDT:USDT': 'CVXUSDT',
-    'CYBER/USDT:USDT': 'CYBERUSDT',
-    'DBR/USDT:USDT': 'DBRUSDT',
-    'DEEP/USDT:USDT': 'DEEPUSDT',
-    'DENT/USDT:USDT': 'DENTUSDT',
-    'DEXE/USDT:USDT': 'DEXEUSDT',
-    'DF/USDT:USDT': 'DFUSDT',
-    'DIA/USDT:USDT': 'DIAUSDT',
-    'DOG/USDT:USDT': 'DOGUSDT',
-    'DOGE/USD:DOGE': 'DOGEUSD:DOGE',
-    'DOGE/USDC:USDC': 'DOGEUSDC:USDC',
-    'DOGE/USDT:USDT': 'DOGEUSDT',
-    'DOGS/USDT:USDT': 'DOGSUSDT',
-    'DOT/USD:DOT': 'DOTUSD:DOT',
-    'DOT/USDC:USDC': 'DOTUSDC:USDC',
-    'DOT/USDT:USDT': 'DOTUSDT',
-    'DRIFT/USDT:USDT': 'DRIFTUSDT',
-    'DUCK/USDT:USDT': 'DUCKUSDT',
-    'DYDX/USDT:USDT': 'DYDXUSDT',
-    'DYM/USDT:USDT': 'DYMUSDT',
-    'DegenReborn/USDT:USDT': 'DegenRebornUSDT',
-    'EGLD/USDT:USDT': 'EGLDUSDT',
-    'EIGEN/USDC:USDC': 'EIGENUSDC:USDC',
-    'EIGEN/USDT:USDT': 'EIGENUSDT',
-    'ELX/USDT:USDT': 'ELXUSDT',
-    'ENA/USDC:USDC': 'ENAUSDC:USDC',
-    'ENA/USDT:USDT': 'ENAUSDT',
-    'ENJ/USDT:USDT': 'ENJUSDT',
-    'ENS/USDC:USDC': 'ENSUSDC:USDC',
-    'ENS/USDT:USDT': 'ENSUSDT',
-    'EOS/USD:EOS': 'EOSUSD:EOS',
-    'EOS/USDT:USDT': 'EOSUSDT',
-    'EPIC/USDT:USDT': 'EPICUSDT',
-    'ETC/USDC:USDC': 'ETCUSDC:USDC',
-    'ETC/USDT:USDT': 'ETCUSDT',
-    'ETH/USD:ETH': 'ETHUSD:ETH',
-    'ETH/USDC:USDC': 'ETHUSDC:USDC',
-    'ETH/USDT:USDT': 'ETHUSDT',
-    'ETHFI/USDC:USDC': 'ETHFIUSDC:USDC',
-    'ETHFI/USDT:USDT': 'ETHFIUSDT',
-    'ETHW/USDT:USDT': 'ETHWUSDT',
-    'FARTCOIN/USDC:USDC': 'FARTCOINUSDC:USDC',
-    'FARTCOIN/USDT:USDT': 'FARTCOINUSDT',
-    'FET/USDT:USDT': 'FETUSDT',
-    'FIDA/USDT:USDT': 'FIDAUSDT',
-    'FIL/USDC:USDC': 'FILUSDC:USDC',
-    'FIL/USDT:USDT': 'FILUSDT',
-    'FIO/USDT:USDT': 'FIOUSDT',
-    'FLM/USDT:USDT': 'FLMUSDT',
-    'FLOKI/USDT:USDT': 'FLOKIUSDT',
-    'FLOW/USDT:USDT': 'FLOWUSDT',
-    'FLUX/USDT:USDT': 'FLUXUSDT',
-    'FORM/USDT:USDT': 'FORMUSDT',
-    'FORTH/USDT:USDT': 'FORTHUSDT',
-    'FOXY/USDT:USDT': 'FOXYUSDT',
-    'FTN/USDT:USDT': 'FTNUSDT',
-    'FUEL/USDT:USDT': 'FUELUSDT',
-    'FUN/USDT:USDT': 'FUNUSDT',
-    'FWOG/USDT:USDT': 'FWOGUSDT',
-    'FXS/USDT:USDT': 'FXSUSDT',
-    'G/USDT:USDT': 'GUSDT',
-    'GALA/USDC:USDC': 'GALAUSDC:USDC',
-    'GALA/USDT:USDT': 'GALAUSDT',
-    'GAS/USDT:USDT': 'GASUSDT',
-    'GHST/USDT:USDT': 'GHSTUSDT',
-    'GIGA/USDT:USDT': 'GIGAUSDT',
-    'GLM/USDT:USDT': 'GLMUSDT',
-    'GMT/USDT:USDT': 'GMTUSDT',
-    'GMX/USDT:USDT': 'GMXUSDT',
-    'GNO/USDT:USDT': 'GNOUSDT',
-    'GOAT/USDT:USDT': 'GOATUSDT',
-    'GODS/USDT:USDT': 'GODSUSDT',
-    'GPS/USDT:USDT': 'GPSUSDT',
-    'GRASS/USDT:USDT': 'GRASSUSDT',
-    'GRIFFAIN/USDT:USDT': 'GRIFFAINUSDT',
-    'GRT/USDT:USDT': 'GRTUSDT',
-    'GTC/USDT:USDT': 'GTCUSDT',
-    'GUN/USDT:USDT': 'GUNUSDT',
-    'HBAR/USDC:USDC': 'HBARUSDC:USDC',
-    'HBAR/USDT:USDT': 'HBARUSDT',
-    'HEI/USDT:USDT': 'HEIUSDT',
-    'HIFI/USDT:USDT': 'HIFIUSDT',
-    'HIPPO/USDT:USDT': 'HIPPOUSDT',
-    'HIVE/USDT:USDT': 'HIVEUSDT',
-    'HMSTR/USDT:USDT': 'HMSTRUSDT',
-    'HNT/USDT:USDT': 'HNTUSDT',
-    'HOOK/USDT:USDT': 'HOOKUSDT',
-    'HOT/USDT:USDT': 'HOTUSDT',
-    'HYPE/USDT:USDT': 'HYPEUSDT',
-    'ICP/USDT:USDT': 'ICPUSDT',
-    'ICX/USDT:USDT': 'ICXUSDT',
-    'ID/USDT:USDT': 'IDUSDT',
-    'IMX/USDT:USDT': 'IMXUSDT',
-    'INJ/USDT:USDT': 'INJUSDT',
-    'IO/USDT:USDT': 'IOUSDT',
-    'IOST/USDT:USDT': 'IOSTUSDT',
-    'IOTA/USDT:USDT': 'IOTAUSDT',
-    'IOTX/USDT:USDT': 'IOTXUSDT',
-    'IP/USDC:USDC': 'IPUSDC:USDC',
-    'IP/USDT:USDT': 'IPUSDT',
-    'J/USDT:USDT': 'JUSDT',
-    'JAILSTOOL/USDT:USDT': 'JAILSTOOLUSDT',
-    'JASMY/USDT:USDT': 'JASMYUSDT',
-    'JOE/USDT:USDT': 'JOEUSDT',
-    'JTO/USDT:USDT': 'JTOUSDT',
-    'JUP/USDT:USDT': 'JUPUSDT',
-    'KAIA/USDT:USDT': 'KAIAUSDT',
-    'KAITO/USDC:USDC': 'KAITOUSDC:USDC',
-    'KAITO/USDT:USDT': 'KAITOUSDT',
-    'KAS/USDT:USDT': 'KASUSDT',
-    'KAVA/USDT:USDT': 'KAVAUSDT',
-    'KDA/USDT:USDT': 'KDAUSDT',
-    'KILO/USDT:USDT': 'KILOUSDT',
-    'KMNO/USDT:USDT': 'KMNOUSDT',
-    'KNC/USDT:USDT': 'KNCUSDT',
-    'KOMA/USDT:USDT': 'KOMAUSDT',
-    'KSM/USDT:USDT': 'KSMUSDT',
-    'LAYER/USDT:USDT': 'LAYERUSDT',
-    'LDO/USDT:USDT': 'LDOUSDT',
-    'LEVER/USDT:USDT': 'LEVERUSDT',
-    'LINK/USD:LINK': 'LINKUSD:LINK',
-    'LINK/USDC:USDC': 'LINKUSDC:USDC',
-    'LINK/USDT:USDT': 'LINKUSDT',
-    'LISTA/USDT:USDT': 'LISTAUSDT',
-    'LOKA/USDT:USDT': 'LOKAUSDT',
-    'LOOKS/USDT:USDT': 'LOOKSUSDT',
-    'LPT/USDT:USDT': 'LPTUSDT',
-    'LQTY/USDT:USDT': 'LQTYUSDT',
-    'LRC/USDT:USDT': 'LRCUSDT',
-    'LSK/USDT:USDT': 'LSKUSDT',
-    'LTC/USD:LTC': 'LTCUSD:LTC',
-    'LTC/USDC:USDC': 'LTCUSDC:USDC',
-    'LTC/USDT:USDT': 'LTCUSDT',
-    'LUCE/USDT:USDT': 'LUCEUSDT',
-    'LUMIA/USDT:USDT': 'LUMIAUSDT',
-    'LUNA/USDT:USDT': 'LUNAUSDT',
-    'LUNC/USDT:USDT': 'LUNCUSDT',
-    'MAGIC/USDT:USDT': 'MAGICUSDT',
-    'MAJOR/USDT:USDT': 'MAJORUSDT',
-    'MANA/USDT:USDT': 'MANAUSDT',
-    'MANTA/USDT:USDT': 'MANTAUSDT',
-    'MASK/USDT:USDT': 'MASKUSDT',
-    'MAV/USDT:USDT': 'MAVUSDT',
-    'MAX/USDT:USDT': 'MAXUSDT',
-    'MBOX/USDT:USDT': 'MBOXUSDT',
-    'ME/USDC:USDC': 'MEUSDC:USDC',
-    'ME/USDT:USDT': 'MEUSDT',
-    'MELANIA/USDT:USDT': 'MELANIAUSDT',
-    'MEME/USDT:USDT': 'MEMEUSDT',
-    'MEMEFI/USDT:USDT': 'MEMEFIUSDT',
-    'MERL/USDT:USDT': 'MERLUSDT',
-    'METIS/USDT:USDT': 'METISUSDT',
-    'MEW/USDT:USDT': 'MEWUSDT',
-    'MINA/USDT:USDT': 'MINAUSDT',
-    'MKR/USDT:USDT': 'MKRUSDT',
-    'MLN/USDT:USDT': 'MLNUSDT',
-    'MOCA/USDT:USDT': 'MOCAUSDT',
-    'MOODENG/USDT:USDT': 'MOODENGUSDT',
-    'MORPHO/USDT:USDT': 'MORPHOUSDT',
-    'MOVE/USDT:USDT': 'MOVEUSDT',
-    'MOVR/USDT:USDT': 'MOVRUSDT',
-    'MTL/USDT:USDT': 'MTLUSDT',
-    'MUBARAK/USDT:USDT': 'MUBARAKUSDT',
-    'MYRO/USDT:USDT': 'MYROUSDT',
-    'NAVX/USDT:USDT': 'NAVXUSDT',
-    'NC/USDT:USDT': 'NCUSDT',
-    'NEAR/USDC:USDC': 'NEARUSDC:USDC',
-    'NEAR/USDT:USDT': 'NEARUSDT',
-    'NEIROCTO/USDT:USDT': 'NEIROCTOUSDT',
-    'NEIROETH/USDT:USDT': 'NEIROETHUSDT',
-    'NEO/USDC:USDC': 'NEOUSDC:USDC',
-    'NEO/USDT:USDT': 'NEOUSDT',
-    'NFP/USDT:USDT': 'NFPUSDT',
-    'NIL/USDT:USDT': 'NILUSDT',
-    'NKN/USDT:USDT': 'NKNUSDT',
-    'NMR/USDT:USDT': 'NMRUSDT',
-    'NOT/USDC:USDC': 'NOTUSDC:USDC',
-    'NOT/USDT:USDT': 'NOTUSDT',
-    'NS/USDT:USDT': 'NSUSDT',
-    'NTRN/USDT:USDT': 'NTRNUSDT',
-    'NULS/USDT:USDT': 'NULSUSDT',
-    'OBT/USDT:USDT': 'OBTUSDT',
-    'OG/USDT:USDT': 'OGUSDT',
-    'OGN/USDT:USDT': 'OGNUSDT',
-    'OIK/USDT:USDT': 'OIKUSDT',
-    'OL/USDT:USDT': 'OLUSDT',
-    'OM/USDT:USDT': 'OMUSDT',
-    'OMNI1/USDT:USDT': 'OMNI1USDT',
-    'ONDO/USDC:USDC': 'ONDOUSDC:USDC',
-    'ONDO/USDT:USDT': 'ONDOUSDT',
-    'ONE/USDT:USDT': 'ONEUSDT',
-    'ONG/USDT:USDT': 'ONGUSDT',
-    'ONT/USDT:USDT': 'ONTUSDT',
-    'OP/USDC:USDC': 'OPUSDC:USDC',
-    'OP/USDT:USDT': 'OPUSDT',
-    'ORCA/USDT:USDT': 'ORCAUSDT',
-    'ORDER/USDT:USDT': 'ORDERUSDT',
-    'ORDI/USDC:USDC': 'ORDIUSDC:USDC',
-    'ORDI/USDT:USDT': 'ORDIUSDT',
-    'OXT/USDT:USDT': 'OXTUSDT',
-    'PARTI/USDT:USDT': 'PARTIUSDT',
-    'PAXG/USDT:USDT': 'PAXGUSDT',
-    'PEAQ/USDT:USDT': 'PEAQUSDT',
-    'PENDLE/USDT:USDT': 'PENDLEUSDT',
-    'PENGU/USDT:USDT': 'PENGUUSDT',
-    'PEOPLE/USDT:USDT': 'PEOPLEUSDT',
-    'PEPE/USDC:USDC': 'PEPEUSDC:USDC',
-    'PEPE/USDT:USDT': 'PEPEUSDT',
-    'PHA/USDT:USDT': 'PHAUSDT',
-    'PHB/USDT:USDT': 'PHBUSDT',
-    'PI/USDC:USDC': 'PIUSDC:USDC',
-    'PI/USDT:USDT': 'PIUSDT',
-    'PIPPIN/USDT:USDT': 'PIPPINUSDT',
-    'PIXEL/USDT:USDT': 'PIXELUSDT',
-    'PLUME/USDT:USDT': 'PLUMEUSDT',
-    'PNUT/USDC:USDC': 'PNUTUSDC:USDC',
-    'PNUT/USDT:USDT': 'PNUTUSDT',
-    'POL/USDC:USDC': 'POLUSDC:USDC',
-    'POL/USDT:USDT': 'POLUSDT',
-    'POLYX/USDT:USDT': 'POLYXUSDT',
-    'PONKE/USDT:USDT': 'PONKEUSDT',
-    'POPCAT/USDC:USDC': 'POPCATUSDC:USDC',
-    'POPCAT/USDT:USDT': 'POPCATUSDT',
-    'PORTAL/USDT:USDT': 'PORTALUSDT',
-    'POWR/USDT:USDT': 'POWRUSDT',
-    'PRCL/USDT:USDT': 'PRCLUSDT',
-    'PROM/USDT:USDT': 'PROMUSDT',
-    'PROS/USDT:USDT': 'PROSUSDT',
-    'PUFFER/USDT:USDT': 'PUFFERUSDT',
-    'PUMP/USDT:USDT': 'PUMPUSDT',
-    'PYR/USDT:USDT': 'PYRUSDT',
-    'PYTH/USDT:USDT': 'PYTHUSDT',
-    'QKC/USDT:USDT': 'QKCUSDT',
-    'QNT/USDT:USDT': 'QNTUSDT',
-    'QTUM/USDT:USDT': 'QTUMUSDT',
-    'QUICK/USDT:USDT': 'QUICKUSDT',
-    'RAD/USDT:USDT': 'RADUSDT',
-    'RARE/USDT:USDT': 'RAREUSDT',
-    'RAY/USDT:USDT': 'RAYUSDT',
-    'RDNT/USDT:USDT': 'RDNTUSDT',
-    'RED/USDT:USDT': 'REDUSDT',
-    'REI/USDT:USDT': 'REIUSDT',
-    'RENDER/USDT:USDT': 'RENDERUSDT',
-    'REZ/USDT:USDT': 'REZUSDT',
-    'ROAM/USDT:USDT': 'ROAMUSDT',
-    'RON/USDT:USDT': 'RONUSDT',
-    'ROSE/USDT:USDT': 'ROSEUSDT',
-    'RPL/USDT:USDT': 'RPLUSDT',
-    'RSR/USDT:USDT': 'RSRUSDT',
-    'RSS3/USDT:USDT': 'RSS3USDT',
-    'RUNE/USDT:USDT': 'RUNEUSDT',
-    'RVN/USDT:USDT': 'RVNUSDT',
-    'S/USDT:USDT': 'SUSDT',
-    'SAFE/USDT:USDT': 'SAFEUSDT',
-    'SAGA/USDT:USDT': 'SAGAUSDT',
-    'SAND/USDT:USDT': 'SANDUSDT',
-    'SANTOS/USDT:USDT': 'SANTOSUSDT',
-    'SCR/USDT:USDT': 'SCRUSDT',
-    'SCRT/USDT:USDT': 'SCRTUSDT',
-    'SEI/USDT:USDT': 'SEIUSDT',
-    'SERAPH/USDT:USDT': 'SERAPHUSDT',
-    'SFP/USDT:USDT': 'SFPUSDT',
-    'SHELL/USDT:USDT': 'SHELLUSDT',
-    'SHIB/USDC:USDC': 'SHIBUSDC:USDC',
-    'SHIB/USDT:USDT': 'SHIBUSDT',
-    'SIREN/USDT:USDT': 'SIRENUSDT',
-    'SKL/USDT:USDT': 'SKLUSDT',
-    'SLERF/USDT:USDT': 'SLERFUSDT',
-    'SNT/USDT:USDT': 'SNTUSDT',
-    'SNX/USDT:USDT': 'SNXUSDT',
-    'SOL/USD:SOL': 'SOLUSD:SOL',
-    'SOL/USDC:USDC': 'SOLUSDC:USDC',
-    'SOL/USDT:USDT': 'SOLUSDT',
-    'SOLV/USDT:USDT': 'SOLVUSDT',
-    'SONIC/USDT:USDT': 'SONICUSDT',
-    'SPELL/USDT:USDT': 'SPELLUSDT',
-    'SPX/USDT:USDT': 'SPXUSDT',
-    'SSV/USDT:USDT': 'SSVUSDT',
-    'STEEM/USDT:USDT': 'STEEMUSDT',
-    'STG/USDT:USDT': 'STGUSDT',
-    'STO/USDT:USDT': 'STOUSDT',
-    'STORJ/USDT:USDT': 'STORJUSDT',
-    'STPT/USDT:USDT': 'STPTUSDT',
-    'STRK/USDC:USDC': 'STRKUSDC:USDC',
-    'STRK/USDT:USDT': 'STRKUSDT',
-    'STX/USDC:USDC': 'STXUSDC:USDC',
-    'STX/USDT:USDT': 'STXUSDT',
-    'SUI/USDC:USDC': 'SUIUSDC:USDC',
-    'SUI/USDT:USDT': 'SUIUSDT',
-    'SUN/USDT:USDT': 'SUNUSDT',
-    'SUNDOG/USDT:USDT': 'SUNDOGUSDT',
-    'SUPER/USDT:USDT': 'SUPERUSDT',
-    'SUSHI/USDT:USDT': 'SUSHIUSDT',
-    'SWARMS/USDT:USDT': 'SWARMSUSDT',
-    'SWEAT/USDT:USDT': 'SWEATUSDT',
-    'SWELL/USDT:USDT': 'SWELLUSDT',
-    'SXP/USDT:USDT': 'SXPUSDT',
-    'SYN/USDT:USDT': 'SYNUSDT',
-    'SYS/USDT:USDT': 'SYSUSDT',
-    'T/USDT:USDT': 'TUSDT',
-    'TAIKO/USDT:USDT': 'TAIKOUSDT',
-    'TAO/USDT:USDT': 'TAOUSDT',
-    'THE/USDT:USDT': 'THEUSDT',
-    'THETA/USDT:USDT': 'THETAUSDT',
-    'TIA/USDC:USDC': 'TIAUSDC:USDC',
-    'TIA/USDT:USDT': 'TIAUSDT',
-    'TLM/USDT:USDT': 'TLMUSDT',
-    'TNSR/USDT:USDT': 'TNSRUSDT',
-    'TON/USDC:USDC': 'TONUSDC:USDC',
-    'TON/USDT:USDT': 'TONUSDT',
-    'TOSHI/USDT:USDT': 'TOSHIUSDT',
-    'TRB/USDT:USDT': 'TRBUSDT',
-    'TROY/USDT:USDT': 'TROYUSDT',
-    'TRU/USDT:USDT': 'TRUUSDT',
-    'TRUMP/USDC:USDC': 'TRUMPUSDC:USDC',
-    'TRUMP/USDT:USDT': 'TRUMPUSDT',
-    'TRX/USD:TRX': 'TRXUSD:TRX',
-    'TRX/USDC:USDC': 'TRXUSDC:USDC',
-    'TRX/USDT:USDT': 'TRXUSDT',
-    'TSTBSC/USDC:USDC': 'TSTBSCUSDC:USDC',
-    'TSTBSC/USDT:USDT': 'TSTBSCUSDT',
-    'TURBO/USDT:USDT': 'TURBOUSDT',
-    'TUT/USDT:USDT': 'TUTUSDT',
-    'UMA/USDT:USDT': 'UMAUSDT',
-    'UNI/USDC:USDC': 'UNIUSDC:USDC',
-    'UNI/USDT:USDT': 'UNIUSDT',
-    'USDC/USDT:USDT': 'USDCUSDT',
-    'USTC/USDT:USDT': 'USTCUSDT',
-    'USUAL/USDT:USDT': 'USUALUSDT',
-    'UXLINK/USDT:USDT': 'UXLINKUSDT',
-    'VANA/USDC:USDC': 'VANAUSDC:USDC',
-    'VANA/USDT:USDT': 'VANAUSDT',
-    'VANRY/USDT:USDT': 'VANRYUSDT',
-    'VELO/USDT:USDT': 'VELOUSDT',
-    'VELODROME/USDT:USDT': 'VELODROMEUSDT',
-    'VET/USDT:USDT': 'VETUSDT',
-    'VIC/USDT:USDT': 'VICUSDT',
-    'VIDT/USDT:USDT': 'VIDTUSDT',
-    'VINE/USDT:USDT': 'VINEUSDT',
-    'VIRTUAL/USDT:USDT': 'VIRTUALUSDT',
-    'VOXEL/USDT:USDT': 'VOXELUSDT',
-    'VTHO/USDT:USDT': 'VTHOUSDT',
-    'VVV/USDT:USDT': 'VVVUSDT',
-    'W/USDT:USDT': 'WUSDT',
-    'WAL/USDT:USDT': 'WALUSDT',
-    'WAVES/USDT:USDT': 'WAVESUSDT',
-    'WAXP/USDT:USDT': 'WAXPUSDT',
-    'WIF/USDC:USDC': 'WIFUSDC:USDC',
-    'WIF/USDT:USDT': 'WIFUSDT',
-    'WLD/USDC:USDC': 'WLDUSDC:USDC',
-    'WLD/USDT:USDT': 'WLDUSDT',
-    'WOO/USDT:USDT': 'WOOUSDT',
-    'X/USDT:USDT': 'XUSDT',
-    'XAI/USDT:USDT': 'XAIUSDT',
-    'XAUT/USDT:USDT': 'XAUTUSDT',
-    'XCN/USDT:USDT': 'XCNUSDT',
-    'XDC/USDT:USDT': 'XDCUSDT',
-    'XION/USDT:USDT': 'XIONUSDT',
-    'XLM/USDC:USDC': 'XLMUSDC:USDC',
-    'XLM/USDT:USDT': 'XLMUSDT',
-    'XRP/USD:XRP': 'XRPUSD:XRP',
-    'XRP/USDC:USDC': 'XRPUSDC:USDC',
-    'XRP/USDT:USDT': 'XRPUSDT',
-    'XTZ/USDT:USDT': 'XTZUSDT',
-    'XVG/USDT:USDT': 'XVGUSDT',
-    'XVS/USDT:USDT': 'XVSUSDT',
-    'YGG/USDT:USDT': 'YGGUSDT',
-    'ZEN/USDT:USDT': 'ZENUSDT',
-    'ZEREBRO/USDT:USDT': 'ZEREBROUSDT',
-    'ZETA/USDT:USDT': 'ZETAUSDT',
-    'ZIL/USDT:USDT': 'ZILUSDT',
-    'ZK/USDT:USDT': 'ZKUSDT',
-    'ZKJ/USDT:USDT': 'ZKJUSDT',
-    'ZRC/USDT:USDT': 'ZRCUSDT',
-    'ZRO/USDT:USDT': 'ZROUSDT',
-    'ZRX/USDT:USDT': 'ZRXUSDT'
-}
-symbols = list(symbol_mapping.keys())
-symbol_mapping_inv = {v: k for k, v in symbol_mapping.items()}  # <-- ADD THIS LINE
+# ccxt symbol -> Bybit symbol, filled in place by load_symbol_mapping()
+symbol_mapping = {}
+symbols = []
+symbol_mapping_inv = {}
 
 # Trading Parameters
 TRADE_AMOUNT_USDT = 50
+MAX_OPEN_POSITIONS = int(os.getenv('MAX_OPEN_POSITIONS', '3'))
+MAX_EXPOSURE_USDT = float(os.getenv('MAX_EXPOSURE_USDT', str(MAX_OPEN_POSITIONS * TRADE_AMOUNT_USDT)))
 STOP_LOSS_PERCENT = 2
 TAKE_PROFIT_PERCENT = 20
 
@@ -565,33 +188,598 @@ TAKE_PROFIT_PERCENT = 20
 timeframe_15m = '15m'
 timeframe_1h = '1h'
 limit = 500
+TREND_1H_BARS = int(os.getenv('TREND_1H_BARS', str(limit)))  # 1h candles behind the trend EMA, built from 15m
 ema_fast_length = 38
 ema_slow_length = 62
 ema_trend_length = 200
 H_BANDWIDTH = 8.0
 MULTIPLIER = 3.0
 REPAINT = True
+NWE_TRUNCATION_TOL = 1e-17  # Kernel weights below this are treated as zero
+
+# NWE kernel cache keyed by (n, h) and incremental state keyed by series
+_nwe_kernel_cache = {}
+_nwe_state = {}
+
+# ======================== Clock ========================
+
+class Clock:
+    """Wall clock used by every timed wait in the bot"""
+
+    speed = 1
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def real_seconds(self, seconds):
+        """Real seconds a blocking wait of `seconds` on this clock should take"""
+        return seconds
+
+class SimClock(Clock):
+    """Clock starting at `start` (epoch seconds) and running `speed` times faster than real time"""
+
+    def __init__(self, start=None, speed=100):
+        self.speed = speed
+        self._start = time.time() if start is None else start
+        self._real_start = time.monotonic()
+
+    def time(self):
+        return self._start + (time.monotonic() - self._real_start) * self.speed
+
+    def monotonic(self):
+        return self.time()
+
+    def sleep(self, seconds):
+        time.sleep(max(0, seconds) / self.speed)
+
+    def real_seconds(self, seconds):
+        return None if seconds is None else seconds / self.speed
+
+clock = Clock()
+
+def set_clock(new_clock):
+    """Replace the clock, e.g. with a SimClock for offline simulations"""
+    global clock
+    clock = new_clock
+
+# ======================== Metrics ========================
+
+# Latency histograms keyed by stage or endpoint name
+_timings = {}
+_timings_lock = threading.Lock()
+_last_timing_report = None  # clock.time() of the last timing summary
+
+def record_timing(name, seconds):
+    """Add one duration sample to the named histogram"""
+    with _timings_lock:
+        histogram = _timings.get(name)
+        if histogram is None:
+            histogram = _timings[name] = {'samples': deque(maxlen=METRICS_WINDOW), 'count': 0, 'sum': 0.0}
+        histogram['samples'].append(seconds)
+        histogram['count'] += 1
+        histogram['sum'] += seconds
+
+@contextlib.contextmanager
+def stage_timer(name):
+    """Time the enclosed block into the named histogram, failures included"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def _timed_endpoint(name, method):
+    def timed(*args, **kwargs):
+        with stage_timer(name):
+            return method(*args, **kwargs)
+    return timed
+
+def instrument_client(client, prefix, methods):
+    """Time every call to the given client methods as '<prefix>.<method>'"""
+    for method in methods:
+        setattr(client, method, _timed_endpoint(f"{prefix}.{method}", getattr(client, method)))
+
+def timing_summary():
+    """Count, total and p50/p95/p99/max in seconds for every histogram"""
+    with _timings_lock:
+        snapshot = {name: (list(h['samples']), h['count'], h['sum']) for name, h in _timings.items()}
+
+    summary = {}
+    for name, (samples, count, total) in sorted(snapshot.items()):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        summary[name] = {
+            'count': count,
+            'sum': total,
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(max(samples))
+        }
+    return summary
+
+def print_timing_report():
+    """Print the per-stage and per-endpoint latency table"""
+    summary = timing_summary()
+    if not summary:
+        return
+    width = max(len(name) for name in summary)
+    print(f"\n{'stage':<{width}} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in summary.items():
+        print(f"{name:<{width}} {s['count']:>8} {s['p50'] * 1000:>9.2f} {s['p95'] * 1000:>9.2f} "
+              f"{s['p99'] * 1000:>9.2f} {s['max'] * 1000:>9.2f}")
+
+def maybe_report_timings(interval=METRICS_REPORT_SECONDS):
+    """Print the timing report once per interval"""
+    global _last_timing_report
+    now = clock.time()
+    if _last_timing_report is None:
+        _last_timing_report = now
+    elif now - _last_timing_report >= interval:
+        _last_timing_report = now
+        print_timing_report()
+
+def render_metrics():
+    """Histograms in Prometheus text exposition format"""
+    lines = [
+        "# HELP bot_latency_seconds Latency of bot stages and exchange endpoints",
+        "# TYPE bot_latency_seconds summary"
+    ]
+    for name, s in timing_summary().items():
+        for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+            lines.append(f'bot_latency_seconds{{name="{name}",quantile="{quantile}"}} {s[key]:.6f}')
+        lines.append(f'bot_latency_seconds_sum{{name="{name}"}} {s["sum"]:.6f}')
+        lines.append(f'bot_latency_seconds_count{{name="{name}"}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT, host='0.0.0.0'):
+    """Serve render_metrics() on http://host:port/metrics from a daemon thread"""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics endpoint on port {server.server_address[1]}")
+    return server
+
+# Per-endpoint latency for every exchange call the bot makes
+# The client methods the bot calls; any stand-in client must provide these
+SCAN_ENDPOINTS = ['fetch_ohlcv', 'load_markets']
+BYBIT_ENDPOINTS = ['get_tickers', 'get_positions', 'get_instruments_info', 'get_kline', 'place_order',
+                   'set_trading_stop', 'get_open_orders', 'cancel_order']
+
+
+# ======================== Request Scheduler ========================
+
+# Priority lanes, lower runs first when an exchange's budget is contended. Lanes
+# only compete within one scheduler: on Bybit orders go ahead of position and
+# price reads, on bitget monitor candle fetches (see request_priority) go ahead
+# of the scan
+PRIORITY_ORDER = 0
+PRIORITY_MONITOR = 1
+PRIORITY_SCAN = 2
+
+# Lane and retry policy per client method. Orders are never retried, a timed-out
+# order may still have been filled
+ENDPOINT_POLICY = {
+    'place_order': (PRIORITY_ORDER, False),
+    'set_trading_stop': (PRIORITY_ORDER, True),
+    'get_positions': (PRIORITY_MONITOR, True),
+    'get_tickers': (PRIORITY_MONITOR, True),
+    'get_kline': (PRIORITY_MONITOR, True),
+    'get_open_orders': (PRIORITY_MONITOR, True),
+    'cancel_order': (PRIORITY_ORDER, True),
+    'get_instruments_info': (PRIORITY_SCAN, True),
+    'fetch_ohlcv': (PRIORITY_SCAN, True),
+}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an exchange that keeps failing"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every caller of one endpoint"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = clock.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """Block until cost tokens are available"""
+        with self._lock:
+            now = clock.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserve the tokens now so waiting threads queue up behind each other
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            clock.sleep(wait)
+
+class RequestScheduler:
+    """Per-exchange token bucket with priority lanes, backoff and a circuit breaker"""
+
+    def __init__(self, name, rate, burst=1, endpoint_rates=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.endpoints = {endpoint: RateLimiter(r, burst=1) for endpoint, r in (endpoint_rates or {}).items()}
+        self._tokens = burst
+        self._last = clock.monotonic()
+        self._paused_until = 0
+        self._waiting = []  # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+        self._failures = 0
+        self._open_until = 0
+        self._probing = False
+
+    def acquire(self, cost=1, priority=PRIORITY_SCAN, endpoint=None):
+        """Block until this request is the most urgent one and its tokens are free"""
+        if endpoint in self.endpoints:
+            self.endpoints[endpoint].acquire()
+        cost = min(cost, self.burst)
+        with self._cond:
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = clock.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._waiting[0] == entry:
+                    wait = max((cost - self._tokens) / self.rate, self._paused_until - now)
+                    if wait <= 0:
+                        heapq.heappop(self._waiting)
+                        self._tokens -= cost
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(clock.real_seconds(wait))
+                else:
+                    self._cond.wait()
+
+    def pause(self, seconds):
+        """Hold every lane after the exchange pushed back on our request rate"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, clock.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0)
+            self._cond.notify_all()
+
+    def open_for(self):
+        """Seconds until a tripped circuit is probed again, 0 while it is closed"""
+        with self._cond:
+            if not self._open_until:
+                return 0
+            return max(self._open_until - clock.monotonic(), 1.0)
+
+    def _before_call(self):
+        with self._cond:
+            if not self._open_until:
+                return
+            remaining = self._open_until - clock.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(self.name, max(remaining, 0))
+            # Cooldown over, let a single request through to probe the exchange
+            self._probing = True
+
+    def _after_call(self, transient_error=False):
+        with self._cond:
+            self._probing = False
+            if not transient_error:
+                self._failures = 0
+                if self._open_until:
+                    print(f"{self.name} circuit closed")
+                self._open_until = 0
+                return
+            self._failures += 1
+            if self._failures < CIRCUIT_FAILURE_THRESHOLD and not self._open_until:
+                return
+            self._open_until = clock.monotonic() + CIRCUIT_COOLDOWN
+        print(f"{self.name} circuit open for {CIRCUIT_COOLDOWN}s after {self._failures} failures")
+        play_alert()
+
+    def call(self, method, *args, priority=PRIORITY_SCAN, endpoint=None, retry=True, **kwargs):
+        """Run one exchange request under the budget, retrying transient failures"""
+        retries = REQUEST_RETRIES if retry else 0
+        for attempt in range(retries + 1):
+            self._before_call()
+            queued = time.perf_counter()
+            self.acquire(priority=priority, endpoint=endpoint)
+            record_timing(f"{self.name}.queue", time.perf_counter() - queued)
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                transient = is_transient_error(e)
+                self._after_call(transient_error=transient)
+                if is_rate_limit_error(e):
+                    self.pause(backoff_delay(attempt))
+                if not transient or attempt == retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"{self.name} {endpoint or 'request'} failed (attempt {attempt + 1}), "
+                      f"retrying in {delay:.1f}s: {e}")
+                clock.sleep(delay)
+            else:
+                self._after_call()
+                return result
+
+# Lane the calling thread asked for with request_priority()
+_request_lane = threading.local()
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Queue exchange calls made inside the block in this lane or a more urgent one"""
+    previous = getattr(_request_lane, 'priority', None)
+    _request_lane.priority = priority
+    try:
+        yield
+    finally:
+        _request_lane.priority = previous
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given zero-based retry"""
+    return random.uniform(0, capped_backoff(attempt))
+
+def capped_backoff(attempt, cap=REQUEST_BACKOFF_MAX):
+    """Exponential backoff without jitter for the given zero-based retry"""
+    return min(cap, REQUEST_BACKOFF_BASE * 2 ** attempt)
+
+def is_rate_limit_error(e):
+    """Whether the exchange rejected a request for exceeding its rate limit"""
+    # Exceptions of a module nobody imported yet cannot have been raised
+    if 'ccxt' in sys.modules and isinstance(e, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+        return True
+    if isinstance(e, FailedRequestError):
+        return e.status_code in (403, 429)
+    return isinstance(e, InvalidRequestError) and e.status_code == 10006
+
+def is_transient_error(e):
+    """Whether a failed request is worth retrying as-is"""
+    if isinstance(e, InvalidRequestError):
+        # 10002: request timestamp outside recv_window, fine on a fresh attempt
+        return is_rate_limit_error(e) or e.status_code == 10002
+    if isinstance(e, FailedRequestError):
+        # Other 4xx responses, like a rejected signature, fail the same way again
+        try:
+            status = int(e.status_code)
+        except (TypeError, ValueError):
+            return True
+        return status >= 500 or status in RETRYABLE_HTTP_STATUSES
+    transient = (ConnectionError, TimeoutError)
+    if 'ccxt' in sys.modules:
+        transient += (ccxt.NetworkError,)
+    if 'requests' in sys.modules:
+        transient += (requests.exceptions.RequestException,)
+    return isinstance(e, transient)
+
+def _scheduled_endpoint(scheduler, endpoint, method):
+    priority, retry = ENDPOINT_POLICY.get(endpoint, (PRIORITY_SCAN, True))
+    def scheduled(*args, **kwargs):
+        lane = getattr(_request_lane, 'priority', None)
+        return scheduler.call(method, *args, priority=priority if lane is None else min(priority, lane),
+                              endpoint=endpoint, retry=retry, **kwargs)
+    return scheduled
+
+def schedule_client(client, scheduler, methods):
+    """Route every call to the given client methods through scheduler"""
+    for method in methods:
+        setattr(client, method, _scheduled_endpoint(scheduler, method, getattr(client, method)))
+
+# One scheduler per exchange, shared by scans, monitors and order placement
+# (the clients are attached when they are first built)
+bitget_scheduler = RequestScheduler("bitget", rate=BITGET_RATE_LIMIT, burst=SCAN_BURST)
+bybit_scheduler = RequestScheduler("bybit", rate=BYBIT_RATE_LIMIT, burst=SCAN_BURST,
+                                   endpoint_rates=BYBIT_ENDPOINT_RATES)
 
 # ======================== Core Functions ========================
 
+def fetch_ohlcv(symbol, timeframe, limit, since=None):
+    """Fetch candles from the scan exchange under its request scheduler"""
+    return exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+
+def fetch_ohlcv_history(symbol, timeframe, limit):
+    """Fetch the latest `limit` candles, paging forward when one request cannot hold them"""
+    if limit <= OHLCV_PAGE_LIMIT:
+        return fetch_ohlcv(symbol, timeframe, limit=limit)
+
+    period_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    since = (int(clock.time() * 1000) // period_ms - limit + 1) * period_ms
+    rows = []
+    while True:
+        page = fetch_ohlcv(symbol, timeframe, limit=OHLCV_PAGE_LIMIT, since=since)
+        if rows:
+            page = [row for row in page if row[0] > rows[-1][0]]
+        if not page:
+            break
+        rows.extend(page)
+        if len(page) < OHLCV_PAGE_LIMIT:
+            break
+        since = rows[-1][0] + period_ms
+    return rows[-limit:]
+
+# ======================== Candle Cache ========================
+
+# Ring buffer of OHLCV rows per (symbol, timeframe); the last row may still be forming
+_candle_cache = {}
+# Float (rows x 6) copy of each series, replaced rather than modified on every
+# update so the scan can stack windows without converting lists again
+_candle_cache_arrays = {}
+# Series whose full exchange history is shorter than the cache size
+_candle_history_complete = set()
+_candle_cache_lock = threading.Lock()
+
+def get_candles(symbol, timeframe, limit, as_array=False):
+    """Get the latest `limit` candles, fetching only bars newer than the cache
+
+    as_array returns a read-only view of the float array mirror instead of
+    a list of rows.
+    """
+    key = (symbol, timeframe)
+    with _candle_cache_lock:
+        series = _candle_cache.get(key)
+        since = series[-1][0] if series else None
+        have_enough = series is not None and (len(series) >= limit or key in _candle_history_complete)
+
+    fetch_limit = limit
+    if have_enough:
+        # Re-fetch from the last cached candle, which may have been forming
+        sync_limit = min(max(limit, CANDLE_SYNC_LIMIT), OHLCV_PAGE_LIMIT)
+        rows = fetch_ohlcv(symbol, timeframe, limit=sync_limit, since=since)
+        if len(rows) >= sync_limit:
+            # Too far behind to merge safely, start the series over
+            fetch_limit = max(limit, len(series))
+            have_enough = False
+
+    if not have_enough:
+        rows = fetch_ohlcv_history(symbol, timeframe, fetch_limit)
+        with _candle_cache_lock:
+            series = deque(rows, maxlen=max(CANDLE_CACHE_SIZE, fetch_limit))
+            _candle_cache[key] = series
+            _candle_cache_arrays[key] = _candle_array(rows)
+            if len(rows) < fetch_limit:
+                _candle_history_complete.add(key)
+            else:
+                _candle_history_complete.discard(key)
+            return _candle_window(key, series, limit, as_array)
+
+    with _candle_cache_lock:
+        series = _candle_cache.get(key, series)
+        array = _candle_cache_arrays.get(key)
+        in_step = (array is not None and len(array) == len(series)
+                   and (not series or array[-1, 0] == series[-1][0]))
+        if rows:
+            while series and series[-1][0] >= rows[0][0]:
+                series.pop()
+            kept = len(series)
+            series.extend(rows)
+            if in_step:
+                array = np.concatenate((array[:kept], _candle_array(rows)))[-series.maxlen:]
+                array.flags.writeable = False
+        if not in_step:
+            array = _candle_array(series)
+        _candle_cache_arrays[key] = array
+        return _candle_window(key, series, limit, as_array)
+
+def _candle_array(rows):
+    array = np.array(rows, dtype=float).reshape(-1, 6)
+    array.flags.writeable = False
+    return array
+
+def _candle_window(key, series, limit, as_array):
+    """Last `limit` rows of a cached series, called with the cache lock held"""
+    if as_array:
+        return _candle_cache_arrays[key][-limit:]
+    return list(series)[-limit:]
+
+def get_signal_candles(symbol):
+    """15m signal window, the 1h trend candles and the 1h row of each 15m candle
+
+    The 1h candles are aggregated from a deeper 15m series instead of being
+    fetched, so one cached series and one request per symbol serve both
+    timeframes. The last 1h candle is forming, as it would be from the
+    exchange. Both windows are float arrays taken from the cache's mirror.
+    """
+    period_ms = ccxt.Exchange.parse_timeframe(timeframe_1h) * 1000
+    per_candle = period_ms // (ccxt.Exchange.parse_timeframe(timeframe_15m) * 1000)
+    base_limit = max(limit, (TREND_1H_BARS + 1) * per_candle)
+    rows = get_candles(symbol, timeframe_15m, limit=base_limit, as_array=True)
+
+    htf, htf_index = aggregate_candles(rows, period_ms, with_index=True)
+    skip = len(htf) - TREND_1H_BARS
+    if len(rows) >= base_limit:
+        # The oldest 1h candle may be missing 15m bars cut off by the window
+        skip = max(skip, 1)
+    skip = max(skip, 0)
+    window = rows[-limit:]
+    candles_1h = htf[skip:]
+    window_index = htf_index[len(rows) - len(window):] - skip
+    # As with align_to_base, 15m candles after the forming 1h candle opened get no trend
+    window_index[np.searchsorted(window_index, len(candles_1h) - 1) + 1:] = -1
+    return window, candles_1h, window_index
+
+def _pack_candle_cache():
+    """np.savez arrays holding every cached candle series"""
+    with _candle_cache_lock:
+        keys = list(_candle_cache)
+        arrays = {f"s{i}": np.array(_candle_cache[key], dtype=float) for i, key in enumerate(keys)}
+        complete = [key in _candle_history_complete for key in keys]
+    return {'keys': np.array([f"{symbol}|{timeframe}" for symbol, timeframe in keys]),
+            'complete': np.array(complete, dtype=bool), **arrays}
+
+def _unpack_candle_cache(data):
+    """Restore series packed by _pack_candle_cache from an open npz, returning how many"""
+    loaded = {}
+    for i, name in enumerate(data['keys']):
+        symbol, timeframe = str(name).rsplit('|', 1)
+        array = _candle_array(data[f"s{i}"])
+        rows = [[int(row[0])] + row[1:] for row in array.tolist()]
+        loaded[(symbol, timeframe)] = (deque(rows, maxlen=max(CANDLE_CACHE_SIZE, len(rows))), array,
+                                       bool(data['complete'][i]))
+    with _candle_cache_lock:
+        for key, (series, array, complete) in loaded.items():
+            _candle_cache[key] = series
+            _candle_cache_arrays[key] = array
+            if complete:
+                _candle_history_complete.add(key)
+    return len(loaded)
+
+def save_candle_cache(path=CANDLE_CACHE_FILE):
+    """Write the candle cache to disk so a restart only fetches new bars"""
+    try:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **_pack_candle_cache())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving candle cache: {e}")
+
+def load_candle_cache(path=CANDLE_CACHE_FILE):
+    """Restore the candle cache written by save_candle_cache"""
+    if not os.path.exists(path):
+        return
+    try:
+        with np.load(path) as data:
+            loaded = _unpack_candle_cache(data)
+        print(f"Loaded {loaded} candle series from {path}")
+    except Exception as e:
+        print(f"Error loading candle cache: {e}")
+
 def calculate_atr(df, length=14):
     """Calculate ATR for a given dataframe"""
-    df['prev_close'] = df['close'].shift(1)
-    df['hl'] = df['high'] - df['low']
-    df['hc'] = abs(df['high'] - df['prev_close'])
-    df['lc'] = abs(df['low'] - df['prev_close'])
-    df['tr'] = df[['hl', 'hc', 'lc']].max(axis=1)
-    df['atr'] = df['tr'].rolling(window=length).mean()
+    df['atr'] = atr_array(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float),
+                          df['close'].to_numpy(dtype=float), length)
     return df
 
 def get_atr_levels(symbol, timeframe='15m', length=14):
     """Get current ATR and projected levels"""
-    ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=length+1)
-    df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df = calculate_atr(df, length)
-    
-    last_close = df['close'].iloc[-2]  # Last fully closed candle
-    last_atr = df['atr'].iloc[-2]      # Last fully closed ATR
+    # Ask for a full window: a shorter request would seed the shared cache with a
+    # series too short for the monitor and scan, forcing them to refetch it
+    candles = np.asarray(get_candles(symbol, timeframe, limit=limit)[-(length + 1):], dtype=float)
+    atr = atr_array(candles[:, 2], candles[:, 3], candles[:, 4], length)
+
+    last_close = candles[-2, 4]  # Last fully closed candle
+    last_atr = atr[-2]           # Last fully closed ATR
     
     return {
         'upper': last_close + (2 * last_atr),
@@ -603,7 +791,7 @@ def get_atr_levels(symbol, timeframe='15m', length=14):
 
 def play_alert():
     """Play alert sound for network issues"""
-    if os.path.exists(ALERT_PATH):
+    if ALERT_PATH and os.path.exists(ALERT_PATH):
         subprocess.Popen(["mpv", "--no-video", ALERT_PATH])
         print("Alert played")
     else:
@@ -613,117 +801,519 @@ def play_alert():
 
 
 
-def save_active_trade(symbol, entry_price, sl_price, tp_price, side):
-    """Save trade details to file with error handling"""
+# ======================== State Store ========================
+
+class StateStore:
+    """Open trades and the trade state in SQLite (WAL), written transactionally
+
+    The trade state is cached in memory so reading it never touches disk.
+    A fresh database imports TRADE_FILE and TRADE_STATE_FILE from older
+    versions.
+    """
+
+    def __init__(self, path, migrate=True):
+        self.path = path
+        self._lock = threading.RLock()
+        fresh = migrate and not os.path.exists(path)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS trades (symbol TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if fresh:
+            self._migrate_legacy_files()
+        row = self._db.execute("SELECT value FROM settings WHERE key = 'trade_state'").fetchone()
+        self.state = row[0] if row else "ENTRY"
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _migrate_legacy_files(self):
+        trades = {}
+        state = None
+        try:
+            if os.path.exists(TRADE_FILE):
+                with open(TRADE_FILE, 'r') as f:
+                    trades = json.load(f)
+                # Files from the single-trade version hold one trade at the top level
+                if 'symbol' in trades:
+                    trades = {trades['symbol']: trades}
+            if os.path.exists(TRADE_STATE_FILE):
+                with open(TRADE_STATE_FILE, 'r') as f:
+                    state = f.read().strip().upper() or None
+        except Exception as e:
+            print(f"Error reading legacy trade files: {e}")
+            return
+
+        with self._transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO trades VALUES (?, ?)",
+                           [(symbol, json.dumps(trade)) for symbol, trade in trades.items()])
+            if state in ("ENTRY", "MANAGE"):
+                db.execute("INSERT OR REPLACE INTO settings VALUES ('trade_state', ?)", (state,))
+        for legacy_path in (TRADE_FILE, TRADE_STATE_FILE):
+            if os.path.exists(legacy_path):
+                os.replace(legacy_path, f"{legacy_path}.migrated")
+        if trades or state:
+            print(f"Migrated {len(trades)} trades and state {state} into {self.path}")
+
+    def load_trades(self):
+        """All stored trades keyed by symbol"""
+        with self._lock:
+            rows = self._db.execute("SELECT symbol, data FROM trades").fetchall()
+        return {symbol: json.loads(data) for symbol, data in rows}
+
+    def save_trade(self, symbol, trade, state=None):
+        """Insert or replace a trade, together with the new trade state when given"""
+        with self._lock:
+            with self._transaction() as db:
+                db.execute("INSERT OR REPLACE INTO trades VALUES (?, ?)", (symbol, json.dumps(trade)))
+                if state is not None:
+                    db.execute("INSERT OR REPLACE INTO settings VALUES ('trade_state', ?)", (state,))
+            if state is not None:
+                self.state = state
+
+    def delete_trade(self, symbol, state=None):
+        """Delete a trade, together with the new trade state when given"""
+        with self._lock:
+            with self._transaction() as db:
+                db.execute("DELETE FROM trades WHERE symbol = ?", (symbol,))
+                if state is not None:
+                    db.execute("INSERT OR REPLACE INTO settings VALUES ('trade_state', ?)", (state,))
+            if state is not None:
+                self.state = state
+
+    def set_state(self, state):
+        """Store the trade state"""
+        with self._lock:
+            with self._transaction() as db:
+                db.execute("INSERT OR REPLACE INTO settings VALUES ('trade_state', ?)", (state,))
+            self.state = state
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+def get_state_store():
+    """The shared StateStore, opened on first use"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = StateStore(STATE_DB_FILE)
+        return _state_store
+
+# ======================== Portfolio ========================
+
+# Open trades and pending re-entry orders keyed by ccxt symbol, mirrored to the state store
+open_positions = {}
+_position_monitors = {}
+_one_shot_run = False  # Set by run_once, which monitors without threads
+_portfolio_lock = threading.RLock()
+
+def save_active_trade(symbol, entry_price, sl_price, tp_price, side, quantity=None, order_id=None):
+    """Store a new trade and the resulting trade state in one transaction
+
+    With order_id the trade is a resting re-entry order, held as 'pending'
+    so it counts against the portfolio limits until it fills or is gone.
+    """
     trade_data = {
         'symbol': symbol,
+        'status': 'open' if order_id is None else 'pending',
+        'order_id': order_id,
         'entry_price': entry_price,
-        'sl_price': sl_price,
-        'tp_price': tp_price,
+        'sl_price': float(sl_price),
+        'tp_price': float(tp_price),
         'side': side,
-        'opened_at': pd.Timestamp.now().isoformat()
+        'bybit_symbol': symbol_mapping.get(symbol),
+        'quantity': None if quantity is None else float(quantity),
+        'notional': TRADE_AMOUNT_USDT if quantity is None else float(quantity) * entry_price,
+        'opened_at': pd.Timestamp.fromtimestamp(clock.time()).isoformat()
     }
     try:
-        with open(TRADE_FILE, 'w') as f:
-            json.dump(trade_data, f)
-        print(f"Trade saved to {TRADE_FILE}")
+        with _portfolio_lock:
+            old_state = get_trade_state()
+            open_positions[symbol] = trade_data
+            state = _portfolio_state()
+            try:
+                get_state_store().save_trade(symbol, trade_data, state)
+            except Exception:
+                open_positions.pop(symbol, None)
+                raise
+            _announce_state_change(old_state, state)
+        print(f"Trade saved to {STATE_DB_FILE}")
     except Exception as e:
         print(f"Error saving trade: {e}")
         raise
-        
-        
-        
 
-def clear_active_trade():
-    """Remove trade file with confirmation"""
+def clear_active_trade(symbol):
+    """Remove one trade from the portfolio and the store, updating the trade state with it"""
     try:
-        if os.path.exists(TRADE_FILE):
-            os.remove(TRADE_FILE)
-            print(f"Cleared {TRADE_FILE}")
+        with _portfolio_lock:
+            trade_data = open_positions.pop(symbol, None)
+            if trade_data is not None:
+                old_state = get_trade_state()
+                state = _portfolio_state()
+                try:
+                    get_state_store().delete_trade(symbol, state)
+                except Exception:
+                    open_positions[symbol] = trade_data
+                    raise
+                _announce_state_change(old_state, state)
+                print(f"Cleared {symbol} from {STATE_DB_FILE}")
     except Exception as e:
         print(f"Error clearing trade: {e}")
         raise
 
+def pending_reentry(symbol):
+    """The stored re-entry order for symbol while it has not filled, else None"""
+    with _portfolio_lock:
+        trade = open_positions.get(symbol)
+        return dict(trade) if trade and trade.get('status') == 'pending' else None
+
+def portfolio_exposure():
+    """Total entry notional of all open trades and pending re-entry orders in USDT"""
+    with _portfolio_lock:
+        return sum(trade.get('notional') or TRADE_AMOUNT_USDT for trade in open_positions.values())
+
+def can_open_position(symbol):
+    """Check the portfolio limits, returning (allowed, reason)"""
+    with _portfolio_lock:
+        if symbol in open_positions:
+            return False, "re-entry order pending" if pending_reentry(symbol) else "position already open"
+        if len(open_positions) >= MAX_OPEN_POSITIONS:
+            return False, f"max open positions ({MAX_OPEN_POSITIONS}) reached"
+        if portfolio_exposure() + TRADE_AMOUNT_USDT > MAX_EXPOSURE_USDT:
+            return False, f"exposure limit ({MAX_EXPOSURE_USDT} USDT) reached"
+        return True, None
+
+def _portfolio_state():
+    """MANAGE while the portfolio is full, ENTRY while it has room"""
+    with _portfolio_lock:
+        full = len(open_positions) >= MAX_OPEN_POSITIONS or \
+            portfolio_exposure() + TRADE_AMOUNT_USDT > MAX_EXPOSURE_USDT
+        return "MANAGE" if full else "ENTRY"
+
+def update_trade_state():
+    """Set MANAGE while the portfolio is full and ENTRY while it has room"""
+    with _portfolio_lock:
+        set_trade_state(_portfolio_state())
+
+def _run_position_monitor(trade_data):
+    try:
+        monitor_trade(
+            symbol=trade_data['symbol'],
+            entry_price=trade_data['entry_price'],
+            sl_price=trade_data['sl_price'],
+            tp_price=trade_data['tp_price'],
+            side=trade_data['side']
+        )
+    finally:
+        with _portfolio_lock:
+            _position_monitors.pop(trade_data['symbol'], None)
+
+def start_position_monitor(symbol):
+    """Monitor an open trade on its own thread while scanning continues"""
+    if _one_shot_run:
+        # run_once checks every open trade itself on the next run
+        return
+    with _portfolio_lock:
+        monitor = _position_monitors.get(symbol)
+        if monitor is not None and monitor.is_alive():
+            return
+        monitor = threading.Thread(
+            target=_run_position_monitor,
+            args=(dict(open_positions[symbol]),),
+            name=f"monitor-{symbol}",
+            daemon=True
+        )
+        _position_monitors[symbol] = monitor
+    monitor.start()
+
 
 
 
 
 def initialize_trade_state():
-    """Create file with 'ENTRY' if it doesn't exist"""
-    if not os.path.exists(TRADE_STATE_FILE):
-        with open(TRADE_STATE_FILE, 'w') as f:
-            f.write("ENTRY")
+    """Open the state store, which starts in 'ENTRY'"""
+    get_state_store()
 
 def get_trade_state():
     """Read the current trade state"""
-    try:
-        with open(TRADE_STATE_FILE, 'r') as f:
-            return f.read().strip().upper()
-    except:
-        return "ENTRY"  # Default to ENTRY if error occurs
+    return get_state_store().state
 
-def set_trade_state(state):
-
-    """Enhanced with email notifications"""
-    old_state = get_trade_state()
+def _announce_state_change(old_state, state):
     if old_state != state:
         send_email(
             subject=f"🔄 Trade State Changed to {state}",
             body=f"Trading is now {'PAUSED' if state == 'MANAGE' else 'ACTIVE'}"
         )
-    """Update the trade state (ENTRY/MANAGE)"""
-    valid_states = ["ENTRY", "MANAGE"]
-    if state.upper() in valid_states:
-        with open(TRADE_STATE_FILE, 'w') as f:
-            f.write(state.upper())
-    else:
-        print(f"Invalid state: {state}. Must be 'ENTRY' or 'MANAGE'")
 
+def set_trade_state(state):
+    """Update the trade state (ENTRY/MANAGE), emailing when it changes"""
+    state = state.upper()
+    if state not in ("ENTRY", "MANAGE"):
+        print(f"Invalid state: {state}. Must be 'ENTRY' or 'MANAGE'")
+        return
+    with _portfolio_lock:
+        old_state = get_trade_state()
+        if old_state != state:
+            get_state_store().set_state(state)
+        _announce_state_change(old_state, state)
+
+def get_active_trades():
+    """Load saved trades into the portfolio, dropping ones whose position is no longer open"""
+    try:
+        trades = get_state_store().load_trades()
+        with _portfolio_lock:
+            open_positions.update(trades)
+
+        # Verify the trades still exist
+        for symbol, trade in trades.items():
+            bybit_symbol = symbol_mapping.get(symbol) or trade.get('bybit_symbol')
+            if not bybit_symbol:
+                # Without a Bybit symbol there is no telling whether the position is still open
+                report_unmapped_trade(symbol)
+                continue
+            if symbol not in symbol_mapping:
+                # Keep managing trades on symbols the current mapping no longer lists
+                symbol_mapping[symbol] = bybit_symbol
+                symbol_mapping_inv[bybit_symbol] = symbol
+            if trade.get('status') == 'pending':
+                # Re-entry orders have no position yet, their monitor follows the order
+                continue
+            if not get_open_position(bybit_symbol):
+                clear_active_trade(symbol)
+    except Exception as e:
+        print(f"Error loading trade data: {e}")
+    with _portfolio_lock:
+        return dict(open_positions)
+
+def report_unmapped_trade(symbol):
+    """Warn about a stored trade that has no Bybit symbol, leaving it in place"""
+    print(f"No Bybit symbol mapping for stored trade {symbol}, keeping it unmonitored")
+    send_email(
+        subject=f"⚠️ {symbol} Trade Not Monitored",
+        body=f"The stored trade on {symbol} has no Bybit symbol mapping.\n"
+             f"It was kept in {STATE_DB_FILE} but is not monitored; check the position on Bybit."
+    )
+
+# ======================== Notifications ========================
+
+# Emails are queued here and delivered by a background worker
+_email_queue = queue.Queue(maxsize=EMAIL_QUEUE_SIZE)
+_email_worker = None
+_email_worker_lock = threading.Lock()
+_smtp_connection = None
 
+def send_email(subject, body):
+    """Queue an email without blocking the trading path"""
+    global _email_worker
+    with _email_worker_lock:
+        if _email_worker is None or not _email_worker.is_alive():
+            _email_worker = threading.Thread(target=_email_loop, name="email-worker", daemon=True)
+            _email_worker.start()
+    try:
+        _email_queue.put_nowait((subject, body))
+    except queue.Full:
+        print(f"Email queue full, dropped: {subject}")
+
+def _smtp():
+    """Reuse the open SMTP connection, reconnecting when the server dropped it"""
+    global _smtp_connection
+    if _smtp_connection is not None:
+        try:
+            if _smtp_connection.noop()[0] == 250:
+                return _smtp_connection
+        except Exception:
+            pass
+        _close_smtp()
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    if SMTP_USE_TLS:
+        server.starttls()
+    if password:
+        server.login(sender, password)
+    _smtp_connection = server
+    return server
 
+def _close_smtp():
+    global _smtp_connection
+    if _smtp_connection is not None:
+        try:
+            _smtp_connection.quit()
+        except Exception:
+            pass
+        _smtp_connection = None
+
+def _deliver_email(subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ", ".join(recipients)
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    for attempt in range(2):
+        try:
+            with stage_timer("email.deliver"):
+                _smtp().sendmail(sender, recipients, msg.as_string())
+            print("Email sent successfully!")
+            return
+        except Exception as e:
+            # A pooled connection can go stale between checks, retry once on a fresh one
+            _close_smtp()
+            if attempt == 1:
+                print(f"Failed to send email: {str(e)}")
 
+def _email_loop():
+    """Deliver queued emails, folding bursts into a single digest"""
+    while True:
+        try:
+            # Keep the connection for the next batch, but not while nothing is being sent
+            idle = SMTP_IDLE_TIMEOUT if _smtp_connection is not None else None
+            batch = [_email_queue.get(timeout=clock.real_seconds(idle))]
+        except queue.Empty:
+            _close_smtp()
+            continue
+        while True:
+            try:
+                batch.append(_email_queue.get_nowait())
+            except queue.Empty:
+                break
 
-def get_active_trade():
-    """Check for existing active trade"""
-    if os.path.exists(TRADE_FILE):
         try:
-            with open(TRADE_FILE, 'r') as f:
-                trade_data = json.load(f)
-            
-            # Verify the trade still exists
-            position = get_open_position(symbol_mapping.get(trade_data['symbol']))
-            if position:
-                return trade_data
+            if len(batch) > EMAIL_DIGEST_THRESHOLD:
+                _deliver_email(
+                    subject=f"📬 {len(batch)} notifications",
+                    body="\n\n".join(f"{subject}\n{body}" for subject, body in batch)
+                )
             else:
-                clear_active_trade()
-        except Exception as e:
-            print(f"Error loading trade data: {e}")
-            clear_active_trade()
-    return None
+                for subject, body in batch:
+                    _deliver_email(subject, body)
+        finally:
+            for _ in batch:
+                _email_queue.task_done()
 
-def send_email(subject, body):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender
-        msg['To'] = ", ".join(recipients)
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
+        # Let the next burst pile up so it goes out as one digest
+        clock.sleep(EMAIL_BATCH_WINDOW)
 
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender, password)
-        server.sendmail(sender, recipients, msg.as_string())
-        server.quit()
-        print("Email sent successfully!")
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+def flush_emails(timeout=30):
+    """Wait for queued emails to be delivered, e.g. before exiting"""
+    deadline = time.time() + timeout
+    while _email_queue.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.1)
+
+# ======================== Indicators ========================
 
 def gauss(x, h):
     """Gaussian window function for band calculation"""
     return np.exp(-(x ** 2) / (h ** 2 * 2))
 
+def nwe_kernel_radius(h):
+    """Bars beyond which the Gaussian weight is below NWE_TRUNCATION_TOL"""
+    return int(np.ceil(h * np.sqrt(-2.0 * np.log(NWE_TRUNCATION_TOL))))
+
+def get_nwe_kernel(n, h):
+    """Cached truncated Gaussian kernel and per-bar weight sums for (n, h)"""
+    key = (n, float(h))
+    kernel = _nwe_kernel_cache.get(key)
+    if kernel is None:
+        radius = min(nwe_kernel_radius(h), max(n - 1, 0))
+        weights = gauss(np.arange(-radius, radius + 1, dtype=float), h)
+        # Sum of weights seen by each bar (edge bars see a one-sided window)
+        den = np.convolve(np.ones(n), weights)[radius:radius + n]
+        # Non-repaint weights are anchored on the first bar of the window
+        coefs = gauss(np.arange(n, dtype=float), h)
+        kernel = {'radius': radius, 'weights': weights, 'den': den, 'coefs': coefs}
+        _nwe_kernel_cache[key] = kernel
+    return kernel
+
+def _nwe_numerator(src, kernel, start, stop):
+    """Weighted sums of src for bars [start, stop) using the truncated kernel"""
+    n = len(src)
+    radius = kernel['radius']
+    seg_lo = max(0, start - radius)
+    seg_hi = min(n, stop + radius)
+    full = np.convolve(src[seg_lo:seg_hi], kernel['weights'])
+    offset = radius - seg_lo
+    return full[start + offset:stop + offset]
+
+def _nwe_bands(src, out, mult, repaint):
+    """Apply the mean-absolute-error envelope around the NWE line"""
+    if not repaint:
+        mae = pd.Series(np.abs(src - out)).rolling(499).mean().values * mult
+    else:
+        mae = (np.sum(np.abs(src - out)) / len(src)) * mult
+    return out + mae, out - mae
+
 def calculate_nwe(src, h, mult, repaint):
     """Calculate Nadaraya-Watson Envelope"""
+    src = np.asarray(src, dtype=float)
+    n = len(src)
+    kernel = get_nwe_kernel(n, h)
+
+    if not repaint:
+        coefs = kernel['coefs']
+        out = np.full(n, np.sum(src * coefs) / np.sum(coefs))
+    else:
+        out = _nwe_numerator(src, kernel, 0, n) / kernel['den']
+
+    upper, lower = _nwe_bands(src, out, mult, repaint)
+    return out, upper, lower
+
+def calculate_nwe_incremental(key, src, h, mult, repaint):
+    """Calculate NWE reusing the previous result for the same series key
+
+    Only the bars whose kernel window saw a changed close are recomputed:
+    the tail when the forming candle ticks, and both edges when the window
+    slides forward by one closed candle.
+    """
+    src = np.array(src, dtype=float)
+    n = len(src)
+    state = _nwe_state.get(key)
+    if not repaint or state is None or state['n'] != n or state['h'] != h:
+        out, upper, lower = calculate_nwe(src, h, mult, repaint)
+        if repaint:
+            _nwe_state[key] = {'n': n, 'h': h, 'src': src, 'num': out * get_nwe_kernel(n, h)['den']}
+        return out, upper, lower
+
+    kernel = get_nwe_kernel(n, h)
+    radius = kernel['radius']
+    prev_src = state['src']
+    num = state['num']
+
+    if np.array_equal(src[:-1], prev_src[:-1]):
+        # Same window, only the forming candle moved
+        if src[-1] != prev_src[-1]:
+            start = max(0, n - 1 - radius)
+            num[start:] = _nwe_numerator(src, kernel, start, n)
+    elif n > 1 and np.array_equal(src[:-2], prev_src[1:-1]):
+        # Window slid by one candle: interior sums are unchanged, only shifted
+        num = np.empty(n)
+        num[:-1] = state['num'][1:]
+        head = min(n, radius + 1)
+        tail = max(0, n - 2 - radius)
+        num[:head] = _nwe_numerator(src, kernel, 0, head)
+        num[tail:] = _nwe_numerator(src, kernel, tail, n)
+    else:
+        num = _nwe_numerator(src, kernel, 0, n)
+
+    state['src'] = src
+    state['num'] = num
+    out = num / kernel['den']
+    upper, lower = _nwe_bands(src, out, mult, repaint)
+    return out, upper, lower
+
+def _calculate_nwe_loop(src, h, mult, repaint):
+    """Reference O(n^2) NWE implementation, kept for benchmarks"""
     n = len(src)
     out = np.zeros(n)
     mae = np.zeros(n)
@@ -764,12 +1354,524 @@ def calculate_nwe(src, h, mult, repaint):
     
     return out, upper, lower
 
+# ======================== Indicator Pipeline ========================
+
+OHLCV_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+EMA_BLOCK = 64  # Bars per closed-form EMA block
+
+# Block weights keyed by (span, block) and per-thread indicator buffers
+_ema_block_cache = {}
+_pipeline_buffers = threading.local()
+
+def _ema_block_weights(span, block):
+    """Weights mapping a block of inputs to its EMA values, and the carry decay"""
+    key = (span, block)
+    weights = _ema_block_cache.get(key)
+    if weights is None:
+        alpha = 2 / (span + 1)
+        lags = np.arange(block)
+        lag = lags[None, :] - lags[:, None]
+        # matrix[j, k] is the weight of input j in output k of the same block
+        matrix = np.where(lag >= 0, alpha * (1 - alpha) ** np.maximum(lag, 0), 0.0)
+        weights = (matrix, (1 - alpha) ** (lags + 1))
+        _ema_block_cache[key] = weights
+    return weights
+
+def ema_into(values, span, out=None, block=EMA_BLOCK):
+    """EMA along the last axis matching pandas ewm(span=span, adjust=False)
+
+    Each block of bars is a closed-form weighted sum of its inputs plus the
+    decayed EMA carried in from the previous block, so Python only loops
+    once per block. Accepts 2-D (series x bars) input.
+    """
+    values = np.asarray(values, dtype=float)
+    if out is None:
+        out = np.empty_like(values)
+    n = values.shape[-1]
+    if n == 0:
+        return out
+    matrix, carry_decay = _ema_block_weights(span, block)
+    # Seeding the carry with the first input makes the first output equal it
+    carry = values[..., 0]
+    for start in range(0, n, block):
+        width = min(block, n - start)
+        chunk = out[..., start:start + width]
+        np.matmul(values[..., start:start + width], matrix[:width, :width], out=chunk)
+        chunk += carry[..., None] * carry_decay[:width]
+        carry = chunk[..., -1]
+    return out
+
+def true_range(high, low, close, out=None):
+    """True range per bar, high - low on the first bar"""
+    out = np.subtract(high, low, out=out)
+    prev_close = close[:-1]
+    np.maximum(out[1:], np.abs(high[1:] - prev_close), out=out[1:])
+    np.maximum(out[1:], np.abs(low[1:] - prev_close), out=out[1:])
+    return out
+
+def atr_array(high, low, close, length=14, out=None):
+    """Rolling-mean ATR, NaN until `length` bars are available"""
+    out = true_range(high, low, close, out=out)
+    sums = np.cumsum(out)
+    out[:length - 1] = np.nan
+    if len(out) >= length:
+        out[length:] = sums[length:] - sums[:-length]
+        out[length - 1] = sums[length - 1]
+        out[length - 1:] /= length
+    return out
+
+def aggregate_candles(rows, period_ms, with_index=False):
+    """Merge OHLCV rows (oldest first) into candles of period_ms
+
+    Candles are keyed by their period start, so the last one may be
+    partial when the rows stop mid-period. with_index also returns the
+    candle each input row went into, ready for align_by_index.
+    """
+    rows = np.asarray(rows, dtype=float)
+    if not len(rows):
+        empty = rows.reshape(0, 6)
+        return (empty, np.empty(0, dtype=int)) if with_index else empty
+    keys = rows[:, 0] // period_ms * period_ms
+    first = np.concatenate(([True], keys[1:] != keys[:-1]))
+    starts = np.flatnonzero(first)
+    ends = np.concatenate((starts[1:], [len(rows)])) - 1
+    candles = np.column_stack((
+        keys[starts], rows[starts, 1],
+        np.maximum.reduceat(rows[:, 2], starts), np.minimum.reduceat(rows[:, 3], starts),
+        rows[ends, 4], np.add.reduceat(rows[:, 5], starts)
+    ))
+    if with_index:
+        return candles, np.cumsum(first) - 1
+    return candles
+
+def align_to_base(base_ts, htf_ts, htf_values, out=None):
+    """Higher-timeframe value of the last bar opened at or before each base bar
+
+    Same as reindexing a forward-filled resample of the higher timeframe:
+    NaN before its first bar and after its last bar opened. htf_values may
+    be 2-D with one row per series sharing the same timestamps.
+    """
+    htf_values = np.asarray(htf_values, dtype=float)
+    if len(htf_ts) == 0:
+        out = np.empty(htf_values.shape[:-1] + (len(base_ts),)) if out is None else out
+        out[:] = np.nan
+        return out
+    idx = np.searchsorted(htf_ts, base_ts, side='right') - 1
+    out = np.take(htf_values, np.maximum(idx, 0), axis=-1, out=out)
+    out[..., (idx < 0) | (base_ts > htf_ts[-1])] = np.nan
+    return out
+
+def align_by_index(htf_values, htf_index, out=None):
+    """align_to_base with the higher-timeframe row of each base bar already known
+
+    htf_index comes from aggregate_candles, -1 marking base bars that have
+    no higher-timeframe value.
+    """
+    out = np.take(htf_values, np.maximum(htf_index, 0), axis=-1, out=out)
+    out[..., htf_index < 0] = np.nan
+    return out
+
+def live_htf_index(htf_index):
+    """htf_index with -1 on the base bars the live scan sees no higher-timeframe value for
+
+    When a base bar closes, the higher-timeframe candle holding the next
+    bar is forming, and get_signal_candles gives no value to the base bars
+    after that candle opened: every bar that is neither the first nor the
+    last of its higher-timeframe candle.
+    """
+    htf_index = np.array(htf_index)
+    inside = np.zeros(len(htf_index), dtype=bool)
+    inside[1:-1] = (htf_index[1:-1] == htf_index[:-2]) & (htf_index[1:-1] == htf_index[2:])
+    htf_index[inside] = -1
+    return htf_index
+
+def _signal_buffers(n):
+    """Reusable (4, n) buffer for the fast, slow, trend and 1h trend EMAs"""
+    buffers = getattr(_pipeline_buffers, 'signal', None)
+    if buffers is None or buffers.shape[1] != n:
+        buffers = _pipeline_buffers.signal = np.empty((4, n))
+    return buffers
+
+def entry_signal_row(candles_15m, candles_1h, htf_index=None):
+    """Last closed 15m candle with its EMAs and entry arrows, as a dict
+
+    Works straight on the OHLCV rows; the only per-symbol allocations are
+    the two candle arrays and the crossover masks. Pass htf_index from
+    get_signal_candles to skip the timestamp search.
+    """
+    base = np.asarray(candles_15m, dtype=float)
+    htf = np.asarray(candles_1h, dtype=float)
+    close = np.ascontiguousarray(base[:, 4])
+    fast, slow, trend, trend_1h = _signal_buffers(len(base))
+
+    ema_into(close, ema_fast_length, out=fast)
+    ema_into(close, ema_slow_length, out=slow)
+    ema_into(close, ema_trend_length, out=trend)
+    htf_trend = ema_into(htf[:, 4], ema_trend_length) if len(htf) else htf[:, 4]
+    if htf_index is None:
+        align_to_base(base[:, 0], htf[:, 0], htf_trend, out=trend_1h)
+    else:
+        align_by_index(htf_trend, htf_index, out=trend_1h)
+
+    first_up, first_down = entry_arrows(close, fast, slow, trend, trend_1h)
+    return _signal_row(base[-2], fast[-2], slow[-2], trend[-2], trend_1h[-2], first_up[-2], first_down[-2])
+
+def _signal_row(candle, fast, slow, trend, trend_1h, first_up, first_down):
+    row = dict(zip(OHLCV_COLUMNS, candle.tolist()))
+    row['timestamp'] = int(row['timestamp'])
+    row.update(EMA_Fast=float(fast), EMA_Slow=float(slow), EMA_Trend=float(trend), EMA_Trend_1h=float(trend_1h),
+               First_Up_Arrow=bool(first_up), First_Down_Arrow=bool(first_down))
+    return row
+
+def entry_signal_rows(candles_15m, candles_1h, htf_indexes=None):
+    """entry_signal_row for many symbols at once
+
+    Symbols with the same candle counts are stacked into (symbols x bars)
+    arrays so every EMA, alignment and crossover mask is one vectorized
+    pass per group instead of one per symbol. Pass the float arrays of
+    get_signal_candles: stacking them is a copy, while rows given as lists
+    are converted here, and at 500 symbols x 500 bars that conversion
+    costs more than all the indicators.
+    """
+    rows = [None] * len(candles_15m)
+    groups = {}
+    for i, (base, htf) in enumerate(zip(candles_15m, candles_1h)):
+        groups.setdefault((len(base), len(htf)), []).append(i)
+
+    for members in groups.values():
+        base = np.array([candles_15m[i] for i in members], dtype=float).reshape(len(members), -1, 6)
+        htf = np.array([candles_1h[i] for i in members], dtype=float).reshape(len(members), -1, 6)
+        close = np.ascontiguousarray(base[:, :, 4])
+        fast = ema_into(close, ema_fast_length)
+        slow = ema_into(close, ema_slow_length)
+        trend = ema_into(close, ema_trend_length)
+        htf_trend = ema_into(np.ascontiguousarray(htf[:, :, 4]), ema_trend_length)
+
+        base_ts = base[:, :, 0]
+        htf_ts = htf[:, :, 0]
+        if htf_indexes is not None:
+            trend_1h = np.empty_like(close)
+            for k, i in enumerate(members):
+                align_by_index(htf_trend[k], htf_indexes[i], out=trend_1h[k])
+        elif (base_ts == base_ts[0]).all() and (htf_ts == htf_ts[0]).all():
+            # Same candle grid for the whole group, align every row in one go
+            trend_1h = align_to_base(base_ts[0], htf_ts[0], htf_trend)
+        else:
+            trend_1h = np.empty_like(close)
+            for k in range(len(members)):
+                align_to_base(base_ts[k], htf_ts[k], htf_trend[k], out=trend_1h[k])
+
+        first_up, first_down = entry_arrows(close, fast, slow, trend, trend_1h)
+        for k, i in enumerate(members):
+            rows[i] = _signal_row(base[k, -2], fast[k, -2], slow[k, -2], trend[k, -2], trend_1h[k, -2],
+                                  first_up[k, -2], first_down[k, -2])
+    return rows
+
+def _entry_signal_frames(candles_15m, candles_1h):
+    """Reference DataFrame implementation of entry_signal_row"""
+    df_15m = pd.DataFrame(candles_15m, columns=list(OHLCV_COLUMNS))
+    df_15m['timestamp'] = pd.to_datetime(df_15m['timestamp'], unit='ms')
+    df_15m.set_index('timestamp', inplace=True)
+
+    df_1h = pd.DataFrame(candles_1h, columns=list(OHLCV_COLUMNS))
+    df_1h['timestamp'] = pd.to_datetime(df_1h['timestamp'], unit='ms')
+    df_1h.set_index('timestamp', inplace=True)
+
+    df_15m['EMA_Fast'] = df_15m['close'].ewm(span=ema_fast_length, adjust=False).mean()
+    df_15m['EMA_Slow'] = df_15m['close'].ewm(span=ema_slow_length, adjust=False).mean()
+    df_15m['EMA_Trend'] = df_15m['close'].ewm(span=ema_trend_length, adjust=False).mean()
+    df_1h['EMA_Trend'] = df_1h['close'].ewm(span=ema_trend_length, adjust=False).mean()
+    df_15m['EMA_Trend_1h'] = df_1h['EMA_Trend'].resample('15min').ffill()
+
+    first_up, first_down = entry_arrows(
+        df_15m['close'].to_numpy(),
+        df_15m['EMA_Fast'].to_numpy(),
+        df_15m['EMA_Slow'].to_numpy(),
+        df_15m['EMA_Trend'].to_numpy(),
+        df_15m['EMA_Trend_1h'].to_numpy()
+    )
+    df_15m['First_Up_Arrow'] = first_up
+    df_15m['First_Down_Arrow'] = first_down
+    return df_15m.iloc[-2]
+
+# ======================== Indicator State ========================
+
+class StreamingEma:
+    """EMA fed one value at a time, matching ewm(span=span, adjust=False)"""
+
+    def __init__(self, span, value=None):
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.value = value
+
+    def peek(self, x):
+        """EMA if x were the next value, without consuming it"""
+        return x if self.value is None else (1 - self.alpha) * self.value + self.alpha * x
+
+    def update(self, x):
+        self.value = self.peek(x)
+        return self.value
+
+class StreamingAtr:
+    """Rolling-mean ATR fed one candle at a time, matching atr_array"""
+
+    def __init__(self, length=14):
+        self.length = length
+        self.prev_close = None
+        self.ranges = deque(maxlen=length)
+
+    @property
+    def value(self):
+        return sum(self.ranges) / self.length if len(self.ranges) == self.length else np.nan
+
+    def update(self, high, low, close):
+        if self.prev_close is None:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.ranges.append(true_range)
+        self.prev_close = close
+        return self.value
+
+def _rows_after(rows, timestamp):
+    """Index of the first OHLCV row newer than timestamp, scanning from the end"""
+    i = len(rows)
+    if timestamp is not None:
+        while i > 0 and rows[i - 1][0] > timestamp:
+            i -= 1
+    else:
+        i = 0
+    return i
+
+class SignalState:
+    """Running EMAs, ATR and armed entry side of one symbol's 15m candles
+
+    A closed candle is committed only once the 1h candle it falls in has
+    closed too, so committed values never change afterwards. Candles of the
+    running hour are replayed on a copy each scan with the forming 1h close,
+    the same values entry_signal_row sees.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.fast = StreamingEma(ema_fast_length)
+        self.slow = StreamingEma(ema_slow_length)
+        self.trend = StreamingEma(ema_trend_length)
+        self.trend_1h = StreamingEma(ema_trend_length)
+        self.atr = StreamingAtr()
+        self.last_ts = None
+        self.last_htf_ts = None
+        self.prev = None
+        self.armed = 0
+        self.last_row = None
+
+    def clone(self):
+        other = copy.copy(self)
+        other.fast, other.slow, other.trend, other.trend_1h = (
+            copy.copy(ema) for ema in (self.fast, self.slow, self.trend, self.trend_1h))
+        other.atr = copy.copy(self.atr)
+        other.atr.ranges = deque(self.atr.ranges, maxlen=self.atr.length)
+        return other
+
+    def _fold_htf(self, closed_htf, start, timestamp):
+        """Feed closed 1h candles opened at or before timestamp into the 1h EMA"""
+        while start < len(closed_htf) and closed_htf[start][0] <= timestamp:
+            self.trend_1h.update(closed_htf[start][4])
+            self.last_htf_ts = int(closed_htf[start][0])
+            start += 1
+        return start
+
+    def _step(self, candle, trend_1h):
+        """Advance by one closed candle, returning its signal row"""
+        timestamp, _, high, low, close, _ = candle
+        fast = self.fast.update(close)
+        slow = self.slow.update(close)
+        trend = self.trend.update(close)
+        self.atr.update(high, low, close)
+
+        first_up = first_down = False
+        if self.prev is not None:
+            prev_close, prev_fast, prev_slow = self.prev
+            above_trend = close > trend and close > trend_1h
+            below_trend = close < trend and close < trend_1h
+            if fast > slow and prev_fast <= prev_slow and above_trend:
+                self.armed = 1
+            elif fast < slow and prev_fast >= prev_slow and below_trend:
+                self.armed = -1
+
+            if self.armed == 1 and fast > slow and prev_close < prev_fast and close > fast and above_trend:
+                first_up = True
+                self.armed = 0
+            elif self.armed == -1 and fast < slow and prev_close > prev_fast and close < fast and below_trend:
+                first_down = True
+                self.armed = 0
+
+        self.prev = (close, fast, slow)
+        self.last_ts = int(timestamp)
+        row = dict(zip(OHLCV_COLUMNS, map(float, candle)))
+        row.update(timestamp=int(timestamp), EMA_Fast=fast, EMA_Slow=slow, EMA_Trend=trend,
+                   EMA_Trend_1h=float(trend_1h), First_Up_Arrow=first_up, First_Down_Arrow=first_down)
+        self.last_row = row
+        return row
+
+    def advance(self, candles_15m, candles_1h):
+        """Catch up with the latest candles and return the last closed candle's signal row"""
+        if self.last_ts is not None and (
+                not len(candles_15m) or candles_15m[0][0] > self.last_ts
+                or (self.last_htf_ts is not None and len(candles_1h) and candles_1h[0][0] > self.last_htf_ts)):
+            # The state fell behind the cached history, start over from what we have
+            self.reset()
+
+        closed = candles_15m[:-1]
+        closed_htf = candles_1h[:-1]
+        forming_htf_ts = candles_1h[-1][0] if len(candles_1h) else None
+        htf_index = _rows_after(closed_htf, self.last_htf_ts)
+
+        i = _rows_after(closed, self.last_ts)
+        while i < len(closed) and forming_htf_ts is not None and closed[i][0] < forming_htf_ts:
+            htf_index = self._fold_htf(closed_htf, htf_index, closed[i][0])
+            trend_1h = self.trend_1h.value
+            self._step(closed[i], np.nan if trend_1h is None else trend_1h)
+            i += 1
+
+        if i == len(closed):
+            return self.last_row
+
+        state = self.clone()
+        for candle in closed[i:]:
+            htf_index = state._fold_htf(closed_htf, htf_index, candle[0])
+            if forming_htf_ts is not None and candle[0] == forming_htf_ts:
+                trend_1h = state.trend_1h.peek(candles_1h[-1][4])
+            else:
+                trend_1h = np.nan
+            row = state._step(candle, trend_1h)
+        return row
+
+    def to_dict(self):
+        """JSON-serializable checkpoint of the state"""
+        return {
+            'fast': self.fast.value,
+            'slow': self.slow.value,
+            'trend': self.trend.value,
+            'trend_1h': self.trend_1h.value,
+            'atr_ranges': list(self.atr.ranges),
+            'atr_prev_close': self.atr.prev_close,
+            'last_ts': self.last_ts,
+            'last_htf_ts': self.last_htf_ts,
+            'prev': list(self.prev) if self.prev else None,
+            'armed': self.armed,
+            'last_row': self.last_row
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a state written by to_dict"""
+        state = cls()
+        state.fast.value = data['fast']
+        state.slow.value = data['slow']
+        state.trend.value = data['trend']
+        state.trend_1h.value = data['trend_1h']
+        state.atr.ranges.extend(data['atr_ranges'])
+        state.atr.prev_close = data['atr_prev_close']
+        state.last_ts = data['last_ts']
+        state.last_htf_ts = data['last_htf_ts']
+        state.prev = tuple(data['prev']) if data['prev'] else None
+        state.armed = data['armed']
+        state.last_row = data['last_row']
+        return state
+
+# SignalState per symbol for the 15m scan
+_indicator_states = {}
+_indicator_states_lock = threading.Lock()
+
+def get_signal_state(symbol):
+    """The symbol's SignalState, created empty on first use"""
+    with _indicator_states_lock:
+        state = _indicator_states.get(symbol)
+        if state is None:
+            state = _indicator_states[symbol] = SignalState()
+        return state
+
+def save_indicator_states(path=INDICATOR_STATE_FILE):
+    """Checkpoint every SignalState so a restart does not replay history"""
+    with _indicator_states_lock:
+        data = {symbol: state.to_dict() for symbol, state in _indicator_states.items()}
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving indicator state: {e}")
+
+def load_indicator_states(path=INDICATOR_STATE_FILE):
+    """Restore the checkpoint written by save_indicator_states"""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        states = {symbol: SignalState.from_dict(state) for symbol, state in data.items()}
+        with _indicator_states_lock:
+            _indicator_states.update(states)
+        print(f"Loaded indicator state for {len(states)} symbols from {path}")
+    except Exception as e:
+        print(f"Error loading indicator state: {e}")
+
+# ======================== Bybit Snapshots ========================
+
+# Bulk ticker/position/instrument lists indexed by symbol, refreshed after a TTL
+_snapshots = {name: {'data': {}, 'fetched_at': 0.0, 'lock': threading.Lock()}
+              for name in SNAPSHOT_TTL}
+
+def _fetch_pages(method, **params):
+    """Collect every page of a cursor-paginated Bybit list endpoint"""
+    rows = []
+    cursor = None
+    while True:
+        if cursor:
+            params['cursor'] = cursor
+        response = method(**params)
+        if response["retCode"] != 0:
+            raise Exception(response["retMsg"])
+        rows.extend(response["result"]["list"])
+        cursor = response["result"].get("nextPageCursor")
+        if not cursor:
+            return rows
+
+def _load_snapshot(name):
+    """Fetch one snapshot in bulk, indexed by symbol"""
+    if name == 'tickers':
+        rows = _fetch_pages(session.get_tickers, category="linear")
+    elif name == 'positions':
+        rows = _fetch_pages(session.get_positions, category="linear", settleCoin="USDT", limit=200)
+        rows = [row for row in rows if float(row["size"]) > 0]
+    else:
+        rows = _fetch_pages(session.get_instruments_info, category="linear", limit=1000)
+    return {row["symbol"]: row for row in rows}
+
+def get_snapshot(name, force=False):
+    """Get the 'tickers', 'positions' or 'instruments' snapshot, refreshing it when stale"""
+    snapshot = _snapshots[name]
+    with snapshot['lock']:
+        if force or clock.time() - snapshot['fetched_at'] > SNAPSHOT_TTL[name]:
+            snapshot['data'] = _load_snapshot(name)
+            snapshot['fetched_at'] = clock.time()
+        return snapshot['data']
+
+def invalidate_snapshot(name):
+    """Force the next read of a snapshot to hit the exchange"""
+    with _snapshots[name]['lock']:
+        _snapshots[name]['fetched_at'] = 0.0
+
 def get_market_price(symbol):
     """Fetch current market price from Bybit"""
     try:
-        ticker = session.get_tickers(category="linear", symbol=symbol)
-        if ticker["retCode"] == 0 and ticker["result"]["list"]:
-            return float(ticker["result"]["list"][0]["lastPrice"])
+        ticker = get_snapshot('tickers').get(symbol)
+        if ticker and ticker.get("lastPrice"):
+            return float(ticker["lastPrice"])
         raise Exception("No price data returned")
     except Exception as e:
         raise Exception(f"Failed to fetch market price: {str(e)}")
@@ -777,29 +1879,208 @@ def get_market_price(symbol):
 def get_lot_size_rules(symbol):
     """Get trading rules for symbol"""
     try:
-        instrument_info = session.get_instruments_info(category="linear", symbol=symbol)
-        if instrument_info["retCode"] == 0 and instrument_info["result"]["list"]:
-            return instrument_info["result"]["list"][0]["lotSizeFilter"]
+        instrument = get_snapshot('instruments').get(symbol)
+        if instrument:
+            return instrument["lotSizeFilter"]
         raise Exception("No instrument info returned")
     except Exception as e:
         raise Exception(f"Failed to fetch lot size rules: {str(e)}")
 
+def get_price_rules(symbol):
+    """Get tick size rules for symbol"""
+    try:
+        instrument = get_snapshot('instruments').get(symbol)
+        if instrument:
+            return instrument["priceFilter"]
+        raise Exception("No instrument info returned")
+    except Exception as e:
+        raise Exception(f"Failed to fetch price rules: {str(e)}")
+
+def _round_to_step(value, step, rounding=ROUND_HALF_EVEN):
+    """Round a Decimal to a whole number of steps"""
+    return (value / step).to_integral_value(rounding=rounding) * step
+
 def adjust_quantity_to_lot_size(quantity, lot_size_rules):
     """Adjust quantity to comply with exchange rules"""
     try:
-        min_order_qty = float(lot_size_rules["minOrderQty"])
-        max_order_qty = float(lot_size_rules["maxOrderQty"])
-        qty_step = float(lot_size_rules["qtyStep"])
-
-        quantity = max(min_order_qty, min(quantity, max_order_qty))
-        quantity = round(quantity / qty_step) * qty_step
+        min_order_qty = Decimal(lot_size_rules["minOrderQty"])
+        max_order_qty = Decimal(lot_size_rules["maxOrderQty"])
+        qty_step = Decimal(lot_size_rules["qtyStep"])
+
+        quantity = max(min_order_qty, min(Decimal(str(quantity)), max_order_qty))
+        quantity = _round_to_step(quantity, qty_step)
+        if quantity > max_order_qty:
+            quantity = _round_to_step(max_order_qty, qty_step, ROUND_FLOOR)
         return max(quantity, min_order_qty)
     except Exception as e:
         raise Exception(f"Failed to adjust quantity: {str(e)}")
 
+def adjust_price_to_tick(price, price_rules):
+    """Round price to the nearest valid tick"""
+    try:
+        tick_size = Decimal(price_rules["tickSize"])
+        return _round_to_step(Decimal(str(price)), tick_size)
+    except Exception as e:
+        raise Exception(f"Failed to adjust price: {str(e)}")
+
+def load_instrument_registry(path=INSTRUMENT_CACHE_FILE):
+    """Seed the instrument snapshot from disk, fetching it if missing or expired"""
+    snapshot = _snapshots['instruments']
+    try:
+        with open(path, 'r') as f:
+            cached = json.load(f)
+        if clock.time() - cached['fetched_at'] < INSTRUMENT_CACHE_TTL:
+            with snapshot['lock']:
+                snapshot['data'] = cached['instruments']
+                snapshot['fetched_at'] = cached['fetched_at']
+            print(f"Loaded {len(cached['instruments'])} instruments from {path}")
+            return
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading instrument cache: {e}")
+    refresh_instrument_registry(path)
+
+def refresh_instrument_registry(path=INSTRUMENT_CACHE_FILE):
+    """Re-fetch all linear instruments and write them to the disk cache"""
+    try:
+        instruments = get_snapshot('instruments', force=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'fetched_at': _snapshots['instruments']['fetched_at'], 'instruments': instruments}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error refreshing instruments: {e}")
+
+def start_instrument_refresher(interval=INSTRUMENT_REFRESH_SECONDS):
+    """Refresh instrument info in the background so orders never wait on it"""
+    def refresh_loop():
+        while True:
+            clock.sleep(interval)
+            refresh_instrument_registry()
+
+    threading.Thread(target=refresh_loop, name="instrument-refresher", daemon=True).start()
+
+_market_cache = {'markets': None}
+
+def _exchange_pending():
+    """Whether the default scan exchange has not been built yet"""
+    return isinstance(exchange, LazyClient) and exchange._client is None
+
+def load_market_cache(path=MARKET_CACHE_FILE):
+    """Scan exchange markets from disk, downloading them if missing or expired
+
+    Cached markets are handed to ccxt with set_markets, on first use if the
+    exchange has not been built yet, so a warm start does not import ccxt.
+    """
+    if not _exchange_pending() and exchange.markets:
+        return exchange.markets
+    if _market_cache['markets'] is None:
+        try:
+            with open(path, 'r') as f:
+                cached = json.load(f)
+            if clock.time() - cached['fetched_at'] < MARKET_CACHE_TTL:
+                _market_cache['markets'] = cached['markets']
+                print(f"Loaded {len(cached['markets'])} markets from {path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading market cache: {e}")
+
+    markets = _market_cache['markets']
+    if markets is not None:
+        if not _exchange_pending():
+            exchange.set_markets(markets)
+        return markets
+
+    markets = exchange.load_markets()
+    _market_cache['markets'] = markets
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'fetched_at': clock.time(), 'markets': markets}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving market cache: {e}")
+    return markets
+
+def resolve_symbol_mapping(markets, instruments):
+    """Map active ccxt linear swaps to the Bybit perpetual with the same base and settle coin"""
+    perpetuals = {(row.get("baseCoin"), row.get("settleCoin")): name for name, row in instruments.items()
+                  if row.get("contractType") == "LinearPerpetual" and row.get("status", "Trading") == "Trading"}
+    mapping = {}
+    for symbol, market in markets.items():
+        if not (market.get('swap') and market.get('linear')) or market.get('active') is False:
+            continue
+        bybit_symbol = perpetuals.get((market.get('base'), market.get('settle')))
+        if bybit_symbol:
+            mapping[symbol] = bybit_symbol
+    return dict(sorted(mapping.items()))
+
+def save_symbol_mapping(mapping, path=SYMBOL_MAPPING_FILE):
+    """Write the mapping to disk as the fallback for a failed resolve"""
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'saved_at': clock.time(), 'mapping': mapping}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving symbol mapping: {e}")
+
+def load_symbol_mapping(path=SYMBOL_MAPPING_FILE):
+    """Fill symbol_mapping, symbols and symbol_mapping_inv in place from both exchanges' market lists
+
+    Both lists come from their disk caches when fresh, so a warm start
+    makes no requests. On failure the current mapping is kept, or the last
+    one saved to path if there is none yet.
+    """
+    try:
+        with stage_timer("startup.symbol_mapping"):
+            markets = load_market_cache()
+            if not _snapshots['instruments']['data']:
+                load_instrument_registry()
+            mapping = resolve_symbol_mapping(markets, get_snapshot('instruments'))
+        if not mapping:
+            raise Exception("no symbols are listed on both exchanges")
+        save_symbol_mapping(mapping, path)
+    except Exception as e:
+        print(f"Error resolving symbol mapping: {e}")
+        if symbol_mapping:
+            return symbol_mapping
+        try:
+            with open(path, 'r') as f:
+                mapping = json.load(f)['mapping']
+            print(f"Using the symbol mapping saved in {path}")
+        except FileNotFoundError:
+            return symbol_mapping
+        except Exception as e:
+            print(f"Error loading saved symbol mapping: {e}")
+            return symbol_mapping
+    symbol_mapping.clear()
+    symbol_mapping.update(mapping)
+    symbols[:] = list(mapping)
+    symbol_mapping_inv.clear()
+    symbol_mapping_inv.update({v: k for k, v in mapping.items()})
+    print(f"Mapped {len(mapping)} symbols")
+    return symbol_mapping
+
+def require_symbol_mapping():
+    """Load the symbol mapping if it is empty, refusing to go on without one
+
+    Stored trades are checked on Bybit through the mapping, so an empty one
+    would look like every position had been closed.
+    """
+    if not symbol_mapping:
+        load_symbol_mapping()
+    if not symbol_mapping:
+        raise Exception("Failed to load a symbol mapping, refusing to start without one")
+
 def get_open_position(symbol):
     """Check for existing position"""
     try:
+        # The bulk snapshot only covers USDT-settled contracts
+        if symbol and symbol.endswith("USDT"):
+            return get_snapshot('positions').get(symbol)
         positions = session.get_positions(category="linear", symbol=symbol)
         if positions["retCode"] == 0 and positions["result"]["list"]:
             for position in positions["result"]["list"]:
@@ -809,14 +2090,169 @@ def get_open_position(symbol):
     except Exception as e:
         raise Exception(f"Failed to check positions: {str(e)}")
 
+# ======================== Market Data Stream ========================
+
+# Latest Bybit WebSocket data per symbol, read directly by monitor_trade
+_stream_state = {'tickers': {}, 'positions': {}, 'klines': {}, 'updated': {'tickers': {}, 'klines': {}}}
+_stream_lock = threading.Lock()
+_stream_events = {}
+_stream_subscriptions = set()
+_public_ws = None
+_private_ws = None
+
+def _stream_event(symbol):
+    """Event set whenever new stream data for symbol arrives"""
+    with _stream_lock:
+        return _stream_events.setdefault(symbol, threading.Event())
+
+def _on_ticker_message(message):
+    data = message.get("data", {})
+    symbol = data.get("symbol")
+    if not symbol:
+        return
+    with _stream_lock:
+        # Deltas only carry the fields that changed
+        _stream_state['tickers'].setdefault(symbol, {}).update(data)
+        _stream_state['updated']['tickers'][symbol] = clock.time()
+    _stream_event(symbol).set()
+
+def _on_kline_message(message):
+    symbol = message.get("topic", "").split(".")[-1]
+    closed = False
+    with _stream_lock:
+        candles = _stream_state['klines'].get(symbol)
+        if candles is None:
+            return
+        for kline in message.get("data", []):
+            row = [int(kline["start"]), float(kline["open"]), float(kline["high"]),
+                   float(kline["low"]), float(kline["close"]), float(kline["volume"])]
+            while candles and candles[-1][0] >= row[0]:
+                candles.pop()
+            candles.append(row)
+            closed = closed or kline.get("confirm", False)
+        _stream_state['updated']['klines'][symbol] = clock.time()
+    if closed:
+        _stream_event(symbol).set()
+
+def _on_position_message(message):
+    touched = set()
+    with _stream_lock:
+        for position in message.get("data", []):
+            if position.get("category", "linear") != "linear":
+                continue
+            _stream_state['positions'][position["symbol"]] = position
+            touched.add(position["symbol"])
+    for symbol in touched:
+        _stream_event(symbol).set()
+
+def _fetch_bybit_candles(symbol, interval, count):
+    """Seed kline history from Bybit REST, oldest first"""
+    response = session.get_kline(category="linear", symbol=symbol, interval=interval, limit=count)
+    if response["retCode"] != 0:
+        raise Exception(f"Failed to fetch klines: {response['retMsg']}")
+    return [[int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5])]
+            for k in reversed(response["result"]["list"])]
+
+def start_market_stream(symbol):
+    """Subscribe to Bybit ticker, 15m kline and position updates for symbol"""
+    global _public_ws, _private_ws
+    if symbol in _stream_subscriptions:
+        return
+    try:
+        if _public_ws is None:
+            _public_ws = pybit_http.WebSocket(testnet=False, channel_type="linear")
+        if _private_ws is None:
+            _private_ws = pybit_http.WebSocket(
+                testnet=False,
+                demo=True,
+                channel_type="private",
+                api_key=os.getenv('BYBIT_API_KEY'),
+                api_secret=os.getenv('BYBIT_API_SECRET')
+            )
+            _private_ws.position_stream(callback=_on_position_message)
+
+        # The position stream only pushes changes, so seed it from REST
+        position = get_open_position(symbol)
+        candles = deque(_fetch_bybit_candles(symbol, "15", limit), maxlen=limit)
+        with _stream_lock:
+            _stream_state['klines'][symbol] = candles
+            _stream_state['updated']['klines'][symbol] = clock.time()
+            if position:
+                _stream_state['positions'][symbol] = position
+
+        _public_ws.ticker_stream(symbol=symbol, callback=_on_ticker_message)
+        _public_ws.kline_stream(interval=15, symbol=symbol, callback=_on_kline_message)
+        _stream_subscriptions.add(symbol)
+        print(f"Streaming market data for {symbol}")
+    except Exception as e:
+        print(f"Failed to start market stream for {symbol}: {e}")
+
+def _stream_fresh(symbol, ws, stream, max_age=STREAM_STALE_SECONDS):
+    """True when ws is connected and its `stream` ('tickers' or 'klines') for symbol updated recently
+
+    Each stream is checked on its own, a live ticker stream says nothing
+    about a kline stream that stopped.
+    """
+    if not USE_STREAMING or symbol not in _stream_subscriptions or ws is None:
+        return False
+    try:
+        if not ws.is_connected():
+            return False
+    except Exception:
+        return False
+    with _stream_lock:
+        updated = _stream_state['updated'][stream].get(symbol, 0)
+    return clock.time() - updated < max_age
+
+def read_market_price(symbol):
+    """Last price from the ticker stream, falling back to REST"""
+    if _stream_fresh(symbol, _public_ws, 'tickers'):
+        with _stream_lock:
+            last_price = _stream_state['tickers'].get(symbol, {}).get("lastPrice")
+        if last_price:
+            return float(last_price)
+    return get_market_price(symbol)
+
+def read_open_position(symbol):
+    """Open position from the private stream, falling back to REST"""
+    if USE_STREAMING and symbol in _stream_subscriptions and _private_ws is not None:
+        try:
+            connected = _private_ws.is_connected()
+        except Exception:
+            connected = False
+        if connected:
+            with _stream_lock:
+                position = _stream_state['positions'].get(symbol)
+            return position if position and float(position["size"]) > 0 else None
+    return get_open_position(symbol)
+
+def read_candles(symbol, bybit_symbol, timeframe, count):
+    """15m candles from the kline stream, falling back to the REST candle cache"""
+    if timeframe == timeframe_15m and _stream_fresh(bybit_symbol, _public_ws, 'klines', KLINE_STALE_SECONDS):
+        with _stream_lock:
+            candles = _stream_state['klines'].get(bybit_symbol)
+            if candles is not None and len(candles) >= count:
+                return [list(row) for row in list(candles)[-count:]]
+    # Ahead of the scan's fetches on the shared scan exchange budget
+    with request_priority(PRIORITY_MONITOR):
+        return get_candles(symbol, timeframe, limit=count)
+
+def wait_for_market_update(symbol, timeout=STREAM_WAIT_SECONDS):
+    """Block until the stream delivers new data for symbol or timeout passes"""
+    event = _stream_event(symbol)
+    event.wait(timeout)
+    event.clear()
+
 def update_stop_loss(symbol, new_sl_price):
     """Update stop-loss for open position"""
     try:
+        new_sl_price = adjust_price_to_tick(new_sl_price, get_price_rules(symbol))
         response = session.set_trading_stop(
             category="linear",
             symbol=symbol,
             stopLoss=str(new_sl_price)
         )
+        invalidate_snapshot('positions')
         if response["retCode"] == 0:
             print(f"Stop-loss updated to {new_sl_price} USDT")
             return True
@@ -827,7 +2263,7 @@ def update_stop_loss(symbol, new_sl_price):
         return False
 
 def close_position(symbol, side):
-    """Close position and place limit re-entry order"""
+    """Close the open position at market"""
     try:
         position = get_open_position(symbol)
         if not position:
@@ -843,53 +2279,10 @@ def close_position(symbol, side):
             qty=position["size"],
             reduceOnly=True
         )
+        invalidate_snapshot('positions')
 
         if response["retCode"] == 0:
             print(f"Position closed successfully")
-            set_trade_state("MANAGE")
-            
-            # Get current price and ATR levels
-            current_price = get_market_price(symbol)
-            ccxt_symbol = symbol_mapping_inv[symbol]
-            atr_levels = get_atr_levels(ccxt_symbol)
-            
-            # Place limit re-entry order
-            if side == "Buy":
-                limit_price = round(atr_levels['upper'], 4)
-                limit_side = "Buy"
-                print(f"Placing limit buy at {limit_price:.4f} (2xATR above exit)")
-            else:
-                limit_price = round(atr_levels['lower'], 4)
-                limit_side = "Sell"
-                print(f"Placing limit sell at {limit_price:.4f} (2xATR below exit)")
-            
-            # Calculate quantity (same as original trade)
-            raw_quantity = TRADE_AMOUNT_USDT / current_price
-            lot_size_rules = get_lot_size_rules(symbol)
-            adjusted_quantity = adjust_quantity_to_lot_size(raw_quantity, lot_size_rules)
-            
-            # Place limit order
-            limit_response = session.place_order(
-                category="linear",
-                symbol=symbol,
-                side=limit_side,
-                orderType="Limit",
-                qty=str(adjusted_quantity),
-                price=str(limit_price),
-                timeInForce="GTC"  # Good Till Cancelled
-            )
-            
-            if limit_response["retCode"] == 0:
-                send_email(
-                    subject=f"♻️ {symbol} Limit Order Placed",
-                    body=f"Placed {limit_side} limit at {limit_price:.4f}\n"
-                         f"ATR: {atr_levels['atr']:.4f}\n"
-                         f"Qty: {adjusted_quantity:.4f}\n"
-                         f"Original Exit: {current_price:.4f}"
-                )
-            else:
-                print(f"Failed to place limit order: {limit_response['retMsg']}")
-            
             return True
             
         print(f"Failed to close position: {response['retMsg']}")
@@ -898,11 +2291,123 @@ def close_position(symbol, side):
         print(f"Error closing position: {e}")
         return False
 
+def stop_prices(price, side, price_rules):
+    """Stop-loss and take-profit of a trade entered at price, rounded to the tick"""
+    if side == "Buy":
+        return (adjust_price_to_tick(price * (1 - STOP_LOSS_PERCENT / 100), price_rules),
+                adjust_price_to_tick(price * (1 + TAKE_PROFIT_PERCENT / 100), price_rules))
+    return (adjust_price_to_tick(price * (1 + STOP_LOSS_PERCENT / 100), price_rules),
+            adjust_price_to_tick(price * (1 - TAKE_PROFIT_PERCENT / 100), price_rules))
+
+def place_reentry_order(symbol, side):
+    """Place the GTC limit re-entry 2xATR beyond a closed trade's exit
+
+    The order replaces the trade in the portfolio as a pending trade sized
+    like a new one, so it counts against MAX_OPEN_POSITIONS and
+    MAX_EXPOSURE_USDT until check_reentry_order sees it fill or go away.
+    Returns the pending trade, or None if no order was placed.
+    """
+    bybit_symbol = symbol_mapping[symbol]
+    try:
+        atr_levels = get_atr_levels(symbol)
+        price_rules = get_price_rules(bybit_symbol)
+        if side == "Buy":
+            limit_price = adjust_price_to_tick(atr_levels['upper'], price_rules)  # 2xATR above
+        else:
+            limit_price = adjust_price_to_tick(atr_levels['lower'], price_rules)  # 2xATR below
+        quantity = adjust_quantity_to_lot_size(TRADE_AMOUNT_USDT / float(limit_price),
+                                               get_lot_size_rules(bybit_symbol))
+
+        response = session.place_order(
+            category="linear",
+            symbol=bybit_symbol,
+            side=side,
+            orderType="Limit",
+            qty=str(quantity),
+            price=str(limit_price),
+            timeInForce="GTC"  # Good Till Cancelled
+        )
+        if response["retCode"] != 0:
+            raise Exception(response["retMsg"])
+        print(f"Placed {side} limit at {limit_price:.4f} (2xATR, ATR {atr_levels['atr']:.4f})")
+    except Exception as e:
+        print(f"Failed to place limit order: {e}")
+        play_alert()
+        return None
+
+    sl_price, tp_price = stop_prices(float(limit_price), side, price_rules)
+    save_active_trade(symbol, float(limit_price), sl_price, tp_price, side, quantity,
+                      order_id=response["result"]["orderId"])
+    return pending_reentry(symbol)
+
+def check_reentry_order(symbol, trade):
+    """Follow a pending re-entry order, returning True once it filled or is gone
+
+    A filled order becomes an open trade with SL/TP set from its fill
+    price; a partly filled one has the rest cancelled first so the
+    monitored size stays put. A cancelled or rejected order frees its place
+    in the portfolio.
+    """
+    bybit_symbol = symbol_mapping.get(symbol)
+    if not bybit_symbol:
+        raise Exception(f"No Bybit symbol mapping for {symbol}")
+    response = session.get_open_orders(category="linear", symbol=bybit_symbol, orderId=trade['order_id'])
+    if response["retCode"] != 0:
+        raise Exception(f"Failed to check re-entry order: {response['retMsg']}")
+    resting = bool(response["result"]["list"])
+    if not resting:
+        # The order just left the book, make sure a fill shows up
+        invalidate_snapshot('positions')
+    position = read_open_position(bybit_symbol)
+
+    if not position:
+        if resting:
+            return False
+        clear_active_trade(symbol)
+        update_trade_state()
+        send_email(
+            subject=f"🚫 {symbol} Re-entry Cancelled",
+            body=f"The {trade['side']} limit at {trade['entry_price']:.4f} is no longer open\n"
+                 f"Open positions: {len(open_positions)}/{MAX_OPEN_POSITIONS}"
+        )
+        return True
+
+    if resting:
+        try:
+            session.cancel_order(category="linear", symbol=bybit_symbol, orderId=trade['order_id'])
+        except Exception as e:
+            # It may have filled in full meanwhile
+            print(f"Failed to cancel the rest of the re-entry order: {e}")
+        invalidate_snapshot('positions')
+        position = read_open_position(bybit_symbol) or position
+
+    entry_price = float(position["avgPrice"])
+    sl_price, tp_price = stop_prices(entry_price, trade['side'], get_price_rules(bybit_symbol))
+    response = session.set_trading_stop(
+        category="linear",
+        symbol=bybit_symbol,
+        stopLoss=str(sl_price),
+        takeProfit=str(tp_price)
+    )
+    invalidate_snapshot('positions')
+    if response["retCode"] != 0:
+        raise Exception(f"Failed to set SL/TP on the re-entry: {response['retMsg']}")
+    save_active_trade(symbol, entry_price, sl_price, tp_price, trade['side'], position["size"])
+    update_trade_state()
+    send_email(
+        subject=f"✅ {trade['side']} {bybit_symbol} Re-entry Filled",
+        body=f"{trade['side']} {bybit_symbol} at {entry_price}\n"
+             f"Quantity: {position['size']}\n"
+             f"SL: {sl_price} | TP: {tp_price}"
+    )
+    return True
+
 def execute_trade(signal_symbol, signal_type):
 
     """Execute trade based on signal"""
-    if get_trade_state() == "MANAGE":
-        print(f"Trade blocked - Currently in MANAGE state for {signal_symbol}")
+    allowed, reason = can_open_position(signal_symbol)
+    if not allowed:
+        print(f"Trade blocked - {reason} for {signal_symbol}")
         return
     bybit_symbol = symbol_mapping.get(signal_symbol)
     if not bybit_symbol:
@@ -911,46 +2416,46 @@ def execute_trade(signal_symbol, signal_type):
 
     try:
         side = "Buy" if signal_type == "BUY" else "Sell"
-        market_price = get_market_price(bybit_symbol)
+        with stage_timer("trade.price"):
+            market_price = get_market_price(bybit_symbol)
         print(f"{bybit_symbol} price: {market_price} USDT")
 
-        # Calculate position size
-        raw_quantity = TRADE_AMOUNT_USDT / market_price
-        lot_size_rules = get_lot_size_rules(bybit_symbol)
-        adjusted_quantity = adjust_quantity_to_lot_size(raw_quantity, lot_size_rules)
+        with stage_timer("trade.sizing"):
+            # Calculate position size
+            raw_quantity = TRADE_AMOUNT_USDT / market_price
+            lot_size_rules = get_lot_size_rules(bybit_symbol)
+            adjusted_quantity = adjust_quantity_to_lot_size(raw_quantity, lot_size_rules)
 
-        # Calculate SL/TP prices
-        if side == "Buy":
-            sl_price = round(market_price * (1 - STOP_LOSS_PERCENT / 100), 4)
-            tp_price = round(market_price * (1 + TAKE_PROFIT_PERCENT / 100), 4)
-        else:
-            sl_price = round(market_price * (1 + STOP_LOSS_PERCENT / 100), 4)
-            tp_price = round(market_price * (1 - TAKE_PROFIT_PERCENT / 100), 4)
+            # Calculate SL/TP prices
+            sl_price, tp_price = stop_prices(market_price, side, get_price_rules(bybit_symbol))
 
         print(f"Placing {side} order: {adjusted_quantity} contracts")
         print(f"SL: {sl_price} | TP: {tp_price}")
 
         # Place order
-        response = session.place_order(
-            category="linear",
-            symbol=bybit_symbol,
-            side=side,
-            orderType="Market",
-            qty=str(adjusted_quantity),
-            takeProfit=str(tp_price),
-            stopLoss=str(sl_price)
-        )
+        with stage_timer("trade.order"):
+            response = session.place_order(
+                category="linear",
+                symbol=bybit_symbol,
+                side=side,
+                orderType="Market",
+                qty=str(adjusted_quantity),
+                takeProfit=str(tp_price),
+                stopLoss=str(sl_price)
+            )
+        invalidate_snapshot('positions')
 
         if response["retCode"] == 0:
             print(f"Order executed successfully")
-            save_active_trade(signal_symbol, market_price, sl_price, tp_price, side)
+            save_active_trade(signal_symbol, market_price, sl_price, tp_price, side, adjusted_quantity)
+            update_trade_state()
             send_email(
                 subject=f"✅ {side} {bybit_symbol} Executed",
                 body=f"{side} {bybit_symbol} at {market_price}\n"
                      f"Quantity: {adjusted_quantity}\n"
                      f"SL: {sl_price} | TP: {tp_price}"
             )
-            monitor_trade(signal_symbol, market_price, sl_price, tp_price, side)
+            start_position_monitor(signal_symbol)
         else:
             print(f"Order failed: {response['retMsg']}")
             send_email(
@@ -976,180 +2481,194 @@ def execute_trade(signal_symbol, signal_type):
 
 
 
+def evaluate_exit(symbol, candles, current_price, entry_price, sl_price, tp_price, side):
+    """Exit decision for an open trade from its 15m candles and the current price
+
+    Returns (exit_reason, pnl_percent, trail_stop); trail_stop means the band
+    was touched in profit and the stop should move to break-even instead.
+    """
+    # ===== 4. Calculate Indicators =====
+    src = np.ascontiguousarray(candles[:, 4])
+    with stage_timer("monitor.nwe"):
+        if INCREMENTAL_NWE:
+            out, upper, lower = calculate_nwe_incremental(symbol, src, H_BANDWIDTH, MULTIPLIER, REPAINT)
+        else:
+            out, upper, lower = calculate_nwe(src, H_BANDWIDTH, MULTIPLIER, REPAINT)
+
+    # Get last COMPLETED candle ([-2]) with ALL values
+    last_open, last_high, last_low, last_close = candles[-2, 1:5]
+    last_upper = upper[-2]
+    last_lower = lower[-2]
+
+    # ===== 5. Calculate PnL =====
+    pnl_percent = ((current_price - entry_price)/entry_price)*100 if side == "Buy" \
+                 else ((entry_price - current_price)/entry_price)*100
+
+    # ===== 6. Check Exit Conditions =====
+    if side == "Buy":
+        touched_band = ((last_close >= last_upper) or (last_high >= last_upper)) and \
+                      not ((last_close > last_upper) and (last_open > last_upper))
+        crossover_occurred = (src[-3] < upper[-3]) and (last_close > last_upper)
+    else:  # Sell
+        touched_band = ((last_close <= last_lower) or (last_low <= last_lower)) and \
+                      not ((last_close < last_lower) and (last_open < last_lower))
+        crossunder_occurred = (src[-3] > lower[-3]) and (last_close < last_lower)
+
+    # ===== 7. Determine Exit Reason =====
+    exit_reason = None
+    if (side == "Buy" and crossover_occurred) or (side == "Sell" and crossunder_occurred):
+        exit_reason = f"Force close ({'crossover' if side == 'Buy' else 'crossunder'})"
+    elif pnl_percent >= 5 and touched_band:
+        exit_reason = "Take profit (≥5% + band touch)"
+    elif touched_band and pnl_percent < 5:
+        if pnl_percent > 0:
+            return None, pnl_percent, True
+        exit_reason = "Closed at loss (band touch)"
+    elif (side == "Buy" and current_price <= sl_price) or (side == "Sell" and current_price >= sl_price):
+        exit_reason = "Stop-loss triggered"
+    elif (side == "Buy" and current_price >= tp_price) or (side == "Sell" and current_price <= tp_price):
+        exit_reason = "Take-profit triggered"
+    return exit_reason, pnl_percent, False
+
+def monitor_step(symbol, entry_price, sl_price, tp_price, side, last_price=None):
+    """Run one monitoring pass over an open trade
+
+    Returns True once the trade is gone or closed. last_price, if given,
+    is a dict that receives the latest price for error reports.
+    """
+    bybit_symbol = symbol_mapping.get(symbol)
+    if not bybit_symbol:
+        # Never treat an unmapped trade as closed, its position may still be open
+        raise Exception(f"No Bybit symbol mapping for {symbol}")
+    # Every pass counts, including trail updates, exits and failed requests
+    with stage_timer("monitor.tick"):
+        # ===== 1. Verify Position Exists =====
+        # Transient request failures are retried with backoff by bybit_scheduler
+        with stage_timer("monitor.position"):
+            position = read_open_position(bybit_symbol)
+
+        if not position:
+            print(f"\nPosition no longer exists")
+            clear_active_trade(symbol)
+            update_trade_state()
+            send_email(
+                subject=f"🏁 {symbol} Closed",
+                body=f"Position closed externally\n"
+                     f"Open positions: {len(open_positions)}/{MAX_OPEN_POSITIONS}"
+            )
+            return True
+
+        # ===== 2. Get Market Data =====
+        with stage_timer("monitor.price"):
+            current_price = read_market_price(bybit_symbol)
+        if last_price is not None:
+            last_price['price'] = current_price
+
+        # ===== 3. Fetch and Prepare OHLCV Data =====
+        with stage_timer("monitor.candles"):
+            candles = np.asarray(read_candles(symbol, bybit_symbol, timeframe_15m, limit), dtype=float)
+
+        exit_reason, pnl_percent, trail_stop = evaluate_exit(symbol, candles, current_price,
+                                                             entry_price, sl_price, tp_price, side)
+
+        # Enhanced PnL printing
+        print(f"\n{symbol} {side.upper()} | PnL: {pnl_percent:+.2f}% | "
+              f"Price: {current_price:.4f} | "
+              f"SL: {sl_price:.4f} | TP: {tp_price:.4f}")
+
+        if trail_stop:
+            new_sl = entry_price * 1.001 if side == "Buy" else entry_price * 0.999
+            if update_stop_loss(bybit_symbol, new_sl):
+                print(f"\nTrailing SL to 0.1% profit")
+                send_email(
+                    subject=f"🔄 {symbol} Trailing SL",
+                    body=f"Adjusted SL to {new_sl:.4f}\nCurrent PnL: {pnl_percent:.2f}%"
+                )
+            return False
+
+        # ===== 8. Handle Exit =====
+        if exit_reason:
+            print(f"\n{exit_reason} at {current_price:.4f}")
+        
+            if close_position(bybit_symbol, side):
+                # A single re-entry order, held in the portfolio until it fills or is gone
+                order = place_reentry_order(symbol, side)
+                if order is None:
+                    clear_active_trade(symbol)
+                update_trade_state()
+                send_email(
+                    subject=f"🏁 {symbol} Closed" + (" → Limit Set" if order else ""),
+                    body=f"Exit Reason: {exit_reason}\n"
+                         f"Entry: {entry_price:.4f}\n"
+                         f"Exit: {current_price:.4f}\n"
+                         f"PnL: {pnl_percent:.2f}%\n"
+                         + (f"Placed {side} limit at {order['entry_price']:.4f}\n" if order else "")
+                         + f"Open positions: {len(open_positions)}/{MAX_OPEN_POSITIONS}"
+                )
+                return True
+
+        return False
+
 def monitor_trade(symbol, entry_price, sl_price, tp_price, side):
-    """Monitor open trade with all fixes including proper variable definitions"""
-    max_retries = 25
-    retry_delay = 10
+    """Monitor an open trade, then its re-entry order and the trade that opens"""
     bybit_symbol = symbol_mapping.get(symbol)
+    if USE_STREAMING:
+        start_market_stream(bybit_symbol)
+    last_price = {'price': None}
+    errors = 0  # Consecutive failed passes
+    reentry = pending_reentry(symbol)
     
     while True:
         try:
-            # ===== 1. Verify Position Exists =====
-            position = None
-            for attempt in range(max_retries):
-                try:
-                    position = get_open_position(bybit_symbol)
-                    break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        raise
-                    print(f"Position check error (attempt {attempt+1}): {e}")
-                    play_alert()
-                    time.sleep(retry_delay)
-            
-            if not position:
-                print(f"\nPosition no longer exists")
-                clear_active_trade()
-                set_trade_state("MANAGE")
+            if reentry is not None:
+                # Order status only comes from REST, so check it at a slow fixed pace
+                clock.sleep(REENTRY_CHECK_SECONDS)
+                if check_reentry_order(symbol, reentry):
+                    with _portfolio_lock:
+                        trade = open_positions.get(symbol)
+                    if trade is None:
+                        return
+                    entry_price, sl_price, tp_price, side = (trade['entry_price'], trade['sl_price'],
+                                                             trade['tp_price'], trade['side'])
+                    reentry = None
+            else:
+                if USE_STREAMING:
+                    # React to the next tick or candle close instead of polling
+                    wait_for_market_update(bybit_symbol)
+                if monitor_step(symbol, entry_price, sl_price, tp_price, side, last_price):
+                    reentry = pending_reentry(symbol)
+                    if reentry is None:
+                        return
+            if errors:
+                print(f"\nMonitoring {symbol} recovered after {errors} failed passes")
+                errors = 0
+            if reentry is None and not USE_STREAMING:
+                # Every REST pass costs requests in the monitor lane, ahead of the
+                # scan, so space them out instead of polling back to back
+                clock.sleep(MONITOR_POLL_SECONDS)
+
+        except Exception as e:
+            cooldown = bybit_scheduler.open_for()
+            if cooldown:
+                # The scheduler already alerted when the circuit opened
+                print(f"\nBybit unavailable, monitoring {symbol} resumes in {cooldown:.0f}s")
+                clock.sleep(cooldown)
+                continue
+            # Errors the scheduler does not retry, like a rejected key or a delisted
+            # symbol, fail the same way on every pass, so wait longer each time
+            delay = capped_backoff(errors, MONITOR_ERROR_DELAY_MAX)
+            errors += 1
+            print(f"\nCritical error: {str(e)} (retrying in {delay:.0f}s)")
+            if errors == 1:
+                # Alert once per run of failures, not on every pass
+                play_alert()
                 send_email(
-                    subject=f"🏁 {symbol} Closed",
-                    body=f"Position closed externally\nState set to MANAGE"
+                    subject=f"🛑 {symbol} Monitoring Error",
+                    body=f"Error: {str(e)}\nLast Price: {last_price['price'] or 'Unknown'}\nStill managing position."
                 )
-                return
+            clock.sleep(delay)
 
-            # ===== 2. Get Market Data =====
-            current_price = None
-            for attempt in range(max_retries):
-                try:
-                    current_price = get_market_price(bybit_symbol)
-                    break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        raise
-                    print(f"Price fetch error (attempt {attempt+1}): {e}")
-                    play_alert()
-                    time.sleep(retry_delay)
-
-            # ===== 3. Fetch and Prepare OHLCV Data =====
-            df = None
-            for attempt in range(max_retries):
-                try:
-                    ohlcv = exchange.fetch_ohlcv(symbol, timeframe_15m, limit=limit)
-                    df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                    break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        raise
-                    print(f"OHLCV fetch error (attempt {attempt+1}): {e}")
-                    play_alert()
-                    time.sleep(retry_delay)
-
-            # ===== 4. Calculate Indicators =====
-            src = df['close'].values
-            out, upper, lower = calculate_nwe(src, H_BANDWIDTH, MULTIPLIER, REPAINT)
-            df['upper'] = upper  # Store as DataFrame columns
-            df['lower'] = lower
-            
-            # Get last COMPLETED candle (iloc[-2]) with ALL values
-            last_candle = df.iloc[-2]
-            last_close = last_candle['close']
-            last_open = last_candle['open']
-            last_high = last_candle['high']
-            last_low = last_candle['low']
-            last_upper = last_candle['upper']
-            last_lower = last_candle['lower']
-
-            # ===== 5. Calculate PnL and Print to Console =====
-            pnl_percent = ((current_price - entry_price)/entry_price)*100 if side == "Buy" \
-                         else ((entry_price - current_price)/entry_price)*100
-            
-            # Enhanced PnL printing
-            print(f"\n{symbol} {side.upper()} | PnL: {pnl_percent:+.2f}% | "
-                  f"Price: {current_price:.4f} | "
-                  f"SL: {sl_price:.4f} | TP: {tp_price:.4f}")
-
-            # ===== 6. Check Exit Conditions =====
-            if side == "Buy":
-                touched_band = ((last_close >= last_upper) or (last_high >= last_upper)) and \
-                              not ((last_close > last_upper) and (last_open > last_upper))
-                crossover_occurred = (df['close'].shift(1).iloc[-2] < df['upper'].shift(1).iloc[-2]) and \
-                                   (last_close > last_upper)
-            else:  # Sell
-                touched_band = ((last_close <= last_lower) or (last_low <= last_lower)) and \
-                              not ((last_close < last_lower) and (last_open < last_lower))
-                crossunder_occurred = (df['close'].shift(1).iloc[-2] > df['lower'].shift(1).iloc[-2]) and \
-                                    (last_close < last_lower)
-
-            # ===== 7. Determine Exit Reason =====
-            exit_reason = None
-            if (side == "Buy" and crossover_occurred) or (side == "Sell" and crossunder_occurred):
-                exit_reason = f"Force close ({'crossover' if side == 'Buy' else 'crossunder'})"
-            elif pnl_percent >= 5 and touched_band:
-                exit_reason = "Take profit (≥5% + band touch)"
-            elif touched_band and pnl_percent < 5:
-                if pnl_percent > 0:
-                    new_sl = entry_price * 1.001 if side == "Buy" else entry_price * 0.999
-                    if update_stop_loss(bybit_symbol, new_sl):
-                        print(f"\nTrailing SL to 0.1% profit")
-                        send_email(
-                            subject=f"🔄 {symbol} Trailing SL",
-                            body=f"Adjusted SL to {new_sl:.4f}\nCurrent PnL: {pnl_percent:.2f}%"
-                        )
-                    continue
-                else:
-                    exit_reason = "Closed at loss (band touch)"
-            elif (side == "Buy" and current_price <= sl_price) or (side == "Sell" and current_price >= sl_price):
-                exit_reason = "Stop-loss triggered"
-            elif (side == "Buy" and current_price >= tp_price) or (side == "Sell" and current_price <= tp_price):
-                exit_reason = "Take-profit triggered"
-
-            # ===== 8. Handle Exit =====
-            if exit_reason:
-                print(f"\n{exit_reason} at {current_price:.4f}")
-                
-                if close_position(bybit_symbol, side):
-                    # Calculate ATR levels for limit order
-                    atr_levels = get_atr_levels(symbol)
-                    
-                    # Determine limit order parameters
-                    if side == "Buy":
-                        limit_price = atr_levels['upper']  # 2xATR above
-                        limit_side = "Buy"
-                    else:
-                        limit_price = atr_levels['lower']  # 2xATR below
-                        limit_side = "Sell"
-                    
-                    # Place limit order
-                    try:
-                        session.place_order(
-                            category="linear",
-                            symbol=bybit_symbol,
-                            side=limit_side,
-                            orderType="Limit",
-                            qty=position["size"],
-                            price=str(limit_price),
-                            timeInForce="GTC"
-                        )
-                        print(f"Placed {limit_side} limit at {limit_price:.4f} (2xATR)")
-                    except Exception as e:
-                        print(f"Failed to place limit order: {e}")
-                        play_alert()
-                    
-                    # Update state and notify
-                    clear_active_trade()
-                    set_trade_state("MANAGE")
-                    send_email(
-                        subject=f"🏁 {symbol} Closed → Limit Set",
-                        body=f"Exit Reason: {exit_reason}\n"
-                             f"Entry: {entry_price:.4f}\n"
-                             f"Exit: {current_price:.4f}\n"
-                             f"PnL: {pnl_percent:.2f}%\n"
-                             f"Placed {limit_side} limit at {limit_price:.4f}\n"
-                             f"State: MANAGE"
-                    )
-                    return
-
-            time.sleep(0)  # Normal monitoring interval
 
-        except Exception as e:
-            print(f"\nCritical error: {str(e)}")
-            play_alert()
-            send_email(
-                subject=f"🛑 {symbol} Monitoring Error",
-                body=f"Error: {str(e)}\nLast Price: {current_price or 'Unknown'}\nStill managing position."
-            )
-            time.sleep(0)  # Wait longer after errors
 
 
 
@@ -1168,168 +2687,600 @@ def monitor_trade(symbol, entry_price, sl_price, tp_price, side):
 
 
 
+def first_entry_arrows(signal, entry_up, entry_down):
+    """Flag the first filtered entry after each BUY/SELL signal
 
+    A signal arms its direction until the next signal replaces it or the
+    first matching entry consumes it, so each run of bars between signals
+    holds at most one arrow. The first bar is never armed. 2-D input is
+    treated as independent series, one per row.
+    """
+    shape = np.shape(signal)
+    n = shape[-1] if shape else 0
+    signal = np.array(signal).reshape(-1, max(n, 1))
+    signal[:, :1] = 0
+    signal = signal.ravel()
+    first_up = np.zeros(len(signal), dtype=bool)
+    first_down = np.zeros(len(signal), dtype=bool)
 
-def check_conservative_entry(symbol):
-    """Check for trading signals"""
-    try:
-        print(f"\nChecking {symbol}...")
-        
-        # Fetch OHLCV data
-        ohlcv_15m = exchange.fetch_ohlcv(symbol, timeframe_15m, limit=limit)
-        df_15m = pd.DataFrame(ohlcv_15m, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df_15m['timestamp'] = pd.to_datetime(df_15m['timestamp'], unit='ms')
-        df_15m.set_index('timestamp', inplace=True)
-
-        ohlcv_1h = exchange.fetch_ohlcv(symbol, timeframe_1h, limit=limit)
-        df_1h = pd.DataFrame(ohlcv_1h, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df_1h['timestamp'] = pd.to_datetime(df_1h['timestamp'], unit='ms')
-        df_1h.set_index('timestamp', inplace=True)
-
-        # Calculate EMAs
-        df_15m['EMA_Fast'] = df_15m['close'].ewm(span=ema_fast_length, adjust=False).mean()
-        df_15m['EMA_Slow'] = df_15m['close'].ewm(span=ema_slow_length, adjust=False).mean()
-        df_15m['EMA_Trend'] = df_15m['close'].ewm(span=ema_trend_length, adjust=False).mean()
-        df_1h['EMA_Trend'] = df_1h['close'].ewm(span=ema_trend_length, adjust=False).mean()
-        df_15m['EMA_Trend_1h'] = df_1h['EMA_Trend'].resample('15min').ffill()
-
-        # Generate signals
-        df_15m['Signal'] = 0
-        df_15m.loc[
-            (df_15m['EMA_Fast'] > df_15m['EMA_Slow']) &
-            (df_15m['EMA_Fast'].shift(1) <= df_15m['EMA_Slow'].shift(1)) &
-            (df_15m['close'] > df_15m['EMA_Trend']) &
-            (df_15m['close'] > df_15m['EMA_Trend_1h']),
-            'Signal'] = 1  # Buy signal
-        
-        df_15m.loc[
-            (df_15m['EMA_Fast'] < df_15m['EMA_Slow']) &
-            (df_15m['EMA_Fast'].shift(1) >= df_15m['EMA_Slow'].shift(1)) &
-            (df_15m['close'] < df_15m['EMA_Trend']) &
-            (df_15m['close'] < df_15m['EMA_Trend_1h']),
-            'Signal'] = -1  # Sell signal
-
-        # Conservative entry conditions
-        df_15m['Entry_Up'] = (
-            (df_15m['EMA_Fast'] > df_15m['EMA_Slow']) & 
-            (df_15m['close'].shift(1) < df_15m['EMA_Fast'].shift(1)) & 
-            (df_15m['close'] > df_15m['EMA_Fast'])
-        )
-        
-        df_15m['Entry_Down'] = (
-            (df_15m['EMA_Fast'] < df_15m['EMA_Slow']) & 
-            (df_15m['close'].shift(1) > df_15m['EMA_Fast'].shift(1)) & 
-            (df_15m['close'] < df_15m['EMA_Fast'])
+    # Segment k covers the bars from the k-th signal or row start up to the next one
+    starts = signal != 0
+    starts[::max(n, 1)] = True
+    segment = np.cumsum(starts)
+    armed = np.concatenate(([0], signal[starts]))[segment]
+
+    for armed_side, entries, arrows in ((1, entry_up, first_up), (-1, entry_down, first_down)):
+        candidates = np.flatnonzero(np.asarray(entries, dtype=bool).ravel() & (armed == armed_side))
+        if len(candidates):
+            seg = segment[candidates]
+            first = np.concatenate(([True], seg[1:] != seg[:-1]))
+            arrows[candidates[first]] = True
+
+    return first_up.reshape(shape), first_down.reshape(shape)
+
+def _first_entry_arrows_loop(signal, entry_up, entry_down):
+    """Reference bar-by-bar version of first_entry_arrows"""
+    first_up = np.zeros(len(signal), dtype=bool)
+    first_down = np.zeros(len(signal), dtype=bool)
+    last_signal = 0
+
+    for i in range(1, len(signal)):
+        if signal[i] == 1:
+            last_signal = 1
+        elif signal[i] == -1:
+            last_signal = -1
+
+        if last_signal == 1 and entry_up[i]:
+            first_up[i] = True
+            last_signal = 0
+        elif last_signal == -1 and entry_down[i]:
+            first_down[i] = True
+            last_signal = 0
+
+    return first_up, first_down
+
+def _shift(values):
+    """Previous bar's value along the last axis, NaN on the first bar (pandas shift(1))"""
+    values = np.asarray(values, dtype=float)
+    return np.concatenate((np.full(values.shape[:-1] + (1,), np.nan), values[..., :-1]), axis=-1)
+
+def entry_conditions(close, ema_fast, ema_slow, ema_trend, ema_trend_1h):
+    """EMA crossover signals (1 BUY, -1 SELL) and trend-filtered entry masks, per bar"""
+    prev_close = _shift(close)
+    prev_fast = _shift(ema_fast)
+    prev_slow = _shift(ema_slow)
+    above_trend = (close > ema_trend) & (close > ema_trend_1h)
+    below_trend = (close < ema_trend) & (close < ema_trend_1h)
+
+    # Generate signals
+    signal = np.zeros(np.shape(close), dtype=np.int8)
+    signal[(ema_fast > ema_slow) & (prev_fast <= prev_slow) & above_trend] = 1  # Buy signal
+    signal[(ema_fast < ema_slow) & (prev_fast >= prev_slow) & below_trend] = -1  # Sell signal
+
+    # Conservative entry conditions
+    entry_up = (ema_fast > ema_slow) & (prev_close < prev_fast) & (close > ema_fast)
+    entry_down = (ema_fast < ema_slow) & (prev_close > prev_fast) & (close < ema_fast)
+
+    return signal, entry_up & above_trend, entry_down & below_trend
+
+def entry_arrows(close, ema_fast, ema_slow, ema_trend, ema_trend_1h):
+    """First filtered conservative entries after each EMA crossover signal"""
+    return first_entry_arrows(*entry_conditions(close, ema_fast, ema_slow, ema_trend, ema_trend_1h))
+
+def get_entry_signal(symbol):
+    """Evaluate the last closed candle, returning ('BUY'|'SELL'|None, candle)"""
+    # Fetch OHLCV data, the 1h candles are derived from the 15m series
+    with stage_timer("signal.fetch_15m"):
+        ohlcv_15m, ohlcv_1h, htf_index = get_signal_candles(symbol)
+
+    with stage_timer("signal.indicators"):
+        last_candle = entry_signal_row(ohlcv_15m, ohlcv_1h, htf_index)
+
+    if last_candle['First_Up_Arrow']:
+        return "BUY", last_candle
+    if last_candle['First_Down_Arrow']:
+        return "SELL", last_candle
+    return None, last_candle
+
+def handle_entry_signal(symbol, signal, last_candle):
+    """Notify and trade on a signal from get_entry_signal"""
+    if signal == "BUY":
+        print(f"{symbol}: ✅ BUY Signal")
+        send_email(
+            subject=f"🚀 BUY {symbol}",
+            body=f"BUY signal detected for {symbol}\n"
+                 f"Price: {last_candle['close']}\n"
+                 f"Fast EMA: {last_candle['EMA_Fast']:.2f}\n"
+                 f"Slow EMA: {last_candle['EMA_Slow']:.2f}"
         )
+        execute_trade(symbol, "BUY")
         
-        df_15m['Entry_Up_Filtered'] = df_15m['Entry_Up'] & (
-            (df_15m['close'] > df_15m['EMA_Trend']) & 
-            (df_15m['close'] > df_15m['EMA_Trend_1h'])
+    elif signal == "SELL":
+        print(f"{symbol}: ❌ SELL Signal")
+        send_email(
+            subject=f"🔻 SELL {symbol}",
+            body=f"SELL signal detected for {symbol}\n"
+                 f"Price: {last_candle['close']}\n"
+                 f"Fast EMA: {last_candle['EMA_Fast']:.2f}\n"
+                 f"Slow EMA: {last_candle['EMA_Slow']:.2f}"
         )
+        execute_trade(symbol, "SELL")
         
-        df_15m['Entry_Down_Filtered'] = df_15m['Entry_Down'] & (
-            (df_15m['close'] < df_15m['EMA_Trend']) & 
-            (df_15m['close'] < df_15m['EMA_Trend_1h'])
-        )
+    else:
+        print(f"{symbol}: No signal")
+
+def report_signal_error(symbol, error):
+    """Log and email a failed signal check"""
+    print(f"Error checking {symbol}: {str(error)}")
+    send_email(
+        subject=f"⚠️ {symbol} Signal Error",
+        body=f"Error checking signals for {symbol}\nError: {str(error)}"
+    )
+
+def batch_entry_signals(symbol_list, max_workers=SCAN_WORKERS):
+    """get_entry_signal for every symbol, fetched concurrently and evaluated in one batch
+
+    Returns a (signal, last_candle, error) tuple per symbol, in order.
+    """
+    def fetch(symbol):
+        try:
+            return get_signal_candles(symbol) + (None,)
+        except Exception as e:
+            return None, None, None, e
 
-        # Track first conservative entry after signal
-        df_15m['First_Up_Arrow'] = False
-        df_15m['First_Down_Arrow'] = False
-        last_signal = 0
-        
-        for i in range(1, len(df_15m)):
-            if df_15m['Signal'].iloc[i] == 1:
-                last_signal = 1
-            elif df_15m['Signal'].iloc[i] == -1:
-                last_signal = -1
-
-            if last_signal == 1 and df_15m['Entry_Up_Filtered'].iloc[i]:
-                df_15m.at[df_15m.index[i], 'First_Up_Arrow'] = True
-                last_signal = 0
-            elif last_signal == -1 and df_15m['Entry_Down_Filtered'].iloc[i]:
-                df_15m.at[df_15m.index[i], 'First_Down_Arrow'] = True
-                last_signal = 0
-
-        # Check most recent closed candle
-        last_candle = df_15m.iloc[-2]
-        
-        if last_candle['First_Up_Arrow']:
-            print(f"{symbol}: ✅ BUY Signal")
-            send_email(
-                subject=f"🚀 BUY {symbol}",
-                body=f"BUY signal detected for {symbol}\n"
-                     f"Price: {last_candle['close']}\n"
-                     f"Fast EMA: {last_candle['EMA_Fast']:.2f}\n"
-                     f"Slow EMA: {last_candle['EMA_Slow']:.2f}"
-            )
-            execute_trade(symbol, "BUY")
-            
-        elif last_candle['First_Down_Arrow']:
-            print(f"{symbol}: ❌ SELL Signal")
-            send_email(
-                subject=f"🔻 SELL {symbol}",
-                body=f"SELL signal detected for {symbol}\n"
-                     f"Price: {last_candle['close']}\n"
-                     f"Fast EMA: {last_candle['EMA_Fast']:.2f}\n"
-                     f"Slow EMA: {last_candle['EMA_Slow']:.2f}"
-            )
-            execute_trade(symbol, "SELL")
-            
+    with stage_timer("scan.fetch"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetched = list(pool.map(fetch, symbol_list))
+
+    results = [(None, None, error) for *_, error in fetched]
+    ready = [i for i, (*_, error) in enumerate(fetched) if error is None]
+    with stage_timer("scan.indicators"):
+        try:
+            if INCREMENTAL_INDICATORS:
+                rows = [get_signal_state(symbol_list[i]).advance(fetched[i][0], fetched[i][1]) for i in ready]
+            else:
+                rows = entry_signal_rows([fetched[i][0] for i in ready], [fetched[i][1] for i in ready],
+                                         [fetched[i][2] for i in ready])
+        except Exception:
+            # A malformed series would fail the whole batch, evaluate symbols one by one instead
+            rows = []
+            for i in ready:
+                try:
+                    rows.append(entry_signal_row(*fetched[i][:3]))
+                except Exception as e:
+                    rows.append(e)
+
+    for i, row in zip(ready, rows):
+        if isinstance(row, Exception):
+            results[i] = (None, None, row)
+            continue
+        proximity_index.update(symbol_list[i], fetched[i][0], row)
+        if row['First_Up_Arrow']:
+            results[i] = ("BUY", row, None)
+        elif row['First_Down_Arrow']:
+            results[i] = ("SELL", row, None)
         else:
-            print(f"{symbol}: No signal")
+            results[i] = (None, row, None)
+    return results
 
+def check_conservative_entry(symbol):
+    """Check for trading signals"""
+    try:
+        print(f"\nChecking {symbol}...")
+        with stage_timer("scan.symbol"):
+            signal, last_candle = get_entry_signal(symbol)
+        handle_entry_signal(symbol, signal, last_candle)
     except Exception as e:
-        print(f"Error checking {symbol}: {str(e)}")
-        send_email(
-            subject=f"⚠️ {symbol} Signal Error",
-            body=f"Error checking signals for {symbol}\nError: {str(e)}"
-        )
+        report_signal_error(symbol, e)
+
+class ProximityIndex:
+    """Per-symbol distance of the last closed 15m close from its EMAs, in ATRs
+
+    Every entry arrow needs the close to cross EMA_Fast on its bar: rising
+    through it for a BUY, falling for a SELL. It must also end above
+    EMA_Trend with EMA_Fast above EMA_Slow for a BUY, and the mirror for
+    a SELL. Each EMA moves toward the new close, so each of these is a
+    bound on the next close. With d = close - e for an EMA e,
+    d_next = (1 - alpha) * (d + close change). So if no close moves more
+    than PRUNE_ATR_MULTIPLE ATRs per bar, d keeps its sign for m bars while
+        |gap| > PRUNE_ATR_MULTIPLE * sum((1 - alpha) ** -r for r < m)
+
+    For the next bar, a symbol is skipped when its close would have to
+    move more than PRUNE_ATR_MULTIPLE ATRs. Further out, only the EMA_Fast
+    bound is used. Entries older than PRUNE_MAX_BARS, or off the bar grid,
+    are always evaluated.
+
+    This is a heuristic, not a guarantee: crypto returns are heavy tailed,
+    and a single close beyond PRUNE_ATR_MULTIPLE ATRs can turn a skipped
+    symbol into an entry that is then lost. Pruning is off by default; run
+    with PRUNE_VERIFY to measure the miss rate before enabling it.
+    """
+
+    def __init__(self, multiple=PRUNE_ATR_MULTIPLE, max_bars=PRUNE_MAX_BARS, period_ms=900_000, atr_length=14):
+        self.multiple = multiple
+        self.max_bars = max_bars
+        self.period_ms = period_ms
+        self.atr_length = atr_length
+        self.fast_alpha = 2 / (ema_fast_length + 1)
+        self.slow_alpha = 2 / (ema_slow_length + 1)
+        self.decay = 1 - self.fast_alpha
+        self.verified = 0
+        self.missed = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def threshold(self, bars):
+        """Smallest EMA_Fast gap that is safe to skip `bars` bars after it was measured"""
+        return self.multiple * sum(self.decay ** -r for r in range(bars))
+
+    def required_move(self, fast_gap, slow_gap, trend_gap):
+        """ATRs the next close must move for an arrow to be possible on its bar"""
+        if fast_gap == 0:
+            return 0.0
+        side = -np.sign(fast_gap)  # BUY needs a rise through EMA_Fast, SELL a fall
+        needed = [-fast_gap, -trend_gap]
+        if self.fast_alpha > self.slow_alpha:
+            # Close change at which the updated EMA_Fast and EMA_Slow meet
+            needed.append(((1 - self.fast_alpha) * fast_gap - (1 - self.slow_alpha) * slow_gap)
+                          / (self.fast_alpha - self.slow_alpha))
+        return float(max(side * move for move in needed))
+
+    def update(self, symbol, candles, row):
+        """Record the gaps of a freshly evaluated symbol from its 15m candles and signal row"""
+        recent = np.asarray(candles[-(self.atr_length + 2):-1], dtype=float)
+        if len(recent) <= self.atr_length:
+            return
+        atr = atr_array(recent[:, 2], recent[:, 3], recent[:, 4], self.atr_length)[-1]
+        if not atr > 0:
+            return
+        with self._lock:
+            self._entries[symbol] = (row['timestamp'], (row['close'] - row['EMA_Fast']) / atr,
+                                     (row['close'] - row['EMA_Slow']) / atr, (row['close'] - row['EMA_Trend']) / atr)
+
+    def forget(self, symbol):
+        with self._lock:
+            self._entries.pop(symbol, None)
+
+    def to_dict(self):
+        with self._lock:
+            return {symbol: list(entry) for symbol, entry in self._entries.items()}
+
+    def load_dict(self, data):
+        with self._lock:
+            self._entries.update({symbol: tuple(entry) for symbol, entry in data.items()})
+
+    def candidates(self, symbol_list, bar_ts):
+        """Split symbols into (evaluate, skipped) for the closed bar opened at bar_ts
+
+        Symbols to evaluate are ordered by the move they need, unknown ones first.
+        """
+        evaluate, skipped = [], []
+        with self._lock:
+            entries = dict(self._entries)
+        for symbol in symbol_list:
+            entry = entries.get(symbol)
+            if entry is None:
+                evaluate.append((-1.0, symbol))
+                continue
+            timestamp, fast_gap, slow_gap, trend_gap = entry
+            bars, offset = divmod(bar_ts - timestamp, self.period_ms)
+            move = self.required_move(fast_gap, slow_gap, trend_gap) if bars == 1 else abs(fast_gap)
+            if offset or not 0 < bars <= self.max_bars or move <= self.threshold(bars):
+                evaluate.append((move, symbol))
+            else:
+                skipped.append(symbol)
+        return [symbol for _, symbol in sorted(evaluate)], skipped
+
+    def nearest(self, n=10):
+        """The n symbols needing the smallest move to fire, as (symbol, ATRs)"""
+        with self._lock:
+            moves = [(symbol, self.required_move(*gaps)) for symbol, (_, *gaps) in self._entries.items()]
+        return heapq.nsmallest(n, moves, key=lambda item: item[1])
+
+proximity_index = ProximityIndex()
+
+def last_closed_bar(timeframe, now=None):
+    """Open time in ms of the newest closed candle of timeframe"""
+    period = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    now_ms = int((clock.time() if now is None else now) * 1000)
+    return now_ms // period * period - period
+
+def scan_symbols(symbol_list, max_workers=SCAN_WORKERS, prune=PRUNE_SCANS, verify=PRUNE_VERIFY):
+    """Check all symbols concurrently, then act on the signals in symbol order
+
+    With prune, symbols proximity_index rules out are skipped. With verify
+    they are evaluated anyway and any signal among them is reported as a
+    pruning miss (and still acted on).
+    """
+    # Load markets once up front instead of racing to load them in every worker
+    load_market_cache()
+    evaluate, skipped = list(symbol_list), []
+    if prune:
+        evaluate, skipped = proximity_index.candidates(symbol_list, last_closed_bar(timeframe_15m))
+        print(f"Proximity pruning: evaluating {len(evaluate)}, skipping {len(skipped)} of {len(symbol_list)} symbols")
+    checked = evaluate + skipped if verify else evaluate
+    results = dict(zip(checked, batch_entry_signals(checked, max_workers)))
+
+    if verify:
+        missed = [symbol for symbol in skipped if results[symbol][0]]
+        proximity_index.verified += len(skipped)
+        proximity_index.missed += len(missed)
+        for symbol in missed:
+            print(f"⚠️ Proximity pruning missed a {results[symbol][0]} signal on {symbol}")
+        print(f"Proximity pruning verified: {proximity_index.missed} missed of {proximity_index.verified} skipped so far")
+
+    for symbol in symbol_list:
+        if symbol not in results:
+            continue
+        signal, last_candle, error = results[symbol]
+        print(f"\nChecking {symbol}...")
+        if error is not None:
+            report_signal_error(symbol, error)
+            proximity_index.forget(symbol)
+        else:
+            handle_entry_signal(symbol, signal, last_candle)
+
+# ======================== Universe Selection ========================
+
+_universe = {'symbols': None, 'selected_at': 0.0}
+_universe_lock = threading.Lock()
+
+def is_usdt_linear(symbol):
+    """True for USDT-margined linear perpetuals like 'BTC/USDT:USDT'"""
+    return symbol.endswith('/USDT:USDT')
+
+def rank_universe(symbol_list, tickers, instruments=None, size=UNIVERSE_SIZE):
+    """Pick the size best USDT-linear symbols by 24h turnover, spread and volatility
+
+    Symbols without a ticker, outside the turnover, spread and volatility
+    limits, or not trading are dropped; the rest are scored by their
+    percentile ranks weighted with UNIVERSE_WEIGHTS. The selection keeps
+    the order of symbol_list.
+    """
+    rows = []
+    for symbol in symbol_list:
+        bybit_symbol = symbol_mapping.get(symbol)
+        ticker = tickers.get(bybit_symbol)
+        if not is_usdt_linear(symbol) or not ticker:
+            continue
+        instrument = (instruments or {}).get(bybit_symbol)
+        if instrument and instrument.get("status", "Trading") != "Trading":
+            continue
+        try:
+            last = float(ticker["lastPrice"])
+            bid, ask = float(ticker["bid1Price"]), float(ticker["ask1Price"])
+            turnover = float(ticker["turnover24h"])
+            volatility = (float(ticker["highPrice24h"]) - float(ticker["lowPrice24h"])) / last
+            spread = (ask - bid) / ((ask + bid) / 2)
+        except (KeyError, ValueError, ZeroDivisionError):
+            continue
+        if turnover < UNIVERSE_MIN_TURNOVER or not 0 <= spread <= UNIVERSE_MAX_SPREAD:
+            continue
+        if not UNIVERSE_MIN_VOLATILITY <= volatility <= UNIVERSE_MAX_VOLATILITY:
+            continue
+        rows.append((symbol, turnover, spread, volatility))
+    if not rows:
+        return []
+
+    df = pd.DataFrame(rows, columns=['symbol', 'turnover', 'spread', 'volatility'])
+    df['score'] = (UNIVERSE_WEIGHTS['turnover'] * df['turnover'].rank(pct=True)
+                   + UNIVERSE_WEIGHTS['spread'] * df['spread'].rank(pct=True, ascending=False)
+                   + UNIVERSE_WEIGHTS['volatility'] * df['volatility'].rank(pct=True))
+    selected = set(df.nlargest(size, 'score')['symbol'])
+    return [symbol for symbol in symbol_list if symbol in selected]
+
+def get_universe(symbol_list, force=False):
+    """Symbols worth scanning, re-ranked from one bulk ticker call every UNIVERSE_REFRESH_SECONDS
+
+    Returns symbol_list unchanged when UNIVERSE_SIZE is 0. If the tickers
+    cannot be fetched, or no symbol passes the filters, the previous
+    selection is kept and the refresh is retried on the next call.
+    """
+    if not UNIVERSE_SIZE:
+        return symbol_list
+    with _universe_lock:
+        stale = clock.time() - _universe['selected_at'] > UNIVERSE_REFRESH_SECONDS
+        if force or _universe['symbols'] is None or stale:
+            try:
+                with stage_timer("universe.select"):
+                    tickers = get_snapshot('tickers')
+                    try:
+                        instruments = get_snapshot('instruments')
+                    except Exception:
+                        instruments = None
+                    selected = rank_universe(symbol_list, tickers, instruments, UNIVERSE_SIZE)
+                if not selected:
+                    raise Exception(f"no symbol passed the filters ({len(tickers)} tickers)")
+                _universe['symbols'] = selected
+                _universe['selected_at'] = clock.time()
+                print(f"Universe: scanning {len(selected)} of {len(symbol_list)} symbols")
+            except Exception as e:
+                print(f"⚠️ Universe refresh failed, keeping previous selection: {e}")
+                if _universe['symbols'] is None:
+                    return [symbol for symbol in symbol_list if is_usdt_linear(symbol)]
+        return _universe['symbols']
+
+# ======================== Candle-Close Scheduler ========================
+
+def next_candle_close(timeframe, now=None):
+    """Epoch seconds of the next candle close for timeframe"""
+    now = clock.time() if now is None else now
+    period = ccxt.Exchange.parse_timeframe(timeframe)
+    return (int(now) // period + 1) * period
+
+def run_candle_scheduler(jobs, settle_delay=CANDLE_SETTLE_DELAY):
+    """Run each (timeframe, job) right after that timeframe's candles close
+
+    Jobs for longer timeframes run first when several close at once, so an
+    hourly refresh is done before the 15m scan that reads it.
+    """
+    jobs = sorted(jobs, key=lambda job: -ccxt.Exchange.parse_timeframe(job[0]))
+    shortest_period = min(ccxt.Exchange.parse_timeframe(timeframe) for timeframe, _ in jobs)
+    while True:
+        close_time = min(next_candle_close(timeframe) for timeframe, _ in jobs)
+        clock.sleep(max(0, close_time + settle_delay - clock.time()))
+
+        for timeframe, job in jobs:
+            if close_time % ccxt.Exchange.parse_timeframe(timeframe) == 0:
+                job()
+
+        overrun = clock.time() - (close_time + shortest_period)
+        if overrun > 0:
+            print(f"Warning: candle jobs overran the next close by {overrun:.0f}s")
+
+
+
+
+
 
 
 
+# ======================== Bot Loop ========================
 
+def run_bot(symbol_list=None, persist=True):
+    """Resume open trades, then scan at every 15m close
 
+    The 1h trend candles are derived from the cached 15m series during the
+    scan, so there is no separate hourly job.
 
+    With persist=False nothing is read from or written to the workspace
+    caches, which keeps simulations away from the live bot's files.
+    """
+    if persist:
+        load_instrument_registry()
+        start_instrument_refresher()
+        if PERSIST_CANDLES:
+            load_candle_cache()
+        if INCREMENTAL_INDICATORS:
+            load_indicator_states()
+    if symbol_list is None:
+        load_symbol_mapping()
+        symbol_list = symbols
+    require_symbol_mapping()
 
+    # Resume monitoring existing trades
+    for trade_symbol in get_active_trades():
+        if trade_symbol not in symbol_mapping:
+            continue
+        print(f"Resuming trade: {trade_symbol}")
+        start_position_monitor(trade_symbol)
+    update_trade_state()
+
+    def scan_job():
+        print(f"\n=== New Scan at {pd.Timestamp(clock.time(), unit='s')} UTC ===")
+        current_state = get_trade_state()
+        print(f"Current Trade State: {current_state}")
+
+        if current_state == "ENTRY":
+            with stage_timer("scan.total"):
+                scan_symbols(get_universe(symbol_list))
+            if persist and PERSIST_CANDLES:
+                save_candle_cache()
+            if persist and INCREMENTAL_INDICATORS:
+                save_indicator_states()
+        else:
+            print("Skipping signal checks - MANAGE state active")
+        maybe_report_timings()
+
+    # Main trading loop, woken at each candle close; the 1h trend is derived from the 15m candles
+    run_candle_scheduler([(timeframe_15m, scan_job)])
+
+def save_warm_state(path=WARM_STATE_FILE):
+    """Write candles, indicator state, proximity gaps and the universe to one compressed file"""
+    with _indicator_states_lock:
+        states = {symbol: state.to_dict() for symbol, state in _indicator_states.items()}
+    with _universe_lock:
+        universe = dict(_universe)
+    meta = {'saved_at': clock.time(), 'indicator_states': states,
+            'proximity': proximity_index.to_dict(), 'universe': universe}
+    try:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, meta=np.array(json.dumps(meta)), **_pack_candle_cache())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving warm state: {e}")
+
+def load_warm_state(path=WARM_STATE_FILE):
+    """Restore the file written by save_warm_state"""
+    if not os.path.exists(path):
+        return
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            series = _unpack_candle_cache(data)
+        states = {symbol: SignalState.from_dict(state) for symbol, state in meta['indicator_states'].items()}
+        with _indicator_states_lock:
+            _indicator_states.update(states)
+        proximity_index.load_dict(meta['proximity'])
+        with _universe_lock:
+            _universe.update(meta['universe'])
+        age = clock.time() - meta['saved_at']
+        print(f"Loaded warm state from {path} ({series} candle series, {age:.0f}s old)")
+    except Exception as e:
+        print(f"Error loading warm state: {e}")
+
+def run_once(scan=True, monitor=True, symbol_list=None, path=WARM_STATE_FILE):
+    """One pass for scheduled runners: restore, monitor and/or scan once, save, return
+
+    Open trades come from the state store and get one monitor_step each,
+    pending re-entry orders one check_reentry_order; trades opened by the
+    scan are picked up by the next run instead of a monitor thread.
+    """
+    global _one_shot_run
+    _one_shot_run = True
+    load_warm_state(path)
+    if symbol_list is None:
+        load_symbol_mapping()
+        symbol_list = symbols
+    require_symbol_mapping()
+
+    trades = get_active_trades()
+    if monitor:
+        for trade_symbol, trade in trades.items():
+            if trade_symbol not in symbol_mapping:
+                continue
+            print(f"Checking trade: {trade_symbol}")
+            try:
+                if trade.get('status') == 'pending':
+                    check_reentry_order(trade_symbol, trade)
+                else:
+                    monitor_step(trade_symbol, trade['entry_price'], trade['sl_price'], trade['tp_price'],
+                                 trade['side'])
+            except Exception as e:
+                print(f"Error monitoring {trade_symbol}: {e}")
+    update_trade_state()
+
+    if scan:
+        current_state = get_trade_state()
+        print(f"Current Trade State: {current_state}")
+        if current_state == "ENTRY":
+            with stage_timer("scan.total"):
+                scan_symbols(get_universe(symbol_list))
+        else:
+            print("Skipping signal checks - MANAGE state active")
+    save_warm_state(path)
 
 # ======================== Main Execution ========================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EMA crossover + NWE trading bot")
+    parser.add_argument('--once', nargs='?', const='all', choices=['all', 'scan', 'monitor'],
+                        help="run one monitor pass and/or scan from the saved warm state, then exit")
+    args = parser.parse_args()
+
     print("Starting Trading Bot")
     print(f"Workspace: {GITHUB_WORKSPACE}")
-    
-    # Check for existing trade
-    active_trade = get_active_trade()
-    if active_trade:
-        print(f"Resuming trade: {active_trade['symbol']}")
-        monitor_trade(
-            symbol=active_trade['symbol'],
-            entry_price=active_trade['entry_price'],
-            sl_price=active_trade['sl_price'],
-            tp_price=active_trade['tp_price'],
-            side=active_trade['side']
-        )
-    
-    # Main trading loop
-    try:
-        while True:
-            scan_start = time.time()
-            print(f"\n=== New Scan at {pd.Timestamp.now()} ===")
-            current_state = get_trade_state()
-            print(f"Current Trade State: {current_state}")
+    if METRICS_PORT:
+        start_metrics_server()
 
-
-            if current_state == "ENTRY":  # <-- MODIFIED THIS LINE
-                for symbol in symbols:
-                    check_conservative_entry(symbol)
-            else:
-                print("Skipping signal checks - MANAGE state active")
-            elapsed = time.time() - scan_start
-            sleep_time = max(0, SCAN_INTERVAL - elapsed)
-            time.sleep(sleep_time)  # <-- Add this critical line
-    # ... rest of existing loop ...
-            
+    try:
+        if args.once:
+            run_once(scan=args.once in ('all', 'scan'), monitor=args.once in ('all', 'monitor'))
+        else:
+            run_bot()
     except KeyboardInterrupt:
         print("\nBot stopped by user")
     except Exception as e:
         print(f"Fatal error: {e}")
-        send_email("🛑 Bot Crashed", f"Error:\n{str(e)}")
\ No newline at end of file
+        send_email("🛑 Bot Crashed", f"Error:\n{str(e)}")
+    finally:
+        print_timing_report()
+        flush_emails()
@@ -0,0 +1,142 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import backtest
+import newfile as bot
+
+OPTIMIZER_REPORT_FILE = os.path.join(bot.GITHUB_WORKSPACE, "optimizer_report.json")
+
+# Values tried by the parameter optimizer
+OPTIMIZER_GRID = {
+    'ema_fast_length': [20, 30, 38, 50],
+    'ema_slow_length': [50, 62, 80, 100],
+    'ema_trend_length': [100, 200],
+    'h_bandwidth': [6.0, 8.0, 10.0],
+    'multiplier': [2.0, 3.0, 4.0],
+    'stop_loss_percent': [1, 2, 3],
+    'take_profit_percent': [10, 20],
+}
+
+def parameter_combinations(grid=OPTIMIZER_GRID, samples=None, seed=0):
+    """Grid of strategy params, or a random sample of it; fast EMA must be faster than slow"""
+    keys = list(grid)
+    combos = [
+        backtest.strategy_params(**dict(zip(keys, values)))
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+    combos = [p for p in combos if p['ema_fast_length'] < p['ema_slow_length']]
+    if samples and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return combos
+
+def _sweep_file(path, combos, folds):
+    """Score every combination on one symbol; runs in a worker process
+
+    Returns (symbol, results) where results[combo, fold] holds the PnL in
+    USDT, trade count and winning trades of the trades entered in that fold.
+    Each EMA span and each NWE window is computed once and shared by all
+    combinations.
+    """
+    symbol = os.path.splitext(os.path.basename(path))[0]
+    results = np.zeros((len(combos), folds, 3))
+    try:
+        timestamps, o, h, l, c = backtest._candle_arrays(backtest.load_candle_file(path))
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return symbol, results
+
+    emas = {}
+    trends_1h = {}
+    nwe_cache = {}
+    fold_edges = np.linspace(bot.limit, len(c), folds + 1)
+
+    for i, params in enumerate(combos):
+        for span in (params['ema_fast_length'], params['ema_slow_length'], params['ema_trend_length']):
+            if span not in emas:
+                emas[span] = backtest.ema(c, span)
+        trend_span = params['ema_trend_length']
+        if trend_span not in trends_1h:
+            trends_1h[trend_span] = backtest.as_of_trend_ema(timestamps, c, trend_span)
+
+        first_up, first_down = bot.entry_arrows(
+            c,
+            emas[params['ema_fast_length']],
+            emas[params['ema_slow_length']],
+            emas[trend_span],
+            trends_1h[trend_span]
+        )
+        for trade in backtest.simulate_trades(o, h, l, c, first_up, first_down, params, nwe_cache):
+            fold = min(int(np.searchsorted(fold_edges, trade['entry_bar'], side='right')) - 1, folds - 1)
+            pnl_usdt = trade['pnl_percent'] / 100 * bot.TRADE_AMOUNT_USDT
+            results[i, fold] += (pnl_usdt, 1, pnl_usdt > 0)
+    return symbol, results
+
+def run_optimizer(data_dir, samples=None, folds=4, workers=None, report_path=OPTIMIZER_REPORT_FILE):
+    """Sweep strategy params over stored candles with walk-forward validation
+
+    The bars of every symbol are split into `folds` consecutive periods.
+    Each walk-forward step picks the combination with the best PnL in one
+    period and reports how that choice did in the next, unseen period.
+    """
+    combos = parameter_combinations(samples=samples)
+    paths = sorted(
+        os.path.join(data_dir, name) for name in os.listdir(data_dir)
+        if name.endswith(('.csv', '.parquet'))
+    )
+    print(f"Evaluating {len(combos)} parameter sets on {len(paths)} symbols, {folds} folds")
+
+    start = time.time()
+    totals = np.zeros((len(combos), folds, 3))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for symbol, results in pool.map(_sweep_file, paths, [combos] * len(paths), [folds] * len(paths)):
+            totals += results
+
+    in_sample = totals.sum(axis=1)
+    ranking = np.argsort(-in_sample[:, 0])
+    print(f"\nTop parameter sets over all data ({time.time() - start:.1f}s):")
+    for i in ranking[:10]:
+        trades = in_sample[i, 1]
+        hit_rate = in_sample[i, 2] / trades if trades else 0.0
+        print(f"  PnL {in_sample[i, 0]:>10.2f} USDT  trades {int(trades):>6}  hit {hit_rate:6.1%}  {combos[i]}")
+
+    walk_forward = []
+    for fold in range(folds - 1):
+        best = int(np.argmax(totals[:, fold, 0]))
+        walk_forward.append({
+            'train_fold': fold,
+            'params': combos[best],
+            'train_pnl_usdt': float(totals[best, fold, 0]),
+            'test_pnl_usdt': float(totals[best, fold + 1, 0]),
+            'test_trades': int(totals[best, fold + 1, 1]),
+        })
+    print("\nWalk-forward (best of fold k, scored on fold k+1):")
+    for step in walk_forward:
+        print(f"  fold {step['train_fold']} -> {step['train_fold'] + 1}: "
+              f"train {step['train_pnl_usdt']:>10.2f}  test {step['test_pnl_usdt']:>10.2f} USDT  {step['params']}")
+    print(f"  Out-of-sample PnL: {sum(step['test_pnl_usdt'] for step in walk_forward):.2f} USDT")
+
+    with open(report_path, 'w') as f:
+        json.dump({
+            'top': [{'params': combos[i], 'pnl_usdt': float(in_sample[i, 0]),
+                     'trades': int(in_sample[i, 1]), 'wins': int(in_sample[i, 2])} for i in ranking[:50]],
+            'walk_forward': walk_forward,
+        }, f, indent=2)
+    print(f"Report written to {report_path}")
+    return walk_forward
+
+# ======================== Main Execution ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over stored 15m candles")
+    parser.add_argument('data_dir', metavar='DIR', help="CSV/Parquet 15m candle files")
+    parser.add_argument('--samples', type=int, default=None, help="random parameter sets (default: full grid)")
+    parser.add_argument('--folds', type=int, default=4, help="walk-forward folds")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+    run_optimizer(args.data_dir, samples=args.samples, folds=args.folds, workers=args.workers)
@@ -0,0 +1,530 @@
+import argparse
+import itertools
+import os
+import random
+import socketserver
+import threading
+import time
+from decimal import Decimal
+
+import ccxt
+import numpy as np
+import pandas as pd
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+
+import backtest
+import newfile as bot
+
+SIM_PERIOD_MS = 900_000  # Stored candles are 15m
+
+def _sim_ok(result):
+    return {'retCode': 0, 'retMsg': 'OK', 'result': result, 'time': int(bot.clock.time() * 1000)}
+
+def _sim_error(code, message):
+    return {'retCode': code, 'retMsg': message, 'result': {}, 'time': int(bot.clock.time() * 1000)}
+
+class ExchangeSimulator:
+    """In-process stand-in for both the scan exchange and the Bybit session
+
+    Replays stored 15m candles against the clock. The forming candle follows
+    a fixed open-low-high-close path (open-high-low-close on down candles),
+    so candles, tickers and fills are a pure function of clock.time().
+    Market orders fill at the current price; limit orders and position
+    SL/TP fill when the path crosses them. Latency, random request errors
+    and a requests/s limit can be injected.
+    """
+
+    id = 'simulator'
+    rateLimit = 50
+
+    def __init__(self, candles, latency=0.0, error_rate=0.0, rate_limit=None, seed=0,
+                 fee_percent=backtest.BACKTEST_FEE_PERCENT):
+        # candles maps ccxt symbols to OHLCV rows, oldest first
+        self.symbol_mapping = {}
+        self._bars = {}
+        for ccxt_symbol, rows in candles.items():
+            bybit_symbol = bot.symbol_mapping.get(ccxt_symbol) or ccxt_symbol.split(':')[0].replace('/', '')
+            self.symbol_mapping[ccxt_symbol] = bybit_symbol
+            self._bars[bybit_symbol] = np.asarray(rows, dtype=float)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fee_rate = fee_percent / 100
+        self.positions = {}
+        self.orders = []
+        self.fills = []
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.requests = 0
+        self.markets = {}
+        self._rng = random.Random(seed)
+        self._tokens = {}
+        self._order_ids = itertools.count(1)
+        self._matched_until = None
+        self._lock = threading.RLock()
+        self._rules = {symbol: self._instrument(symbol) for symbol in self._bars}
+        self.load_markets()
+
+    @classmethod
+    def from_directory(cls, data_dir, **kwargs):
+        """Simulator over every CSV/Parquet 15m file in data_dir, named like BTC_USDT.csv"""
+        candles = {}
+        for name in sorted(os.listdir(data_dir)):
+            if not name.endswith(('.csv', '.parquet')):
+                continue
+            base, _, quote = os.path.splitext(name)[0].rpartition('_')
+            rows = backtest.candle_rows(backtest.load_candle_file(os.path.join(data_dir, name)))
+            candles[f"{base}/{quote}:{quote}"] = rows
+        return cls(candles, **kwargs)
+
+    @property
+    def start_time(self):
+        """Open time of the latest first candle across symbols, epoch seconds"""
+        return max(bars[0, 0] for bars in self._bars.values()) / 1000
+
+    # ---- price path ----
+
+    def _bar_index(self, symbol, t):
+        bars = self._bars[symbol]
+        i = np.searchsorted(bars[:, 0], t, side='right') - 1
+        return min(max(i, 0), len(bars) - 1)
+
+    def _path(self, symbol, i):
+        """Times and prices of the path through candle i"""
+        timestamp, o, h, l, c = self._bars[symbol][i, :5]
+        first, second = (l, h) if c >= o else (h, l)
+        return timestamp + SIM_PERIOD_MS * np.array([0, 1 / 3, 2 / 3, 1]), np.array([o, first, second, c])
+
+    def _price_at(self, symbol, t):
+        times, prices = self._path(symbol, self._bar_index(symbol, t))
+        return float(np.interp(t, times, prices))
+
+    def _price_range(self, symbol, t0, t1):
+        """Lowest and highest price the path touches between t0 and t1"""
+        i0, i1 = self._bar_index(symbol, t0), self._bar_index(symbol, t1)
+        ends = (self._price_at(symbol, t0), self._price_at(symbol, t1))
+        low, high = min(ends), max(ends)
+        for i in {i0, i1}:
+            times, prices = self._path(symbol, i)
+            inside = prices[(times > t0) & (times < t1)]
+            if len(inside):
+                low, high = min(low, inside.min()), max(high, inside.max())
+        if i1 - i0 > 1:
+            bars = self._bars[symbol][i0 + 1:i1]
+            low, high = min(low, bars[:, 3].min()), max(high, bars[:, 2].max())
+        return low, high
+
+    def _candles(self, symbol, t, period_ms, limit=None, since=None):
+        """Candles of period_ms built from the 15m bars up to t, the last one forming"""
+        bars = self._bars[symbol]
+        i = self._bar_index(symbol, t)
+        if t < bars[0, 0]:
+            return np.empty((0, 6))
+        per_candle = max(1, period_ms // SIM_PERIOD_MS)
+        start = 0 if since is not None or limit is None else max(0, i + 1 - (limit + 1) * per_candle)
+        if since is not None:
+            start = np.searchsorted(bars[:, 0], since - period_ms, side='left')
+        rows = bars[start:i + 1].copy()
+
+        # Cut the last 15m bar at t
+        times, prices = self._path(symbol, i)
+        elapsed = min(1.0, (t - times[0]) / SIM_PERIOD_MS)
+        seen = prices[times <= t]
+        close = self._price_at(symbol, t)
+        rows[-1, 2] = max(seen.max(), close)
+        rows[-1, 3] = min(seen.min(), close)
+        rows[-1, 4] = close
+        rows[-1, 5] *= elapsed
+
+        if per_candle > 1:
+            rows = bot.aggregate_candles(rows, period_ms)
+        if since is not None:
+            # Like the exchange, page forward from since
+            rows = rows[rows[:, 0] >= since]
+            return rows[:limit] if limit else rows
+        return rows[-limit:] if limit else rows
+
+    # ---- matching ----
+
+    def _now_ms(self):
+        return bot.clock.time() * 1000
+
+    def _match(self):
+        """Fill resting orders and SL/TP crossed by the price path since the last call"""
+        now = self._now_ms()
+        if self._matched_until is None or now <= self._matched_until:
+            self._matched_until = now if self._matched_until is None else max(self._matched_until, now)
+            return
+        since, self._matched_until = self._matched_until, now
+        for symbol in {order['symbol'] for order in self.orders} | set(self.positions):
+            low, high = self._price_range(symbol, since, now)
+            position = self.positions.get(symbol)
+            if position:
+                long = position['side'] == 'Buy'
+                stop, take = position['stopLoss'], position['takeProfit']
+                # When both are crossed in one step assume the stop was hit first
+                if stop and (low <= stop if long else high >= stop):
+                    self._fill(symbol, 'Sell' if long else 'Buy', position['size'], stop, 'StopLoss', True)
+                elif take and (high >= take if long else low <= take):
+                    self._fill(symbol, 'Sell' if long else 'Buy', position['size'], take, 'TakeProfit', True)
+            for order in [o for o in self.orders if o['symbol'] == symbol]:
+                if (low <= order['price']) if order['side'] == 'Buy' else (high >= order['price']):
+                    self.orders.remove(order)
+                    self._fill(symbol, order['side'], order['qty'], order['price'], 'Limit', order['reduceOnly'])
+
+    def _fill(self, symbol, side, qty, price, kind, reduce_only=False):
+        position = self.positions.get(symbol)
+        signed = 0.0 if position is None else (position['size'] if position['side'] == 'Buy' else -position['size'])
+        delta = qty if side == 'Buy' else -qty
+        if reduce_only:
+            if signed == 0 or np.sign(delta) == np.sign(signed):
+                return 0.0
+            delta = np.sign(delta) * min(abs(delta), abs(signed))
+
+        closing = min(abs(delta), abs(signed)) if signed and np.sign(delta) != np.sign(signed) else 0.0
+        if closing:
+            self.realized_pnl += (price - position['avgPrice']) * closing * np.sign(signed)
+        new_size = signed + delta
+        if abs(new_size) < 1e-12:
+            self.positions.pop(symbol, None)
+        elif position is None or np.sign(new_size) != np.sign(signed):
+            self.positions[symbol] = {'side': 'Buy' if new_size > 0 else 'Sell', 'size': abs(new_size),
+                                      'avgPrice': price, 'stopLoss': None, 'takeProfit': None}
+        else:
+            if abs(new_size) > abs(signed):
+                position['avgPrice'] = (position['avgPrice'] * abs(signed) + price * abs(delta)) / abs(new_size)
+            position['size'] = abs(new_size)
+
+        fee = abs(delta) * price * self.fee_rate
+        self.fees += fee
+        self.fills.append({'time': self._now_ms(), 'symbol': symbol, 'side': side, 'qty': abs(delta),
+                           'price': price, 'kind': kind, 'fee': fee})
+        return abs(delta)
+
+    # ---- request faults ----
+
+    def _request(self, api):
+        """Apply latency, rate limit and random errors for one call to api ('scan' or 'bybit')"""
+        if self.latency:
+            bot.clock.sleep(self.latency * (0.5 + self._rng.random()))
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit:
+                now = bot.clock.monotonic()
+                tokens, last = self._tokens.get(api, (self.rate_limit, now))
+                tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+                if tokens < 1:
+                    self._tokens[api] = (tokens, now)
+                    if api == 'scan':
+                        raise ccxt.RateLimitExceeded("simulator: too many requests")
+                    raise InvalidRequestError(request=api, message="Too many visits", status_code=10006,
+                                              time=int(now * 1000), resp_headers={})
+                self._tokens[api] = (tokens - 1, now)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                if api == 'scan':
+                    raise ccxt.NetworkError("simulator: injected network error")
+                raise FailedRequestError(request=api, message="simulator: injected network error",
+                                         status_code=503, time=int(bot.clock.time() * 1000), resp_headers=None)
+            self._match()
+
+    # ---- scan exchange (ccxt) API ----
+
+    def load_markets(self, reload=False, params=None):
+        if not self.markets:
+            self.markets = {symbol: {'symbol': symbol, 'id': bybit_symbol}
+                            for symbol, bybit_symbol in self.symbol_mapping.items()}
+        return self.markets
+
+    def fetch_ohlcv(self, symbol, timeframe='15m', since=None, limit=None, params=None):
+        self._request('scan')
+        bybit_symbol = self.symbol_mapping.get(symbol)
+        if bybit_symbol is None:
+            raise ccxt.BadSymbol(f"simulator does not list {symbol}")
+        period_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        rows = self._candles(bybit_symbol, self._now_ms(), period_ms, limit, since)
+        return [[int(row[0])] + row[1:].tolist() for row in rows]
+
+    # ---- Bybit session API ----
+
+    def _instrument(self, symbol):
+        price = self._bars[symbol][0, 4]
+        magnitude = int(np.floor(np.log10(price)))
+        tick = Decimal(1).scaleb(magnitude - 4)
+        step = Decimal(1).scaleb(-magnitude - 1)
+        return {
+            'symbol': symbol, 'status': 'Trading', 'contractType': 'LinearPerpetual',
+            'quoteCoin': 'USDT', 'settleCoin': 'USDT',
+            'lotSizeFilter': {'minOrderQty': str(step), 'maxOrderQty': '100000000', 'qtyStep': str(step)},
+            'priceFilter': {'tickSize': str(tick), 'minPrice': str(tick), 'maxPrice': '100000000'}
+        }
+
+    def get_instruments_info(self, category="linear", symbol=None, **kwargs):
+        self._request('bybit')
+        rows = [rules for name, rules in self._rules.items() if symbol in (None, name)]
+        return _sim_ok({'category': category, 'list': rows, 'nextPageCursor': ''})
+
+    def get_tickers(self, category="linear", symbol=None, **kwargs):
+        self._request('bybit')
+        now = self._now_ms()
+        rows = []
+        for name in self._bars:
+            if symbol not in (None, name):
+                continue
+            day = self._candles(name, now, SIM_PERIOD_MS, limit=96)
+            if not len(day):
+                continue
+            price = day[-1, 4]
+            half_spread = float(self._rules[name]['priceFilter']['tickSize']) / 2
+            rows.append({
+                'symbol': name,
+                'lastPrice': str(price),
+                'bid1Price': str(price - half_spread),
+                'ask1Price': str(price + half_spread),
+                'prevPrice24h': str(day[0, 1]),
+                'price24hPcnt': str(price / day[0, 1] - 1),
+                'highPrice24h': str(day[:, 2].max()),
+                'lowPrice24h': str(day[:, 3].min()),
+                'volume24h': str(day[:, 5].sum()),
+                'turnover24h': str((day[:, 5] * day[:, 4]).sum())
+            })
+        return _sim_ok({'category': category, 'list': rows})
+
+    def get_kline(self, category="linear", symbol=None, interval="15", limit=200, **kwargs):
+        self._request('bybit')
+        rows = self._candles(symbol, self._now_ms(), int(interval) * 60_000, limit)
+        return _sim_ok({'symbol': symbol, 'category': category, 'list': [
+            [str(int(row[0]))] + [str(value) for value in row[1:]] + [str(row[4] * row[5])] for row in rows[::-1]
+        ]})
+
+    def get_positions(self, category="linear", symbol=None, **kwargs):
+        self._request('bybit')
+        with self._lock:
+            rows = []
+            for name, position in self.positions.items():
+                if symbol not in (None, name):
+                    continue
+                mark = self._price_at(name, self._now_ms())
+                sign = 1 if position['side'] == 'Buy' else -1
+                rows.append({
+                    'symbol': name,
+                    'side': position['side'],
+                    'size': str(position['size']),
+                    'avgPrice': str(position['avgPrice']),
+                    'markPrice': str(mark),
+                    'positionValue': str(position['size'] * position['avgPrice']),
+                    'unrealisedPnl': str((mark - position['avgPrice']) * position['size'] * sign),
+                    'stopLoss': str(position['stopLoss'] or ''),
+                    'takeProfit': str(position['takeProfit'] or '')
+                })
+        return _sim_ok({'category': category, 'list': rows, 'nextPageCursor': ''})
+
+    def place_order(self, category="linear", symbol=None, side=None, orderType="Market", qty=None, price=None,
+                    takeProfit=None, stopLoss=None, reduceOnly=False, timeInForce=None, **kwargs):
+        self._request('bybit')
+        with self._lock:
+            if symbol not in self._bars:
+                return _sim_error(10001, f"symbol {symbol} not listed")
+            qty = float(qty)
+            now_price = self._price_at(symbol, self._now_ms())
+            marketable = orderType == "Market" or (float(price) >= now_price if side == "Buy" else float(price) <= now_price)
+            if reduceOnly and symbol not in self.positions:
+                return _sim_error(110017, "reduce-only order has same side with current position")
+            order_id = str(next(self._order_ids))
+            if marketable:
+                self._fill(symbol, side, qty, now_price, orderType, reduceOnly)
+                position = self.positions.get(symbol)
+                if position and not reduceOnly:
+                    position['takeProfit'] = float(takeProfit) if takeProfit else position['takeProfit']
+                    position['stopLoss'] = float(stopLoss) if stopLoss else position['stopLoss']
+            else:
+                self.orders.append({'orderId': order_id, 'symbol': symbol, 'side': side, 'qty': qty,
+                                    'price': float(price), 'reduceOnly': bool(reduceOnly)})
+        return _sim_ok({'orderId': order_id, 'orderLinkId': ''})
+
+    def get_open_orders(self, category="linear", symbol=None, orderId=None, **kwargs):
+        self._request('bybit')
+        with self._lock:
+            rows = [{'orderId': order['orderId'], 'symbol': order['symbol'], 'side': order['side'],
+                     'orderType': 'Limit', 'price': str(order['price']), 'qty': str(order['qty']),
+                     'leavesQty': str(order['qty']), 'orderStatus': 'New', 'reduceOnly': order['reduceOnly']}
+                    for order in self.orders
+                    if symbol in (None, order['symbol']) and orderId in (None, order['orderId'])]
+        return _sim_ok({'category': category, 'list': rows, 'nextPageCursor': ''})
+
+    def cancel_order(self, category="linear", symbol=None, orderId=None, **kwargs):
+        self._request('bybit')
+        with self._lock:
+            for order in self.orders:
+                if order['orderId'] == orderId and order['symbol'] == symbol:
+                    self.orders.remove(order)
+                    return _sim_ok({'orderId': orderId, 'orderLinkId': ''})
+        return _sim_error(110001, "order not exists or too late to cancel")
+
+    def set_trading_stop(self, category="linear", symbol=None, stopLoss=None, takeProfit=None, **kwargs):
+        self._request('bybit')
+        with self._lock:
+            position = self.positions.get(symbol)
+            if position is None:
+                return _sim_error(10001, "can not set tp/sl/ts for zero position")
+            if stopLoss is not None:
+                position['stopLoss'] = float(stopLoss) or None
+            if takeProfit is not None:
+                position['takeProfit'] = float(takeProfit) or None
+        return _sim_ok({})
+
+    def report(self):
+        """Fills, fees and PnL so far, marking open positions to the current price"""
+        with self._lock:
+            now = self._now_ms()
+            unrealized = sum((self._price_at(symbol, now) - p['avgPrice']) * p['size'] * (1 if p['side'] == 'Buy' else -1)
+                             for symbol, p in self.positions.items())
+            return {
+                'requests': self.requests,
+                'fills': len(self.fills),
+                'open_positions': len(self.positions),
+                'resting_orders': len(self.orders),
+                'realized_pnl': float(self.realized_pnl),
+                'unrealized_pnl': float(unrealized),
+                'fees': float(self.fees),
+                'net_pnl': float(self.realized_pnl + unrealized - self.fees)
+            }
+
+def use_exchanges(trading=None, scanning=None):
+    """Swap the Bybit session and/or the scan exchange, e.g. for an ExchangeSimulator
+
+    The new clients are timed and scheduled like the originals, and every
+    cache filled from the old ones is dropped.
+    """
+    if trading is not None:
+        bot.instrument_client(trading, "bybit", bot.BYBIT_ENDPOINTS)
+        bot.schedule_client(trading, bot.bybit_scheduler, bot.BYBIT_ENDPOINTS)
+        bot.session = trading
+        for name in bot._snapshots:
+            bot.invalidate_snapshot(name)
+    if scanning is not None:
+        bot.instrument_client(scanning, scanning.id, bot.SCAN_ENDPOINTS)
+        bot.bitget_scheduler = bot.RequestScheduler(scanning.id, rate=1000 / scanning.rateLimit,
+                                                    burst=bot.SCAN_BURST)
+        bot.schedule_client(scanning, bot.bitget_scheduler, ['fetch_ohlcv'])
+        bot.exchange = scanning
+        with bot._candle_cache_lock:
+            bot._candle_cache.clear()
+            bot._candle_cache_arrays.clear()
+            bot._candle_history_complete.clear()
+        with bot._indicator_states_lock:
+            bot._indicator_states.clear()
+        bot._nwe_state.clear()
+
+def run_simulation(data_dir, hours=24, speed=100, latency=0.05, error_rate=0.0, rate_limit=None, warmup_bars=2100):
+    """Run the whole bot against an ExchangeSimulator for `hours` of simulated time
+
+    Trades, state and emails stay in memory (emails go to a LocalSMTPServer),
+    so nothing touches the live workspace or accounts.
+    """
+    simulator = ExchangeSimulator.from_directory(data_dir, latency=latency, error_rate=error_rate,
+                                                 rate_limit=rate_limit)
+    bot.set_clock(bot.SimClock(start=simulator.start_time + warmup_bars * SIM_PERIOD_MS / 1000, speed=speed))
+    use_exchanges(simulator, simulator)
+    bot.symbol_mapping.update(simulator.symbol_mapping)
+    bot.symbol_mapping_inv.update({v: k for k, v in simulator.symbol_mapping.items()})
+
+    bot.USE_STREAMING = False
+    bot.UNIVERSE_MIN_TURNOVER = 0  # Recorded volumes need not match live liquidity
+    bot._state_store = bot.StateStore(":memory:", migrate=False)
+    mail_server = start_local_smtp_server()
+    bot.SMTP_HOST, bot.SMTP_PORT = mail_server.server_address
+    bot.SMTP_USE_TLS = False
+    bot.sender, bot.recipients, bot.password = "bot@simulator", ["trader@simulator"], None
+
+    print(f"Simulating {len(simulator.symbol_mapping)} symbols for {hours}h at {speed}x "
+          f"from {pd.Timestamp(bot.clock.time(), unit='s')} UTC")
+    start = time.time()
+    threading.Thread(target=bot.run_bot, args=(list(simulator.symbol_mapping),), kwargs={'persist': False},
+                     name="simulated-bot", daemon=True).start()
+    bot.clock.sleep(hours * 3600)
+
+    bot.flush_emails()
+    report = simulator.report()
+    report.update(hours=hours, speed=speed, wall_seconds=time.time() - start, emails=len(mail_server.messages))
+    print(f"\nSimulation done in {report['wall_seconds']:.0f}s: {report['fills']} fills, "
+          f"{report['requests']} requests, net PnL {report['net_pnl']:.2f} USDT")
+    bot.print_timing_report()
+    return report
+
+# ======================== Local SMTP Server ========================
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal in-process SMTP server that records messages and connections
+
+    Used by simulations and tests. Start it with start_local_smtp_server()
+    and point SMTP_HOST/SMTP_PORT at it with EMAIL_USE_TLS=0.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _LocalSMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.closed = 0
+
+class _LocalSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        try:
+            self._serve()
+        finally:
+            self.server.closed += 1
+
+    def _serve(self):
+        self.reply("220 local SMTP ready")
+        envelope = {'from': None, 'to': []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 local")
+            elif verb == "MAIL":
+                envelope = {'from': command.split(":", 1)[1].strip(), 'to': []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope['to'].append(command.split(":", 1)[1].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    data.append(data_line)
+                self.server.messages.append(dict(envelope, data=b"".join(data).decode(errors='replace')))
+                self.reply("250 OK")
+            elif verb in ("NOOP", "RSET"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+def start_local_smtp_server(host="127.0.0.1", port=0):
+    """Run a LocalSMTPServer on a background thread and return it"""
+    server = LocalSMTPServer((host, port))
+    threading.Thread(target=server.serve_forever, name="local-smtp", daemon=True).start()
+    return server
+
+# ======================== Main Execution ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bot offline against simulated candles")
+    parser.add_argument('data_dir', metavar='DIR', help="CSV/Parquet 15m candle files, named like BTC_USDT.csv")
+    parser.add_argument('--hours', type=float, default=24, help="simulated hours")
+    parser.add_argument('--speed', type=float, default=100, help="simulated seconds per real second")
+    args = parser.parse_args()
+    run_simulation(args.data_dir, hours=args.hours, speed=args.speed)
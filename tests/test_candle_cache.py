@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pytest
+
+import backtest
+import newfile
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "ohlcv_15m.csv")
+SYMBOL = "BTC/USDT:USDT"
+
+
+def forming(row):
+    """The row as the exchange serves it while the candle is still open"""
+    return [row[0], row[1], row[1], row[1], row[1], 0.0]
+
+
+class FakeExchange:
+    """Serves the first `now` fixture candles, the last one forming, like ccxt's fetch_ohlcv"""
+
+    def __init__(self, rows, now):
+        self.rows = rows
+        self.now = now
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append({'since': since, 'limit': limit})
+        visible = [list(row) for row in self.rows[:self.now]]
+        visible[-1] = forming(visible[-1])
+        if since is not None:
+            return [row for row in visible if row[0] >= since][:limit]
+        return visible[-limit:]
+
+    def expected(self, limit):
+        """What get_candles should return now"""
+        window = [list(row) for row in self.rows[max(0, self.now - limit):self.now]]
+        window[-1] = forming(window[-1])
+        return window
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return [[int(row[0])] + row[1:].tolist()
+            for row in backtest.candle_rows(backtest.load_candle_file(FIXTURE))]
+
+
+@pytest.fixture
+def fake(rows, monkeypatch):
+    fake_exchange = FakeExchange(rows, now=1000)
+    monkeypatch.setattr(newfile, "exchange", fake_exchange)
+    monkeypatch.setattr(newfile, "_candle_cache", {})
+    monkeypatch.setattr(newfile, "_candle_cache_arrays", {})
+    monkeypatch.setattr(newfile, "_candle_history_complete", set())
+    return fake_exchange
+
+
+def test_overlap_replaces_the_forming_candle(fake):
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+
+    fake.now += 3
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    # The cached forming candle is re-fetched with the three new ones, not the whole window
+    assert fake.calls[-1] == {'since': fake.rows[999][0], 'limit': 300}
+
+    # Same bar again: only the forming candle is re-fetched
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    assert fake.calls[-1]['since'] == fake.rows[1002][0]
+
+
+def test_gap_restarts_the_series(fake):
+    newfile.get_candles(SYMBOL, "15m", 300)
+
+    fake.now += 450  # More new bars than one sync request returns
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    assert fake.calls[-2]['since'] is not None
+    assert fake.calls[-1] == {'since': None, 'limit': 300}
+
+    fake.now += 1
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    assert fake.calls[-1]['since'] is not None
+
+
+def test_larger_limit_grows_the_series(fake, monkeypatch):
+    monkeypatch.setattr(newfile, "CANDLE_CACHE_SIZE", 100)
+    assert newfile.get_candles(SYMBOL, "15m", 50) == fake.expected(50)
+    assert newfile._candle_cache[(SYMBOL, "15m")].maxlen == 100
+
+    assert newfile.get_candles(SYMBOL, "15m", 150) == fake.expected(150)
+    assert fake.calls[-1] == {'since': None, 'limit': 150}
+    assert newfile._candle_cache[(SYMBOL, "15m")].maxlen == 150
+
+    # The grown series keeps syncing incrementally at its new length
+    fake.now += 2
+    assert newfile.get_candles(SYMBOL, "15m", 150) == fake.expected(150)
+    assert fake.calls[-1]['since'] is not None
+    assert newfile.get_candles(SYMBOL, "15m", 50) == fake.expected(50)
+
+
+def test_short_history_is_not_refetched(fake):
+    fake.now = 80
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    assert len(fake.expected(300)) == 80
+
+    fake.now += 1
+    assert newfile.get_candles(SYMBOL, "15m", 300) == fake.expected(300)
+    assert fake.calls[-1]['since'] is not None
+
+
+def test_array_mirror_follows_the_series(fake, monkeypatch):
+    monkeypatch.setattr(newfile, "CANDLE_CACHE_SIZE", 400)
+    for step in (0, 3, 0, 450, 1):
+        fake.now += step
+        window = newfile.get_candles(SYMBOL, "15m", 300, as_array=True)
+        np.testing.assert_array_equal(window, fake.expected(300))
+        assert not window.flags.writeable
+
+    # A series restored without its array gets one on the next sync
+    del newfile._candle_cache_arrays[(SYMBOL, "15m")]
+    fake.now += 2
+    np.testing.assert_array_equal(newfile.get_candles(SYMBOL, "15m", 300, as_array=True), fake.expected(300))
+    assert len(newfile._candle_cache_arrays[(SYMBOL, "15m")]) == len(newfile._candle_cache[(SYMBOL, "15m")])
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+import newfile
+import sim
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = sim.start_local_smtp_server()
+    host, port = server.server_address
+    monkeypatch.setattr(newfile, "SMTP_HOST", host)
+    monkeypatch.setattr(newfile, "SMTP_PORT", port)
+    monkeypatch.setattr(newfile, "SMTP_USE_TLS", False)
+    monkeypatch.setattr(newfile, "password", None)
+    monkeypatch.setattr(newfile, "sender", "bot@example.com")
+    monkeypatch.setattr(newfile, "recipients", ["trader@example.com"])
+    monkeypatch.setattr(newfile, "EMAIL_BATCH_WINDOW", 0.05)
+    yield server
+    newfile.flush_emails()
+    newfile._close_smtp()
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_connection_is_kept_between_batches(smtp_server, monkeypatch):
+    monkeypatch.setattr(newfile, "SMTP_IDLE_TIMEOUT", 30)
+    newfile.send_email("first", "body")
+    newfile.flush_emails()
+    time.sleep(0.2)  # well past the batch window, so the next email is a new batch
+    newfile.send_email("second", "body")
+    newfile.flush_emails()
+
+    assert wait_for(lambda: len(smtp_server.messages) == 2)
+    assert smtp_server.connections == 1
+    assert smtp_server.closed == 0
+
+
+def test_idle_connection_is_closed(smtp_server, monkeypatch):
+    monkeypatch.setattr(newfile, "SMTP_IDLE_TIMEOUT", 0.2)
+    newfile.send_email("only", "body")
+    newfile.flush_emails()
+
+    assert wait_for(lambda: smtp_server.closed == smtp_server.connections == 1)
+    assert newfile._smtp_connection is None
+    assert len(smtp_server.messages) == 1
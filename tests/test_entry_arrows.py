@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+import backtest
+import newfile
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "ohlcv_15m.csv")
+
+# (fast, slow, trend) EMA lengths; the live settings first, then faster ones that fire more often
+EMA_LENGTHS = [
+    (newfile.ema_fast_length, newfile.ema_slow_length, newfile.ema_trend_length),
+    (9, 21, 100),
+    (5, 13, 50),
+]
+
+
+@pytest.fixture(scope="module")
+def candles():
+    return backtest.candle_rows(backtest.load_candle_file(FIXTURE))
+
+
+def conditions(candles, fast, slow, trend):
+    close = candles[:, 4]
+    return newfile.entry_conditions(
+        close,
+        backtest.ema(close, fast),
+        backtest.ema(close, slow),
+        backtest.ema(close, trend),
+        backtest.as_of_trend_ema(candles[:, 0], close, trend)
+    )
+
+
+def assert_same_arrows(signal, entry_up, entry_down):
+    expected_up, expected_down = newfile._first_entry_arrows_loop(signal, entry_up, entry_down)
+    first_up, first_down = newfile.first_entry_arrows(signal, entry_up, entry_down)
+    np.testing.assert_array_equal(first_up, expected_up)
+    np.testing.assert_array_equal(first_down, expected_down)
+
+
+@pytest.mark.parametrize("fast, slow, trend", EMA_LENGTHS)
+def test_matches_loop_on_recorded_candles(candles, fast, slow, trend):
+    signal, entry_up, entry_down = conditions(candles, fast, slow, trend)
+    assert (signal != 0).any() and (entry_up | entry_down).any()
+    assert_same_arrows(signal, entry_up, entry_down)
+
+
+@pytest.mark.parametrize("fast, slow, trend", EMA_LENGTHS)
+def test_matches_loop_without_trend_filter(candles, fast, slow, trend):
+    close = candles[:, 4]
+    ema_fast, ema_slow = backtest.ema(close, fast), backtest.ema(close, slow)
+    prev_fast, prev_slow = newfile._shift(ema_fast), newfile._shift(ema_slow)
+    signal = np.zeros(len(close), dtype=np.int8)
+    signal[(ema_fast > ema_slow) & (prev_fast <= prev_slow)] = 1
+    signal[(ema_fast < ema_slow) & (prev_fast >= prev_slow)] = -1
+    assert_same_arrows(signal, (ema_fast > ema_slow) & (close > ema_fast), (ema_fast < ema_slow) & (close < ema_fast))
+
+
+@pytest.mark.parametrize("window", [newfile.limit, 64, 2, 1])
+def test_matches_loop_on_scan_windows(candles, window):
+    signal, entry_up, entry_down = conditions(candles, *EMA_LENGTHS[1])
+    for end in range(window, len(candles) + 1, max(1, window // 2)):
+        assert_same_arrows(signal[end - window:end], entry_up[end - window:end], entry_down[end - window:end])
+
+
+def test_stacked_rows_match_loop_per_row(candles):
+    rows = [conditions(candles, *lengths) for lengths in EMA_LENGTHS]
+    signal, entry_up, entry_down = (np.stack(parts) for parts in zip(*rows))
+    first_up, first_down = newfile.first_entry_arrows(signal, entry_up, entry_down)
+    for k, (row_signal, row_up, row_down) in enumerate(rows):
+        expected_up, expected_down = newfile._first_entry_arrows_loop(row_signal, row_up, row_down)
+        np.testing.assert_array_equal(first_up[k], expected_up)
+        np.testing.assert_array_equal(first_down[k], expected_down)
+
+
+def test_entry_arrows_uses_entry_conditions(candles):
+    close = candles[:, 4]
+    emas = [backtest.ema(close, span) for span in EMA_LENGTHS[0]]
+    trend_1h = backtest.as_of_trend_ema(candles[:, 0], close, EMA_LENGTHS[0][2])
+    first_up, first_down = newfile.entry_arrows(close, *emas, trend_1h)
+    expected_up, expected_down = newfile._first_entry_arrows_loop(*conditions(candles, *EMA_LENGTHS[0]))
+    np.testing.assert_array_equal(first_up, expected_up)
+    np.testing.assert_array_equal(first_down, expected_down)
@@ -0,0 +1,134 @@
+import pytest
+from pybit.exceptions import FailedRequestError
+
+import newfile
+
+
+class RecordingClock(newfile.Clock):
+    """Clock whose sleeps return at once and are recorded"""
+
+    def __init__(self):
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    fake_clock = RecordingClock()
+    emails, alerts = [], []
+    monkeypatch.setattr(newfile, "clock", fake_clock)
+    monkeypatch.setattr(newfile, "USE_STREAMING", False)
+    monkeypatch.setattr(newfile, "send_email", lambda subject, body: emails.append(subject))
+    monkeypatch.setattr(newfile, "play_alert", lambda: alerts.append(True))
+    return fake_clock, emails, alerts
+
+
+def run_monitor(monkeypatch, outcomes):
+    """monitor_trade over monitor_step results, where an exception is raised instead of returned"""
+    outcomes = iter(outcomes)
+
+    def step(*args):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(newfile, "monitor_step", step)
+    newfile.monitor_trade("BTC/USDT:USDT", 100.0, 98.0, 120.0, "Buy")
+
+
+def rejected_key():
+    return FailedRequestError(request="get_positions", message="invalid api key", status_code=401,
+                              time=0, resp_headers=None)
+
+
+def test_persistent_error_backs_off_and_alerts_once(monitor, monkeypatch):
+    fake_clock, emails, alerts = monitor
+    run_monitor(monkeypatch, [rejected_key()] * 12 + [True])
+
+    assert fake_clock.sleeps == [newfile.capped_backoff(k, newfile.MONITOR_ERROR_DELAY_MAX) for k in range(12)]
+    assert fake_clock.sleeps[-1] == newfile.MONITOR_ERROR_DELAY_MAX
+    assert len(emails) == len(alerts) == 1
+
+
+def test_recovery_starts_a_new_error_run(monitor, monkeypatch):
+    fake_clock, emails, alerts = monitor
+    run_monitor(monkeypatch, [rejected_key(), rejected_key(), False, rejected_key(), True])
+
+    first_delay = newfile.capped_backoff(0, newfile.MONITOR_ERROR_DELAY_MAX)
+    assert fake_clock.sleeps[0] == fake_clock.sleeps[-1] == first_delay
+    assert len(emails) == len(alerts) == 2
+
+
+def test_follows_reentry_order_then_the_trade_it_opens(monitor, monkeypatch):
+    fake_clock, emails, alerts = monitor
+    symbol = "BTC/USDT:USDT"
+    positions = {symbol: {'symbol': symbol, 'status': 'pending', 'order_id': '1', 'entry_price': 100.0,
+                          'sl_price': 98.0, 'tp_price': 120.0, 'side': "Buy"}}
+    monkeypatch.setattr(newfile, "open_positions", positions)
+    checks = iter([False, True])
+
+    def check(checked_symbol, trade):
+        filled = next(checks)
+        if filled:
+            positions[symbol] = dict(trade, status='open', order_id=None, entry_price=101.0)
+        return filled
+
+    entries = []
+
+    def step(checked_symbol, entry_price, *args):
+        entries.append(entry_price)
+        del positions[symbol]
+        return True
+
+    monkeypatch.setattr(newfile, "check_reentry_order", check)
+    monkeypatch.setattr(newfile, "monitor_step", step)
+    newfile.monitor_trade(symbol, 100.0, 98.0, 120.0, "Buy")
+
+    assert fake_clock.sleeps.count(newfile.REENTRY_CHECK_SECONDS) == 2
+    assert entries == [101.0]
+
+
+def test_rest_passes_are_spaced_out(monitor, monkeypatch):
+    fake_clock, emails, alerts = monitor
+    run_monitor(monkeypatch, [False, False, True])
+
+    assert fake_clock.sleeps == [newfile.MONITOR_POLL_SECONDS] * 2
+
+
+@pytest.mark.parametrize("exit_reason, trail_stop, expected", [
+    (None, False, False),
+    (None, True, False),
+    ("TP hit", False, True),
+])
+def test_every_pass_is_timed(monitor, monkeypatch, exit_reason, trail_stop, expected):
+    symbol = "BTC/USDT:USDT"
+    monkeypatch.setattr(newfile, "symbol_mapping", {symbol: "BTCUSDT"})
+    monkeypatch.setattr(newfile, "_timings", {})
+    monkeypatch.setattr(newfile, "read_open_position", lambda bybit_symbol: {'size': 1})
+    monkeypatch.setattr(newfile, "read_market_price", lambda bybit_symbol: 110.0)
+    monkeypatch.setattr(newfile, "read_candles", lambda *args: [[0, 1, 1, 1, 1, 0]])
+    monkeypatch.setattr(newfile, "evaluate_exit", lambda *args: (exit_reason, 10.0, trail_stop))
+    monkeypatch.setattr(newfile, "update_stop_loss", lambda *args: True)
+    monkeypatch.setattr(newfile, "close_position", lambda *args: True)
+    monkeypatch.setattr(newfile, "place_reentry_order", lambda *args: None)
+    monkeypatch.setattr(newfile, "clear_active_trade", lambda *args: None)
+    monkeypatch.setattr(newfile, "update_trade_state", lambda: None)
+
+    assert newfile.monitor_step(symbol, 100.0, 98.0, 120.0, "Buy") is expected
+    assert newfile._timings["monitor.tick"]['count'] == 1
+
+
+def test_failed_pass_is_timed(monitor, monkeypatch):
+    monkeypatch.setattr(newfile, "symbol_mapping", {"BTC/USDT:USDT": "BTCUSDT"})
+    monkeypatch.setattr(newfile, "_timings", {})
+
+    def fail(bybit_symbol):
+        raise rejected_key()
+
+    monkeypatch.setattr(newfile, "read_open_position", fail)
+    with pytest.raises(FailedRequestError):
+        newfile.monitor_step("BTC/USDT:USDT", 100.0, 98.0, 120.0, "Buy")
+    assert newfile._timings["monitor.tick"]['count'] == 1
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+import backtest
+import newfile
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "ohlcv_15m.csv")
+
+# The kernel engine truncates and reorders the loop's sums, which moves the
+# result by rounding error only (about 1e-15 of the price)
+RTOL = 1e-12
+
+
+@pytest.fixture(scope="module")
+def close():
+    return backtest.candle_rows(backtest.load_candle_file(FIXTURE))[:, 4]
+
+
+def assert_same_bands(actual, expected, exact=False):
+    for got, want in zip(actual, expected):
+        if exact:
+            np.testing.assert_array_equal(got, want)
+        else:
+            np.testing.assert_allclose(got, want, rtol=RTOL, atol=0)
+
+
+@pytest.mark.parametrize("end", [newfile.limit, 1250, None])
+def test_repaint_matches_loop(close, end):
+    window = close[:end][-newfile.limit:]
+    expected = newfile._calculate_nwe_loop(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True)
+    assert_same_bands(newfile.calculate_nwe(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True), expected)
+
+
+@pytest.mark.parametrize("end", [newfile.limit, 1250, None])
+def test_non_repaint_matches_loop(close, end):
+    window = close[:end][-newfile.limit:]
+    expected = newfile._calculate_nwe_loop(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, False)
+    assert not np.isnan(expected[0]).all()
+    assert_same_bands(newfile.calculate_nwe(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, False),
+                      expected, exact=True)
+
+
+def test_short_window_matches_loop(close):
+    window = close[:2 * newfile.nwe_kernel_radius(newfile.H_BANDWIDTH) - 5]
+    expected = newfile._calculate_nwe_loop(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True)
+    assert_same_bands(newfile.calculate_nwe(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True), expected)
+
+
+def test_incremental_matches_loop(close, monkeypatch):
+    monkeypatch.setattr(newfile, "_nwe_state", {})
+    n = newfile.limit
+    checked = 0
+    # Replay the live stream: each new candle first ticks as forming, then closes
+    for end in range(n, len(close) + 1):
+        window = close[end - n:end]
+        ticked = window.copy()
+        ticked[-1] *= 1.001
+        for src in (ticked, window):
+            actual = newfile.calculate_nwe_incremental("test", src, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True)
+            assert_same_bands(actual, newfile.calculate_nwe(src, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True))
+        if (end - n) % 500 == 0:
+            expected = newfile._calculate_nwe_loop(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, True)
+            assert_same_bands(actual, expected)
+            checked += 1
+    assert checked == 4
+
+
+def test_incremental_non_repaint_matches_loop(close, monkeypatch):
+    monkeypatch.setattr(newfile, "_nwe_state", {})
+    window = close[-newfile.limit:]
+    expected = newfile._calculate_nwe_loop(window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, False)
+    actual = newfile.calculate_nwe_incremental("test", window, newfile.H_BANDWIDTH, newfile.MULTIPLIER, False)
+    assert_same_bands(actual, expected, exact=True)
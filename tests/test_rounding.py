@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+
+import newfile
+
+
+def lot_rules(min_qty, max_qty, step):
+    return {"minOrderQty": min_qty, "maxOrderQty": max_qty, "qtyStep": step}
+
+
+@pytest.mark.parametrize("quantity, max_qty, step, expected", [
+    (250, "100.006", "0.01", "100.00"),   # max rounds up past itself, so it is floored
+    (250, "100.005", "0.01", "100.00"),   # half-even rounding lands below max
+    (100.0058, "100.006", "0.01", "100.00"),
+    (1234.5, "1005", "10", "1000"),
+])
+def test_quantity_above_max_stays_within_max_on_step(quantity, max_qty, step, expected):
+    adjusted = newfile.adjust_quantity_to_lot_size(quantity, lot_rules(step, max_qty, step))
+    assert adjusted == Decimal(expected)
+    assert adjusted <= Decimal(max_qty)
+    assert adjusted % Decimal(step) == 0
+
+
+@pytest.mark.parametrize("quantity", [0, 0.0004, 0.004999])
+def test_quantity_below_min_is_raised_to_min(quantity):
+    adjusted = newfile.adjust_quantity_to_lot_size(quantity, lot_rules("0.005", "1000", "0.001"))
+    assert adjusted == Decimal("0.005")
+
+
+@pytest.mark.parametrize("quantity, step, expected", [
+    (0.1 + 0.2, "0.1", "0.3"),
+    (0.7 + 0.1, "0.1", "0.8"),
+    (1.1 * 3, "0.001", "3.3"),
+    (50 / 0.07, "1", "714"),
+])
+def test_binary_float_quantities_round_to_the_step(quantity, step, expected):
+    adjusted = newfile.adjust_quantity_to_lot_size(quantity, lot_rules(step, "100000", step))
+    assert adjusted == Decimal(expected)
+    # The order carries str(quantity), which must not show float noise
+    assert str(adjusted.normalize()) == expected
+
+
+def test_quantity_rounds_half_to_even():
+    rules = lot_rules("0.01", "1000", "0.01")
+    assert newfile.adjust_quantity_to_lot_size(0.125, rules) == Decimal("0.12")
+    assert newfile.adjust_quantity_to_lot_size(0.135, rules) == Decimal("0.14")
+
+
+@pytest.mark.parametrize("price, tick, expected", [
+    (1.23456, "0.0001", "1.2346"),
+    (0.00025, "0.0001", "0.0002"),          # half to even
+    (0.000123456, "0.0000001", "0.0001235"),
+    (0.1 + 0.2, "0.005", "0.300"),
+    (0.0549999999, "0.00005", "0.05500"),
+    (64123.27, "0.1", "64123.3"),
+])
+def test_price_rounds_to_tick(price, tick, expected):
+    adjusted = newfile.adjust_price_to_tick(price, {"tickSize": tick})
+    assert str(adjusted) == expected
+    assert adjusted % Decimal(tick) == 0
+
+
+def test_missing_rule_is_reported():
+    with pytest.raises(Exception, match="Failed to adjust quantity"):
+        newfile.adjust_quantity_to_lot_size(1, {"qtyStep": "0.1"})
+    with pytest.raises(Exception, match="Failed to adjust price"):
+        newfile.adjust_price_to_tick(1, {})
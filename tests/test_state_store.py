@@ -0,0 +1,158 @@
+import json
+import sqlite3
+
+import pytest
+
+import newfile
+
+BTC = "BTC/USDT:USDT"
+ETH = "ETH/USDT:USDT"
+
+
+@pytest.fixture
+def legacy_files(tmp_path, monkeypatch):
+    trade_file = tmp_path / "active_trade.json"
+    state_file = tmp_path / "trade_state.txt"
+    monkeypatch.setattr(newfile, "TRADE_FILE", str(trade_file))
+    monkeypatch.setattr(newfile, "TRADE_STATE_FILE", str(state_file))
+    return trade_file, state_file
+
+
+@pytest.fixture
+def portfolio(monkeypatch):
+    """Empty in-memory portfolio limited to two trades, recording the emails it sends"""
+    emails = []
+    monkeypatch.setattr(newfile, "open_positions", {})
+    monkeypatch.setattr(newfile, "MAX_OPEN_POSITIONS", 2)
+    monkeypatch.setattr(newfile, "MAX_EXPOSURE_USDT", 2 * newfile.TRADE_AMOUNT_USDT)
+    monkeypatch.setattr(newfile, "send_email", lambda subject, body: emails.append(subject))
+    return emails
+
+
+def use_store(monkeypatch, store):
+    monkeypatch.setattr(newfile, "_state_store", store)
+    return store
+
+
+def legacy_trade(symbol, entry_price):
+    return {'symbol': symbol, 'entry_price': entry_price, 'sl_price': entry_price * 0.98,
+            'tp_price': entry_price * 1.2, 'side': "Buy"}
+
+
+def test_migrates_single_trade_files(tmp_path, legacy_files):
+    trade_file, state_file = legacy_files
+    trade = legacy_trade(BTC, 100.0)
+    trade_file.write_text(json.dumps(trade))
+    state_file.write_text("manage\n")
+    path = str(tmp_path / "bot_state.db")
+
+    store = newfile.StateStore(path)
+    assert store.load_trades() == {BTC: trade}
+    assert store.state == "MANAGE"
+    assert not trade_file.exists() and not state_file.exists()
+    assert (tmp_path / "active_trade.json.migrated").exists()
+    assert (tmp_path / "trade_state.txt.migrated").exists()
+    store.close()
+
+    # Only a fresh database imports legacy files
+    trade_file.write_text(json.dumps(legacy_trade(ETH, 2000.0)))
+    reopened = newfile.StateStore(path)
+    assert reopened.load_trades() == {BTC: trade}
+    assert reopened.state == "MANAGE"
+    assert trade_file.exists()
+    reopened.close()
+
+
+def test_migrates_multi_trade_file_without_state(tmp_path, legacy_files):
+    trade_file, state_file = legacy_files
+    trades = {BTC: legacy_trade(BTC, 100.0), ETH: legacy_trade(ETH, 2000.0)}
+    trade_file.write_text(json.dumps(trades))
+
+    store = newfile.StateStore(str(tmp_path / "bot_state.db"))
+    assert store.load_trades() == trades
+    assert store.state == "ENTRY"
+    store.close()
+
+
+def test_unreadable_legacy_file_is_left_in_place(tmp_path, legacy_files):
+    trade_file, _ = legacy_files
+    trade_file.write_text("{not json")
+
+    store = newfile.StateStore(str(tmp_path / "bot_state.db"))
+    assert store.load_trades() == {}
+    assert trade_file.exists()
+    store.close()
+
+
+def test_migrated_trades_round_trip(tmp_path, legacy_files, portfolio, monkeypatch):
+    trade_file, state_file = legacy_files
+    trade_file.write_text(json.dumps(legacy_trade(BTC, 100.0)))
+    state_file.write_text("ENTRY")
+    path = str(tmp_path / "bot_state.db")
+    store = use_store(monkeypatch, newfile.StateStore(path))
+    newfile.open_positions.update(store.load_trades())
+
+    newfile.save_active_trade(ETH, 2000.0, 1960.0, 2400.0, "Sell", 0.025)
+    assert newfile.get_trade_state() == "MANAGE"
+    reopened = newfile.StateStore(path)
+    assert reopened.load_trades() == newfile.open_positions
+    assert reopened.state == "MANAGE"
+    reopened.close()
+
+    newfile.clear_active_trade(BTC)
+    assert list(newfile.open_positions) == [ETH]
+    reopened = newfile.StateStore(path)
+    assert reopened.load_trades() == {ETH: newfile.open_positions[ETH]}
+    assert reopened.state == newfile.get_trade_state() == "ENTRY"
+    reopened.close()
+
+    newfile.clear_active_trade(ETH)
+    # Clearing a trade that is already gone changes nothing
+    newfile.clear_active_trade(ETH)
+    reopened = newfile.StateStore(path)
+    assert reopened.load_trades() == {} and reopened.state == "ENTRY"
+    reopened.close()
+    assert portfolio == ["🔄 Trade State Changed to MANAGE", "🔄 Trade State Changed to ENTRY"]
+    store.close()
+
+
+def test_failed_save_leaves_portfolio_and_state_unchanged(tmp_path, portfolio, monkeypatch):
+    store = use_store(monkeypatch, newfile.StateStore(str(tmp_path / "bot_state.db"), migrate=False))
+    newfile.save_active_trade(BTC, 100.0, 98.0, 120.0, "Buy", 0.5)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "save_trade", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        newfile.save_active_trade(ETH, 2000.0, 1960.0, 2400.0, "Sell", 0.025)
+    assert list(newfile.open_positions) == [BTC]
+    assert newfile.get_trade_state() == "ENTRY"
+    assert portfolio == []
+    store.close()
+
+
+def test_transaction_rolls_back_on_error(tmp_path):
+    store = newfile.StateStore(str(tmp_path / "bot_state.db"), migrate=False)
+    store.save_trade(BTC, legacy_trade(BTC, 100.0), "MANAGE")
+
+    with pytest.raises(RuntimeError):
+        with store._transaction() as db:
+            db.execute("DELETE FROM trades")
+            db.execute("INSERT OR REPLACE INTO settings VALUES ('trade_state', 'ENTRY')")
+            raise RuntimeError("crash between the writes")
+    store.close()
+
+    reopened = newfile.StateStore(str(tmp_path / "bot_state.db"), migrate=False)
+    assert list(reopened.load_trades()) == [BTC]
+    assert reopened.state == "MANAGE"
+    reopened.close()
+
+
+def test_open_time_comes_from_the_bot_clock(tmp_path, portfolio, monkeypatch):
+    store = use_store(monkeypatch, newfile.StateStore(str(tmp_path / "bot_state.db"), migrate=False))
+    monkeypatch.setattr(newfile, "clock", newfile.SimClock(start=1_600_000_000, speed=1))  # September 2020
+    newfile.save_active_trade(BTC, 100.0, 98.0, 120.0, "Buy", 0.5)
+
+    assert store.load_trades()[BTC]['opened_at'].startswith("2020-09-")
+    store.close()